@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """A request was refused admission; the client should retry after ``retry_after`` seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status(self):
+        # A client over its own rate gets 429; everyone else is told the service is busy
+        return 429 if self.reason == 'rate' else 503
+
+
+class AdmissionController:
+    """Per-client token buckets plus a bounded number of concurrent expensive requests
+
+    Each client may start ``rate`` expensive requests per second on average,
+    with bursts of ``burst``. At most ``max_concurrent`` run at once; up to
+    ``max_waiting`` more wait ``wait_timeout`` seconds for a slot and the rest
+    are refused at once, so past saturation requests are shed in
+    microseconds instead of piling up on the worker threads. Batches stream
+    for as long as their upload lasts, so they hold one of ``max_batches``
+    slots of their own instead and never take a page's. Limits are per
+    process. ``max_concurrent=0``, ``max_batches=0`` or ``rate=0`` turn the
+    respective limit off.
+    """
+
+    def __init__(self, max_concurrent=2, max_waiting=2, wait_timeout=0.5, rate=0.5, burst=10, max_clients=10000,
+                 retry_after=5, max_batches=1, clock=time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.retry_after = retry_after
+        self._clock = clock
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._batch_slots = threading.BoundedSemaphore(max_batches) if max_batches > 0 else None
+        # client -> (tokens, updated at); least recently seen first. A dropped
+        # bucket has usually refilled, so bounding them forgets little
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.running = 0
+        self.batches_running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_rate = 0
+        self.rejected_busy = 0
+        self.timed_out = 0
+
+    def _take_token(self, client):
+        """Spend one of ``client``'s tokens, or return the seconds until it has one"""
+        now = self._clock()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[client] = (tokens, now)
+            return (1 - tokens) / self.rate
+        self._buckets[client] = (tokens - 1, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return 0
+
+    def _charge(self, client):
+        """Spend a token of ``client``, under the lock; raises Overloaded when it has none"""
+        if self.rate > 0:
+            wait = self._take_token(client)
+            if wait:
+                self.rejected_rate += 1
+                raise Overloaded('rate', max(1, round(wait)))
+
+    def _acquire(self, client):
+        with self._lock:
+            self._charge(client)
+            if self._slots is None:
+                self.admitted += 1
+                return
+            if self._slots.acquire(blocking=False):
+                self.admitted += 1
+                self.running += 1
+                return
+            if self.waiting >= self.max_waiting:
+                self.rejected_busy += 1
+                raise Overloaded('busy', self.retry_after)
+            self.waiting += 1
+            self.queued += 1
+        acquired = self._slots.acquire(timeout=self.wait_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.timed_out += 1
+                raise Overloaded('busy', self.retry_after)
+            self.admitted += 1
+            self.running += 1
+
+    @contextmanager
+    def admit(self, client):
+        """Hold a slot for one expensive request of ``client``; raises Overloaded when refused"""
+        self._acquire(client)
+        try:
+            yield
+        finally:
+            if self._slots is not None:
+                with self._lock:
+                    self.running -= 1
+                self._slots.release()
+
+    @contextmanager
+    def admit_batch(self, client):
+        """Hold a batch slot for ``client``, charged one token like a page; raises Overloaded when refused"""
+        with self._lock:
+            self._charge(client)
+            # A batch can stream for minutes, so waiting for a slot would only tie up a thread
+            if self._batch_slots is not None and not self._batch_slots.acquire(blocking=False):
+                self.rejected_busy += 1
+                raise Overloaded('busy', self.retry_after)
+            self.admitted += 1
+            self.batches_running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.batches_running -= 1
+            if self._batch_slots is not None:
+                self._batch_slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self.running,
+                'batches_running': self.batches_running,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected_rate': self.rejected_rate,
+                'rejected_busy': self.rejected_busy,
+                'timed_out': self.timed_out,
+                'clients': len(self._buckets)
+            }
+
+    def metric_samples(self):
+        """Samples for metrics.Registry.add_collector"""
+        stats = self.stats()
+        for event in ('admitted', 'queued', 'rejected_rate', 'rejected_busy', 'timed_out'):
+            yield 'counter', 'thesis_admission_events_total', {'event': event}, stats[event]
+        yield 'gauge', 'thesis_admission_running', None, stats['running']
+        yield 'gauge', 'thesis_admission_batches_running', None, stats['batches_running']
+        yield 'gauge', 'thesis_admission_waiting', None, stats['waiting']
+
@@ -0,0 +1,145 @@
+import hashlib
+from types import MappingProxyType
+
+import msgspec
+from flask import Blueprint, Response, current_app, request
+from werkzeug.local import LocalProxy
+
+from batch import SpecError, spec_from_payload
+from generation_cache import input_fingerprint
+from thesis_spec import ThesisSpec
+
+API_VERSION = 'v1'
+
+bp = Blueprint('api', __name__, url_prefix=f'/api/{API_VERSION}')
+
+generator = LocalProxy(lambda: current_app.extensions['generator'])
+api_cache = LocalProxy(lambda: current_app.extensions['api_cache'])
+
+
+def _enc_hook(value):
+    # Generation cache results are read-only mappings
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise NotImplementedError(f'Object of type {type(value).__name__} is not serializable')
+
+
+class _Format:
+    """Wire format of the API: encoder, decoder and the envelope bytes shared by every response
+
+    Bodies are ``{"api": "v1", "kind": <endpoint>, "data": <result>}``; everything but
+    the result is encoded once per endpoint and concatenated around it.
+    """
+
+    def __init__(self, mimetype, module):
+        self.mimetype = mimetype
+        self.encoder = module.Encoder(enc_hook=_enc_hook)
+        self.decoder = module.Decoder()
+        self.is_json = module is msgspec.json
+        self._envelopes = {}
+
+    def envelope(self, kind):
+        envelope = self._envelopes.get(kind)
+        if envelope is None:
+            if self.is_json:
+                head = self.encoder.encode({'api': API_VERSION, 'kind': kind})[:-1] + b',"data":'
+                envelope = (head, b'}')
+            else:
+                # fixmap of 3 entries followed by the first two pairs and the third key
+                head = b'\x83' + b''.join(self.encoder.encode(part) for part in ('api', API_VERSION, 'kind', kind,
+                                                                                  'data'))
+                envelope = (head, b'')
+            self._envelopes[kind] = envelope
+        return envelope
+
+    def body(self, kind, result):
+        head, tail = self.envelope(kind)
+        return head + self.encoder.encode(result) + tail
+
+
+FORMATS = {
+    'application/json': _Format('application/json', msgspec.json),
+    'application/msgpack': _Format('application/msgpack', msgspec.msgpack),
+}
+
+
+def _error(status, message, fmt=None):
+    fmt = fmt or FORMATS['application/json']
+    return Response(fmt.encoder.encode({'error': message}), status=status, mimetype=fmt.mimetype)
+
+
+def _read_spec():
+    """Decode the request body (JSON or MessagePack) into the payload and its ThesisSpec"""
+    fmt = FORMATS.get(request.mimetype, FORMATS['application/json'])
+    try:
+        payload = fmt.decoder.decode(request.get_data(cache=False))
+    except msgspec.DecodeError as exc:
+        raise SpecError(f'Cuerpo inválido: {exc}') from None
+    if not isinstance(payload, dict):
+        raise SpecError('El cuerpo debe ser un objeto')
+    return payload, ThesisSpec.from_data(spec_from_payload(payload))
+
+
+def _respond(kind, method_name, spec, call, *args):
+    """Negotiate the format, answer If-None-Match, and serve the encoded result from the API cache"""
+    # No Accept header means anything goes
+    mimetype = request.accept_mimetypes.best_match(FORMATS) if request.accept_mimetypes else 'application/json'
+    if mimetype is None:
+        return _error(406, 'Formatos disponibles: ' + ', '.join(FORMATS))
+    fmt = FORMATS[mimetype]
+
+    # The ETag only depends on what the generator reads, so a match skips generation entirely
+    raw = ':'.join((API_VERSION, mimetype, generator.knowledge.version, input_fingerprint(method_name, spec),
+                    *map(str, args)))
+    etag = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = api_cache.get_or_create(etag, lambda: fmt.body(kind, call(spec, *args)))
+        response = Response(body, mimetype=fmt.mimetype)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Accept')
+    return response
+
+
+@bp.errorhandler(SpecError)
+def _invalid_spec(exc):
+    return _error(400, str(exc))
+
+
+@bp.route('/consistency-matrix', methods=['POST'])
+def consistency_matrix():
+    """Consistency matrix for the wizard fields, or normalized from ``matriz_existente``"""
+    _, spec = _read_spec()
+    if spec.existing:
+        return _respond('consistency-matrix', 'generate_consistency_matrix_from_existing', spec,
+                        generator.generate_consistency_matrix_from_existing)
+    return _respond('consistency-matrix', 'generate_consistency_matrix', spec, generator.generate_consistency_matrix)
+
+
+@bp.route('/titles', methods=['POST'])
+def titles():
+    """The ``k`` best thesis titles (``?k=`` or ``"k"`` in the body, 5 by default)"""
+    payload, spec = _read_spec()
+    k = request.args.get('k', type=int)
+    if k is None:
+        k = payload.get('k', 5)
+    if type(k) is not int or not 1 <= k <= current_app.config['API_MAX_TITLES']:
+        raise SpecError(f'k debe ser un entero entre 1 y {current_app.config["API_MAX_TITLES"]}')
+    if spec.existing:
+        return _respond('titles', 'generate_thesis_titles_from_existing', spec,
+                        generator.generate_thesis_titles_from_existing, k)
+    return _respond('titles', 'generate_thesis_titles', spec, generator.generate_thesis_titles, k)
+
+
+@bp.route('/operationalization', methods=['POST'])
+def operationalization():
+    """Operationalization matrix for the wizard fields or ``matriz_existente``"""
+    _, spec = _read_spec()
+    if spec.existing:
+        return _respond('operationalization', 'generate_operationalization_matrix_from_existing', spec,
+                        generator.generate_operationalization_matrix_from_existing)
+    return _respond('operationalization', 'generate_operationalization_matrix', spec,
+                    generator.generate_operationalization_matrix)
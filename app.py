@@ -1,22 +1,205 @@
 import os
 import logging
 from flask import Flask
-from flask_session import Session
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
+from admission import AdmissionController
+from generation_cache import CachedThesisGenerator, GenerationCache
+from knowledge_base import DEFAULT_INDEX_PATH, DEFAULT_SOURCE_DIR, KnowledgeBase
+# Every finished wizard saves its project, so the store (and SQLAlchemy) is loaded up front
+from projects import init_projects, similarity_source
+from render_cache import PageCache, preload_templates, templates_version
+from session_backends import init_session
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "thesis_assistant_secret_key_2024")
+def configure_logging():
+    """Log at LOG_LEVEL (INFO by default); DEBUG formats a record for every library call"""
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+                        format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
 
-# Configure session
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_PERMANENT'] = False
-Session(app)
 
-# Import routes
-from routes import *
+def create_app(config=None):
+    """Build the application; ``config`` overrides the environment-driven settings"""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "thesis_assistant_secret_key_2024")
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Proxies in front of the app whose X-Forwarded-For/-Proto are trusted (Replit serves through one; 0 if exposed directly)
+    app.config['PROXY_FIX_HOPS'] = int(os.environ.get("PROXY_FIX_HOPS", 1))
+
+    # Persist compiled templates so cold workers skip Jinja compilation (precompile.py fills it at build time)
+    app.config['JINJA_BYTECODE_CACHE_DIR'] = os.environ.get("JINJA_BYTECODE_CACHE_DIR", os.path.join(app.root_path, 'instance', 'jinja_cache'))
+    # Load every template at startup instead of on the first request that renders it
+    app.config['PRELOAD_TEMPLATES'] = os.environ.get("PRELOAD_TEMPLATES", "1") == "1"
+
+    # Configure static asset bundles (built by build_assets.py)
+    app.config['ASSET_DIST_DIR'] = os.environ.get("ASSET_DIST_DIR", os.path.join(app.static_folder, 'dist'))
+
+    # Configure session
+    app.config['SESSION_BACKEND'] = os.environ.get("SESSION_BACKEND", "filesystem")
+    app.config['SESSION_TYPE'] = 'filesystem'
+    app.config['SESSION_PERMANENT'] = False
+    app.config['SESSION_IDLE_TIMEOUT'] = int(os.environ.get("SESSION_IDLE_TIMEOUT", 6 * 3600))
+    app.config['SESSION_SQLITE_PATH'] = os.environ.get("SESSION_SQLITE_PATH", os.path.join(app.root_path, 'instance', 'sessions.sqlite3'))
+    app.config['SESSION_REDIS_URL'] = os.environ.get("SESSION_REDIS_URL", "redis://127.0.0.1:6379/0")
+    app.config['SESSION_CLIENT_STATE'] = os.environ.get("SESSION_CLIENT_STATE", "0") == "1"
+    app.config['SESSION_CLIENT_STATE_MAX_BYTES'] = int(os.environ.get("SESSION_CLIENT_STATE_MAX_BYTES", 3800))
+    # Stateless endpoints never load or store a session
+    app.config['SESSION_EXEMPT_PREFIXES'] = ('/api/', '/exportaciones')
+
+    # Configure knowledge base (sources compiled into a shared, hot-reloaded index)
+    app.config['KNOWLEDGE_DIR'] = os.environ.get("KNOWLEDGE_DIR", DEFAULT_SOURCE_DIR)
+    app.config['KNOWLEDGE_INDEX_PATH'] = os.environ.get("KNOWLEDGE_INDEX_PATH", DEFAULT_INDEX_PATH)
+    app.config['KNOWLEDGE_CHECK_INTERVAL'] = float(os.environ.get("KNOWLEDGE_CHECK_INTERVAL", 2.0))
+
+    # Configure generation cache
+    app.config['GENERATION_CACHE_SIZE'] = int(os.environ.get("GENERATION_CACHE_SIZE", 2048))
+    app.config['GENERATION_CACHE_TTL'] = int(os.environ.get("GENERATION_CACHE_TTL", 3600))
+
+    # Configure background pre-generation as the wizard advances (0 workers disables it)
+    app.config['PREGENERATION_WORKERS'] = int(os.environ.get("PREGENERATION_WORKERS", 2))
+    app.config['PREGENERATION_MAX_PENDING'] = int(os.environ.get("PREGENERATION_MAX_PENDING", 256))
+
+    # Configure admission control for the pages that generate (limits are per worker process; 0 disables one).
+    # Concurrent plus waiting requests stay below GUNICORN_THREADS, so some threads are always free to shed
+    app.config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get("ADMISSION_MAX_CONCURRENT", 2))
+    app.config['ADMISSION_MAX_WAITING'] = int(os.environ.get("ADMISSION_MAX_WAITING", 2))
+    app.config['ADMISSION_WAIT_TIMEOUT'] = float(os.environ.get("ADMISSION_WAIT_TIMEOUT", 0.5))
+    app.config['ADMISSION_RATE'] = float(os.environ.get("ADMISSION_RATE", 0.5))
+    app.config['ADMISSION_BURST'] = int(os.environ.get("ADMISSION_BURST", 10))
+    app.config['ADMISSION_MAX_CLIENTS'] = int(os.environ.get("ADMISSION_MAX_CLIENTS", 10000))
+    app.config['ADMISSION_RETRY_AFTER'] = int(os.environ.get("ADMISSION_RETRY_AFTER", 5))
+    # Streamed /batch uploads run in slots of their own, so slow ones never hold up the pages
+    app.config['ADMISSION_MAX_BATCHES'] = int(os.environ.get("ADMISSION_MAX_BATCHES", 1))
+
+    # Configure rendered page cache
+    app.config['PAGE_CACHE_SIZE'] = int(os.environ.get("PAGE_CACHE_SIZE", 512))
+    app.config['PAGE_CACHE_TTL'] = int(os.environ.get("PAGE_CACHE_TTL", 3600))
+
+    # Configure JSON API (encoded responses cached by ETag)
+    app.config['API_CACHE_SIZE'] = int(os.environ.get("API_CACHE_SIZE", 2048))
+    app.config['API_CACHE_TTL'] = int(os.environ.get("API_CACHE_TTL", 3600))
+    app.config['API_MAX_TITLES'] = int(os.environ.get("API_MAX_TITLES", 100))
+
+    # Configure batch generation
+    app.config['BATCH_WORKERS'] = int(os.environ.get("BATCH_WORKERS", 4))
+    app.config['BATCH_MAX_WORKERS'] = int(os.environ.get("BATCH_MAX_WORKERS", 16))
+    app.config['BATCH_MAX_LINE_BYTES'] = int(os.environ.get("BATCH_MAX_LINE_BYTES", 64 * 1024))
+
+    # Configure export cache (created by the first download)
+    app.config['EXPORT_CACHE_DIR'] = os.environ.get("EXPORT_CACHE_DIR", os.path.join(app.root_path, 'export_cache'))
+    app.config['EXPORT_CACHE_MAX_FILES'] = int(os.environ.get("EXPORT_CACHE_MAX_FILES", 512))
+
+    # Configure background jobs (cohort exports): a SQLite queue every worker process takes jobs from
+    app.config['JOBS_DB_PATH'] = os.environ.get("JOBS_DB_PATH", os.path.join(app.root_path, 'instance', 'jobs.sqlite3'))
+    app.config['JOBS_DIR'] = os.environ.get("JOBS_DIR", os.path.join(app.root_path, 'instance', 'jobs'))
+    app.config['JOBS_WORKERS'] = int(os.environ.get("JOBS_WORKERS", 1))
+    app.config['JOBS_LEASE'] = float(os.environ.get("JOBS_LEASE", 60))
+    app.config['JOBS_POLL_INTERVAL'] = float(os.environ.get("JOBS_POLL_INTERVAL", 2))
+    app.config['JOBS_MAX_ATTEMPTS'] = int(os.environ.get("JOBS_MAX_ATTEMPTS", 3))
+    app.config['JOBS_KEEP'] = int(os.environ.get("JOBS_KEEP", 24 * 3600))
+    app.config['COHORT_EXPORT_TOKEN'] = os.environ.get("COHORT_EXPORT_TOKEN")
+
+    # Configure project store (PostgreSQL through DATABASE_URL in production, SQLite locally)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL", "sqlite:///" + os.path.join(app.root_path, 'instance', 'projects.sqlite3'))
+    app.config['DB_POOL_SIZE'] = int(os.environ.get("DB_POOL_SIZE", 8))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get("DB_MAX_OVERFLOW", 4))
+    app.config['DB_POOL_TIMEOUT'] = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    app.config['PROJECT_PAGE_SIZE'] = int(os.environ.get("PROJECT_PAGE_SIZE", 20))
+    app.config['PROJECT_BULK_SIZE'] = int(os.environ.get("PROJECT_BULK_SIZE", 500))
+
+    # Configure the similarity index over saved titles and problem statements (0 results disables it)
+    app.config['SIMILARITY_INDEX_PATH'] = os.environ.get("SIMILARITY_INDEX_PATH", os.path.join(app.root_path, 'instance', 'similarity.tsi'))
+    app.config['SIMILARITY_REFRESH_INTERVAL'] = float(os.environ.get("SIMILARITY_REFRESH_INTERVAL", 30))
+    app.config['SIMILARITY_COMPACT_AFTER'] = int(os.environ.get("SIMILARITY_COMPACT_AFTER", 5000))
+    app.config['SIMILARITY_RESULTS'] = int(os.environ.get("SIMILARITY_RESULTS", 5))
+    app.config['SIMILARITY_MIN_SCORE'] = float(os.environ.get("SIMILARITY_MIN_SCORE", 0.5))
+
+    # Configure metrics (each gunicorn worker snapshots into METRICS_DIR)
+    app.config['METRICS_DIR'] = os.environ.get("METRICS_DIR", os.path.join(app.root_path, 'instance', 'metrics'))
+    app.config['METRICS_TOKEN'] = os.environ.get("METRICS_TOKEN")
+
+    # Configure opt-in request profiling (off unless PROFILE_SECRET is set; admin pages at /admin/perfiles)
+    app.config['PROFILE_SECRET'] = os.environ.get("PROFILE_SECRET")
+    app.config['PROFILE_DIR'] = os.environ.get("PROFILE_DIR", os.path.join(app.root_path, 'instance', 'profiles'))
+    app.config['PROFILE_MAX_ENTRIES'] = int(os.environ.get("PROFILE_MAX_ENTRIES", 50))
+    app.config['PROFILE_PATHS'] = tuple(os.environ.get("PROFILE_PATHS", "/results,/matriz_operacionalizacion").split(','))
+    app.config['PROFILE_SAMPLE_INTERVAL'] = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.001))
+
+    if config:
+        app.config.update(config)
+
+    if app.config['PROXY_FIX_HOPS'] > 0:
+        hops = app.config['PROXY_FIX_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+    os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
+    init_session(app)
+    init_projects(app)
+    # Subsystems below are imported where they are enabled, so workers only load what the configuration uses
+    if app.config['SIMILARITY_RESULTS'] > 0:
+        from similarity_index import SimilarityIndex
+        app.extensions['similarity'] = SimilarityIndex(app.config['SIMILARITY_INDEX_PATH'], source=similarity_source(app),
+                                                       refresh_interval=app.config['SIMILARITY_REFRESH_INTERVAL'],
+                                                       compact_after=app.config['SIMILARITY_COMPACT_AFTER'])
+
+    knowledge = KnowledgeBase(app.config['KNOWLEDGE_DIR'], app.config['KNOWLEDGE_INDEX_PATH'],
+                              check_interval=app.config['KNOWLEDGE_CHECK_INTERVAL'])
+    app.extensions['knowledge'] = knowledge
+
+    # Shared across requests so refreshes and repeated topics reuse generated content
+    generator = CachedThesisGenerator(GenerationCache(maxsize=app.config['GENERATION_CACHE_SIZE'],
+                                                      ttl=app.config['GENERATION_CACHE_TTL']),
+                                      knowledge=knowledge)
+    app.extensions['generator'] = generator
+    if app.config['PREGENERATION_WORKERS'] > 0:
+        from pregeneration import Pregenerator
+        app.extensions['pregenerator'] = Pregenerator(generator, workers=app.config['PREGENERATION_WORKERS'],
+                                                      max_pending=app.config['PREGENERATION_MAX_PENDING'])
+    from assets import init_assets
+    assets = init_assets(app)
+    # The results page also lists similar projects, so a page cached before new ones were indexed is stale
+    similarity = app.extensions.get('similarity')
+    app.extensions['page_cache'] = PageCache(
+        GenerationCache(maxsize=app.config['PAGE_CACHE_SIZE'], ttl=app.config['PAGE_CACHE_TTL']),
+        version=templates_version(app, assets.version), content_version=lambda: knowledge.version,
+        page_versions={'results.html': similarity.version} if similarity is not None else None)
+    from metrics import init_metrics
+    registry = init_metrics(app, generator)
+    admission = AdmissionController(max_concurrent=app.config['ADMISSION_MAX_CONCURRENT'],
+                                    max_waiting=app.config['ADMISSION_MAX_WAITING'],
+                                    wait_timeout=app.config['ADMISSION_WAIT_TIMEOUT'],
+                                    rate=app.config['ADMISSION_RATE'], burst=app.config['ADMISSION_BURST'],
+                                    max_clients=app.config['ADMISSION_MAX_CLIENTS'],
+                                    retry_after=app.config['ADMISSION_RETRY_AFTER'],
+                                    max_batches=app.config['ADMISSION_MAX_BATCHES'])
+    app.extensions['admission'] = admission
+    registry.add_collector(admission.metric_samples)
+    if app.config['PROFILE_SECRET']:
+        from profiling import init_profiling
+        init_profiling(app, generator)
+    # Cohort exports stay closed without COHORT_EXPORT_TOKEN, so the job queue only runs when it is set
+    if app.config['COHORT_EXPORT_TOKEN']:
+        from jobs import JobQueue, cohort_export
+        jobs = JobQueue(app.config['JOBS_DB_PATH'], app.config['JOBS_DIR'],
+                        {'cohort_export': cohort_export(app, generator)}, workers=app.config['JOBS_WORKERS'],
+                        lease=app.config['JOBS_LEASE'], poll_interval=app.config['JOBS_POLL_INTERVAL'],
+                        max_attempts=app.config['JOBS_MAX_ATTEMPTS'], keep=app.config['JOBS_KEEP'])
+        app.extensions['jobs'] = jobs
+        registry.add_collector(jobs.metric_samples)
+        # Worker threads start with the first request of each process, and pick up jobs left by a restart
+        app.before_request(jobs.start)
+    app.extensions['api_cache'] = GenerationCache(maxsize=app.config['API_CACHE_SIZE'],
+                                                  ttl=app.config['API_CACHE_TTL'])
+
+    # Import routes
+    from routes import bp
+    from api import bp as api_bp
+    app.register_blueprint(bp)
+    app.register_blueprint(api_bp)
+
+    if app.config['PRELOAD_TEMPLATES']:
+        preload_templates(app)
+
+    return app
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import abort, request, send_from_directory, url_for
+
+# Bundle name -> sources under static/, concatenated in this order
+ASSET_BUNDLES = {
+    'app.css': ('vendor/bootstrap-agent-dark-theme.min.css', 'css/custom.css'),
+    'app.js': ('vendor/feather.min.js', 'vendor/bootstrap.bundle.min.js', 'js/app.js'),
+}
+
+# Where build_assets.py --fetch vendors third-party files from
+VENDOR_SOURCES = {
+    'vendor/bootstrap-agent-dark-theme.min.css': 'https://cdn.replit.com/agent/bootstrap-agent-dark-theme.min.css',
+    'vendor/feather.min.js': 'https://unpkg.com/feather-icons@4.29.2/dist/feather.min.js',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+# Preferred first; each is served only if build_assets.py produced the file
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class AssetManifest:
+    """Maps bundle names to the fingerprinted files written by build_assets.py
+
+    Without a build (fresh checkout, development) ``urls`` falls back to the
+    individual source files, using the CDN for vendor files not yet fetched.
+    """
+
+    def __init__(self, static_folder, dist_dir):
+        self.static_folder = static_folder
+        self.dist_dir = dist_dir
+        self.files = {}
+        path = os.path.join(dist_dir, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as handle:
+                self.files = json.load(handle)
+        self.served = frozenset(self.files.values())
+
+    @property
+    def version(self):
+        """Changes whenever a rebuild changes any bundle"""
+        if not self.files:
+            return ''
+        raw = json.dumps(self.files, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()[:16]
+
+    def urls(self, bundle):
+        """URLs to load for ``bundle``: one fingerprinted file once built"""
+        if bundle in self.files:
+            return [url_for('assets_file', filename=self.files[bundle])]
+        urls = []
+        for source in ASSET_BUNDLES[bundle]:
+            if os.path.exists(os.path.join(self.static_folder, source)):
+                urls.append(url_for('static', filename=source))
+            else:
+                urls.append(VENDOR_SOURCES[source])
+        return urls
+
+    def send(self, filename):
+        """Serve a built file, picking a precompressed variant the client accepts"""
+        if filename not in self.served:
+            abort(404)
+        served_name = filename
+        encoding = None
+        for candidate, suffix in PRECOMPRESSED:
+            if request.accept_encodings[candidate] and os.path.exists(os.path.join(self.dist_dir, filename + suffix)):
+                served_name, encoding = filename + suffix, candidate
+                break
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.dist_dir, served_name, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def init_assets(app):
+    """Load the asset manifest and expose ``asset_urls`` to templates"""
+    manifest = AssetManifest(app.static_folder, app.config['ASSET_DIST_DIR'])
+    app.extensions['assets'] = manifest
+    app.jinja_env.globals['asset_urls'] = manifest.urls
+    app.add_url_rule('/static/dist/<path:filename>', 'assets_file', manifest.send)
+    return manifest
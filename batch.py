@@ -0,0 +1,146 @@
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from results_builder import build_results, json_default
+
+# Wizard fields accepted in each JSONL spec (step2-step4 and matriz_input)
+SPEC_FIELDS = (
+    'tema_general', 'tipo_tesis', 'enfoque', 'diseno', 'tema_delimitado',
+    'lugar', 'publico', 'periodo', 'problema_mod', 'generar_matriz', 'generar_titulos',
+    'matriz_existente'
+)
+EXISTING_FIELDS = (
+    'problema_general', 'objetivo_general', 'hipotesis_general', 'variables',
+    'metodologia_enfoque', 'metodologia_tipo', 'metodologia_poblacion', 'metodologia_muestra',
+    'metodologia_tecnicas', 'metodologia_instrumentos'
+)
+
+
+class SpecError(ValueError):
+    """Raised when a batch line is not a usable thesis spec"""
+
+
+def iter_lines(stream, max_line_bytes=64 * 1024):
+    """Yield (line_number, bytes) from a binary stream without buffering it whole
+
+    Lines longer than ``max_line_bytes`` are yielded as None and their
+    remainder is skipped, so one runaway line cannot exhaust memory.
+    """
+    line_number = 0
+    while True:
+        raw = stream.readline(max_line_bytes + 1)
+        if not raw:
+            return
+        line_number += 1
+        if len(raw) > max_line_bytes and not raw.endswith(b'\n'):
+            while raw and not raw.endswith(b'\n'):
+                raw = stream.readline(max_line_bytes + 1)
+            yield line_number, None
+            continue
+        yield line_number, raw
+
+
+def parse_spec(raw):
+    """Turn one JSONL line into the session-shaped dict the generator expects"""
+    if raw is None:
+        raise SpecError('Línea demasiado larga')
+    try:
+        payload = json.loads(raw)
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise SpecError(f'JSON inválido: {exc}') from None
+    if not isinstance(payload, dict):
+        raise SpecError('Cada línea debe ser un objeto JSON')
+
+    return payload.get('id'), batch_defaults(spec_from_payload(payload))
+
+
+def batch_defaults(spec):
+    """Batch runs exist to pre-generate content, so generate everything unless a spec says otherwise"""
+    spec.setdefault('generar_matriz', 'si')
+    spec.setdefault('generar_titulos', 'si')
+    return spec
+
+
+def spec_from_payload(payload):
+    """Validate a decoded spec object and keep the wizard fields, as strings"""
+    spec = {field: payload[field] for field in SPEC_FIELDS if payload.get(field) is not None}
+    for field, value in spec.items():
+        if field != 'matriz_existente' and not isinstance(value, str):
+            spec[field] = str(value)
+
+    existing = spec.get('matriz_existente')
+    if existing is not None:
+        if not isinstance(existing, dict):
+            raise SpecError('matriz_existente debe ser un objeto')
+        spec['matriz_existente'] = {field: str(existing.get(field) or '') for field in EXISTING_FIELDS}
+    elif not (spec.get('tema_delimitado') or spec.get('tema_general')):
+        raise SpecError('Falta tema_general o tema_delimitado')
+
+    spec.setdefault('enfoque', '')
+    spec.setdefault('diseno', '')
+    return spec
+
+
+def _generate(generator, line_number, raw, with_spec, parse):
+    try:
+        spec_id, spec = parse(raw)
+        record = {'type': 'result', 'line': line_number, 'id': spec_id}
+        record.update(build_results(generator, spec))
+        if with_spec:
+            record['spec'] = spec
+        return record
+    except Exception as exc:
+        return {'type': 'error', 'line': line_number, 'error': str(exc)}
+
+
+def run_batch(lines, generator, workers=4, max_in_flight=None, with_spec=False, parse=parse_spec):
+    """Run (line_number, raw) specs on a thread pool and yield records as they finish
+
+    At most ``max_in_flight`` specs are read ahead of the consumer, which keeps
+    memory bounded regardless of upload size. A final ``report`` record holds
+    the throughput figures for the batch. With ``with_spec`` each result also
+    carries the parsed spec it was generated from. ``parse`` turns each raw
+    item into (id, spec): JSONL lines by default, matrix_import.parse_row for
+    spreadsheet rows.
+    """
+    max_in_flight = max_in_flight or workers * 4
+    started = time.perf_counter()
+    counts = {'result': 0, 'error': 0}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as executor:
+        pending = set()
+        lines = iter(lines)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                item = next(lines, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(_generate, generator, *item, with_spec, parse))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                counts[record['type']] += 1
+                yield record
+
+    elapsed = time.perf_counter() - started
+    total = counts['result'] + counts['error']
+    yield {
+        'type': 'report',
+        'total': total,
+        'ok': counts['result'],
+        'errors': counts['error'],
+        'workers': workers,
+        'elapsed_s': round(elapsed, 6),
+        'specs_per_s': round(total / elapsed, 2) if elapsed > 0 else None
+    }
+
+
+def to_ndjson(records):
+    """Encode records as newline-delimited JSON chunks"""
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, default=json_default).encode('utf-8') + b'\n'
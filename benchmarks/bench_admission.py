@@ -0,0 +1,226 @@
+"""Overload test for admission control: /results latency past saturation, with and without it.
+
+Students finish the wizard at a fixed arrival rate (open loop: a slow
+server does not slow the arrivals down, as in an enrollment spike). Each
+arrival opens /results for a session that has just completed step 4, so
+every request generates and saves a new project. Arrival rates are
+multiples of the capacity measured first with one client at a time.
+Sessions live in the SQLite backend: the filesystem one keeps only 500.
+
+For each mode and load, reports the offered rate, successful pages per
+second, the share of requests shed (503/429 busy pages), and the p50/p99
+latency of successful pages measured from the scheduled arrival, so time
+spent queued counts. Without admission control latency grows for everyone
+as the backlog builds; with it the p99 of served pages stays flat and the
+excess is turned away in milliseconds.
+
+    python benchmarks/bench_admission.py
+    python benchmarks/bench_admission.py --load 1,2,4 --duration 10 --server gunicorn
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_serving import WizardUser, _free_port  # noqa: E402
+from benchmarks.corpus import wizard_inputs  # noqa: E402
+
+MODES = {
+    'off': {'ADMISSION_MAX_CONCURRENT': '0', 'ADMISSION_RATE': '0'},
+    'on': {},
+}
+
+# Werkzeug with a fixed thread pool, like gunicorn's gthread worker: connections
+# beyond the pool wait for a thread instead of each getting one
+POOLED_SERVER = '''
+import logging, sys
+sys.path.insert(0, {root!r})
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+from main import app
+
+class PooledServer(BaseWSGIServer):
+    request_queue_size = 1024
+    pool = ThreadPoolExecutor({threads})
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.handle_pooled, request, client_address)
+
+    def handle_pooled(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
+PooledServer('127.0.0.1', {port}, app).serve_forever()
+'''
+
+
+def start_server(server, workdir, extra_env, threads):
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT, LOG_LEVEL='WARNING', PREGENERATION_WORKERS='0',
+               DATABASE_URL='sqlite:///' + os.path.join(workdir, 'projects.sqlite3'),
+               SESSION_BACKEND='sqlite', SESSION_SQLITE_PATH=os.path.join(workdir, 'sessions.sqlite3'),
+               SIMILARITY_INDEX_PATH=os.path.join(workdir, 'similarity.tsi'),
+               METRICS_DIR=os.path.join(workdir, 'metrics'), EXPORT_CACHE_DIR=os.path.join(workdir, 'export_cache'),
+               GUNICORN_THREADS=str(threads), WEB_CONCURRENCY='1')
+    env.update(extra_env)
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--chdir', workdir, '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                   '--bind', f'127.0.0.1:{port}']
+    else:
+        command = [sys.executable, '-c', POOLED_SERVER.format(root=ROOT, port=port, threads=threads)]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(400):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise SystemExit(f'{server} did not start')
+
+
+def complete_sessions(port, count, offset):
+    """Cookie jars of ``count`` sessions that have just posted step 4, each with its own topic"""
+    specs = wizard_inputs()
+
+    def one(index):
+        spec = dict(specs[index % len(specs)])
+        spec['tema_delimitado'] = f'{spec["tema_delimitado"]} ({offset + index})'
+        user = WizardUser('127.0.0.1', port, spec)
+        user.request('GET', '/')
+        user.request('POST', '/start', {'tiene_matriz': 'cero'})
+        user.request('POST', '/step2', {key: spec[key] for key in ('tema_general', 'tipo_tesis', 'enfoque', 'diseno')})
+        user.request('POST', '/step3', {'tema_delimitado': spec['tema_delimitado']})
+        user.request('POST', '/step4', {key: spec[key] for key in ('lugar', 'publico', 'periodo', 'problema_mod',
+                                                                   'generar_matriz', 'generar_titulos')})
+        user.connection.close()
+        return '; '.join(f'{name}={value}' for name, value in user.cookies.items())
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return list(pool.map(one, range(count)))
+
+
+def get_results(port, cookie, timeout=60):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request('GET', '/results', headers={'Cookie': cookie})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    except (http.client.HTTPException, OSError):
+        return None
+    finally:
+        connection.close()
+
+
+def capacity(port, cookies):
+    """Pages per second one client at a time gets"""
+    started = time.perf_counter()
+    for cookie in cookies:
+        get_results(port, cookie)
+    return len(cookies) / (time.perf_counter() - started)
+
+
+def open_loop(port, cookies, rate):
+    """Request /results for each session at ``rate`` arrivals per second"""
+    outcomes = []
+    lock = threading.Lock()
+
+    def arrive(cookie, scheduled):
+        status = get_results(port, cookie)
+        with lock:
+            outcomes.append((status, time.perf_counter() - scheduled))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=512) as pool:
+        for index, cookie in enumerate(cookies):
+            scheduled = started + index / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(arrive, cookie, scheduled)
+    elapsed = time.perf_counter() - started
+    served = sorted(latency for status, latency in outcomes if status == 200)
+    shed = sum(1 for status, _ in outcomes if status in (429, 503))
+    return {
+        'ok_per_s': len(served) / elapsed,
+        'shed_pct': 100 * shed / len(outcomes),
+        'errors': sum(1 for status, _ in outcomes if status not in (200, 429, 503)),
+        'p50_ms': served[len(served) // 2] * 1e3 if served else float('nan'),
+        'p99_ms': served[min(len(served) - 1, int(len(served) * 0.99))] * 1e3 if served else float('nan'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--load', default='1,1.5,2,3', help='Arrival rates as multiples of the measured capacity')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds of arrivals per load')
+    parser.add_argument('--modes', default='off,on')
+    parser.add_argument('--server', choices=('pooled', 'gunicorn'), default='pooled',
+                        help='Werkzeug with a gthread-like thread pool, or one gunicorn gthread worker')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per worker')
+    args = parser.parse_args()
+    loads = [float(value) for value in args.load.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='thesis_admission_')
+    try:
+        # Every mode starts from the same completed sessions (copied), so each runs the same requests
+        prepared = os.path.join(workdir, 'prepared')
+        os.makedirs(prepared)
+        process, port = start_server(args.server, prepared, MODES['off'], args.threads)
+        try:
+            calibration = complete_sessions(port, 50, 0)
+            rate = capacity(port, calibration)
+            slices = []
+            for load in loads:
+                count = max(1, round(rate * load * args.duration))
+                slices.append(complete_sessions(port, count, sum(map(len, slices)) + len(calibration)))
+        finally:
+            process.kill()
+            process.wait()
+        print(f'capacity: {rate:.1f} pages/s with one client ({args.server}, {args.threads} threads)')
+
+        print(f'{"mode":<5} {"load":>5} {"offered/s":>10} {"ok/s":>7} {"shed %":>7} {"p50 ms":>8} {"p99 ms":>8} '
+              f'{"errors":>7}')
+        for mode in args.modes.split(','):
+            run_dir = os.path.join(workdir, mode)
+            shutil.copytree(prepared, run_dir)
+            # A fresh project store and index, so the first /results of each session saves again
+            for name in ('projects.sqlite3', 'similarity.tsi'):
+                for suffix in ('', '-wal', '-shm'):
+                    path = os.path.join(run_dir, name + suffix)
+                    if os.path.exists(path):
+                        os.remove(path)
+            process, port = start_server(args.server, run_dir, MODES[mode], args.threads)
+            try:
+                for load, cookies in zip(loads, slices):
+                    result = open_loop(port, cookies, rate * load)
+                    print(f'{mode:<5} {load:>5.1f} {rate * load:>10.1f} {result["ok_per_s"]:>7.1f} '
+                          f'{result["shed_pct"]:>7.1f} {result["p50_ms"]:>8.1f} {result["p99_ms"]:>8.1f} '
+                          f'{result["errors"]:>7}')
+                    # Let the backlog drain before the next load
+                    time.sleep(1)
+            finally:
+                process.kill()
+                process.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Requests/sec: JSON API versus walking the HTML wizard for the same results.
+
+An integration that wants the consistency matrix, titles and
+operationalization matrix for one set of inputs can either walk the wizard
+(four form posts, /results and /matriz_operacionalizacion, scraping the
+HTML) or make the three /api/v1 calls. Both paths are driven over the
+corpus by N threads; "api-304" revalidates with If-None-Match, as a client
+holding the previous responses would.
+
+    python benchmarks/bench_api.py --threads 1,4 --duration 5
+    python benchmarks/bench_api.py --url http://127.0.0.1:5000 --threads 16
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_serving import WizardUser  # noqa: E402
+from benchmarks.corpus import wizard_inputs  # noqa: E402
+
+API_FIELDS = ('tema_general', 'tipo_tesis', 'enfoque', 'diseno', 'tema_delimitado', 'lugar', 'publico', 'periodo',
+              'problema_mod')
+ENDPOINTS = ('/api/v1/consistency-matrix', '/api/v1/titles', '/api/v1/operationalization')
+
+
+class InProcessUser:
+    """Same interface as bench_serving.WizardUser, over the Flask test client"""
+
+    def __init__(self, app, spec):
+        self.app = app
+        self.client = app.test_client()
+        self.spec = spec
+        self.requests = 0
+        self.etags = {}
+        self.cookies = self
+
+    def clear(self):
+        # run_wizard() clears its cookie jar to start each pass with a fresh session
+        self.client = self.app.test_client()
+
+    def request(self, method, path, form=None, body=None, headers=None):
+        response = self.client.open(path, method=method, data=form if form is not None else body, headers=headers)
+        response.get_data()
+        self.requests += 1
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status_code}')
+        return response.status_code, response.headers.get('ETag')
+
+    run_wizard = WizardUser.run_wizard
+
+
+class HttpApiUser(WizardUser):
+    def __init__(self, host, port, spec):
+        super().__init__(host, port, spec)
+        self.etags = {}
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    def request(self, method, path, form=None, body=None, headers=None):
+        if body is None:
+            return super().request(method, path, form)
+        self.connection.request(method, path, body=body, headers=headers or {})
+        response = self.connection.getresponse()
+        response.read()
+        self.latencies.append(0)
+        if response.status >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status}')
+        return response.status, response.getheader('ETag')
+
+
+def run_api(user, conditional=False):
+    body = json.dumps({field: user.spec[field] for field in API_FIELDS}, ensure_ascii=False).encode('utf-8')
+    for path in ENDPOINTS:
+        headers = {'Content-Type': 'application/json'}
+        if conditional and path in user.etags:
+            headers['If-None-Match'] = user.etags[path]
+        _, etag = user.request('POST', path, body=body, headers=headers)
+        user.etags[path] = etag
+
+
+MODES = {
+    'html': lambda user: user.run_wizard(),
+    'api': run_api,
+    'api-304': lambda user: run_api(user, conditional=True),
+}
+
+
+def drive(make_user, mode, threads, duration):
+    specs = wizard_inputs()
+    users = [make_user(specs[i % len(specs)]) for i in range(threads)]
+    completed = [0] * threads
+    deadline = time.perf_counter() + duration
+
+    def loop(index):
+        user = users[index]
+        step = MODES[mode]
+        while time.perf_counter() < deadline:
+            step(user)
+            completed[index] += 1
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return sum(completed) / elapsed, sum(user.requests for user in users) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', default='1,4')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--modes', default='html,api,api-304')
+    parser.add_argument('--url', help='Benchmark a running server instead of the app in-process')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='thesis_api_')
+    try:
+        if args.url:
+            parsed = urllib.parse.urlsplit(args.url)
+
+            def make_user(spec):
+                return HttpApiUser(parsed.hostname, parsed.port or 80, spec)
+        else:
+            import logging
+            os.environ.setdefault('METRICS_DIR', os.path.join(workdir, 'metrics'))
+            from app import create_app
+            app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "projects.sqlite3")}',
+                              'EXPORT_CACHE_DIR': os.path.join(workdir, 'export_cache'),
+                              'ADMISSION_MAX_CONCURRENT': 0, 'ADMISSION_RATE': 0})
+            logging.getLogger().setLevel(logging.WARNING)
+
+            def make_user(spec):
+                return InProcessUser(app, spec)
+
+        print(f'{"mode":<8} {"threads":>7} {"results/s":>10} {"req/s":>9}')
+        for mode in args.modes.split(','):
+            for threads in (int(value) for value in args.threads.split(',')):
+                drive(make_user, mode, threads, min(1.0, args.duration))  # warm caches
+                results_per_s, requests_per_s = drive(make_user, mode, threads, args.duration)
+                print(f'{mode:<8} {threads:>7} {results_per_s:>10.1f} {requests_per_s:>9.1f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Cohort export jobs: archive build rate, memory, request latency meanwhile, and recovery from a killed worker.
+
+Saves cohorts of --projects projects, then queues an export of each and
+reports projects per second, archive size and the peak Python memory of the
+build. Documents are streamed into the archive, so the peak only grows with
+the archive's directory (a few hundred bytes per entry) and the bounded
+generation cache. While the largest export
+runs, /results is requested in a loop to show what a job costs the pages
+served beside it. Last, a worker process is killed halfway through an
+export; a new one picks the job up once its lease runs out and the archive
+is checked to be complete.
+
+    python benchmarks/bench_jobs.py
+    python benchmarks/bench_jobs.py --projects 100,2000 --formats docx,pdf
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app  # noqa: E402
+from benchmarks.corpus import wizard_inputs  # noqa: E402
+from projects import bulk_insert, project_row  # noqa: E402
+from results_builder import build_results  # noqa: E402
+
+LEASE = 2
+
+
+def app_config(workdir, workers=1):
+    return {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'projects.sqlite3'),
+            'JOBS_DB_PATH': os.path.join(workdir, 'jobs.sqlite3'), 'JOBS_DIR': os.path.join(workdir, 'jobs'),
+            'JOBS_WORKERS': workers, 'JOBS_LEASE': LEASE, 'JOBS_POLL_INTERVAL': 0.1,
+            'PREGENERATION_WORKERS': 0, 'ADMISSION_MAX_CONCURRENT': 0, 'ADMISSION_RATE': 0,
+            'METRICS_DIR': os.path.join(workdir, 'metrics'),
+            # The job queue only runs when cohort exports are enabled
+            'COHORT_EXPORT_TOKEN': 'bench-jobs'}
+
+
+def save_cohort(app, cohort, count):
+    specs = wizard_inputs()
+    generator = app.extensions['generator']
+    results = [build_results(generator, spec) for spec in specs]
+    with app.app_context():
+        for start in range(0, count, 500):
+            bulk_insert([project_row(specs[i % len(specs)], results[i % len(specs)], cohort=cohort)
+                         for i in range(start, min(count, start + 500))])
+
+
+def wait(app, job_id, timeout=600):
+    jobs = app.extensions['jobs']
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+
+def results_latency(client, seconds):
+    """Median and p99 microseconds of GET /results over ``seconds``"""
+    timings = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        client.get('/results').get_data()
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99)]
+
+
+def completed_client(app):
+    spec = wizard_inputs()[0]
+    client = app.test_client()
+    client.post('/start', data={'tiene_matriz': 'cero'})
+    client.post('/step2', data={key: spec[key] for key in ('tema_general', 'tipo_tesis', 'enfoque', 'diseno')})
+    client.post('/step3', data={'tema_delimitado': spec['tema_delimitado']})
+    client.post('/step4', data={key: spec[key] for key in ('lugar', 'publico', 'periodo', 'problema_mod',
+                                                           'generar_matriz', 'generar_titulos')})
+    client.get('/results')
+    return client
+
+
+def bench_exports(sizes, formats, workdir):
+    app = create_app(app_config(workdir))
+    jobs = app.extensions['jobs']
+    client = completed_client(app)
+    print(f'{"projects":>9} {"seconds":>8} {"proj/s":>8} {"zip MiB":>8} {"peak MiB":>9}')
+    for size in sizes:
+        cohort = f'bench-{size}'
+        save_cohort(app, cohort, size)
+        tracemalloc.start()
+        started = time.perf_counter()
+        job = jobs.submit('cohort_export', {'cohort': cohort, 'formats': formats})
+        job = wait(app, job['id'])
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert job['status'] == 'done', job['error']
+        print(f'{size:>9} {elapsed:>8.2f} {size / elapsed:>8.0f} {job["size"] / 2 ** 20:>8.1f} '
+              f'{peak / 2 ** 20:>9.1f}')
+
+    idle = results_latency(client, 2)
+    job = jobs.submit('cohort_export', {'cohort': f'bench-{sizes[-1]}', 'formats': formats + ['json']})
+    busy = results_latency(client, 2)
+    wait(app, job['id'])
+    print(f'\n/results while idle      p50 {idle[0]:>7.0f} us  p99 {idle[1]:>7.0f} us')
+    print(f'/results during export   p50 {busy[0]:>7.0f} us  p99 {busy[1]:>7.0f} us')
+
+
+def worker(workdir):
+    """Child process: an app whose job threads run until the process is killed"""
+    app = create_app(app_config(workdir))
+    app.extensions['jobs'].start()
+    while True:
+        time.sleep(1)
+
+
+def bench_recovery(size, formats, workdir):
+    app = create_app(app_config(workdir, workers=0))
+    cohort = 'bench-recovery'
+    save_cohort(app, cohort, size)
+    jobs = app.extensions['jobs']
+    job = jobs.submit('cohort_export', {'cohort': cohort, 'formats': formats})
+    command = [sys.executable, os.path.abspath(__file__), '--worker', workdir]
+    started = time.perf_counter()
+    first = subprocess.Popen(command)
+    while jobs.get(job['id'])['done'] < size // 2:
+        time.sleep(0.05)
+    first.send_signal(signal.SIGKILL)
+    first.wait()
+    killed_at = jobs.get(job['id'])['done']
+    second = subprocess.Popen(command)
+    try:
+        job = wait(app, job['id'])
+    finally:
+        second.terminate()
+        second.wait()
+    elapsed = time.perf_counter() - started
+    with zipfile.ZipFile(jobs.result_path(job['id'])) as archive:
+        entries = len(archive.namelist())
+    print(f'\nworker killed at {killed_at}/{size} projects; job {job["status"]} after {job["attempts"]} attempts, '
+          f'{elapsed:.1f} s in all (lease {LEASE} s), {entries} entries (expected {size * len(formats) + 1})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--projects', default='100,1000', help='Comma-separated cohort sizes')
+    parser.add_argument('--formats', default='docx', help='Comma-separated export formats')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.worker)
+        return
+
+    formats = args.formats.split(',')
+    sizes = [int(value) for value in args.projects.split(',')]
+    with tempfile.TemporaryDirectory(prefix='thesis_jobs_') as workdir:
+        bench_exports(sizes, formats, workdir)
+    with tempfile.TemporaryDirectory(prefix='thesis_jobs_') as workdir:
+        bench_recovery(sizes[-1], formats, workdir)
+
+
+if __name__ == '__main__':
+    main()
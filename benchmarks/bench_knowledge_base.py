@@ -0,0 +1,117 @@
+"""Load-time benchmark for the compiled knowledge base at up to 10k domains.
+
+For each catalog size, writes one JSON file per discipline (as content staff
+would) and reports: compile time, index size, time for a worker to open the
+index and serve its first match, the background change-check cost, and the
+Python heap a worker holds with the mmap index versus building the same
+catalog in memory (what every worker paid when domains were Python literals).
+
+    python benchmarks/bench_knowledge_base.py
+    python benchmarks/bench_knowledge_base.py --sizes 10000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from knowledge_base import (DEFAULT_SOURCE_DIR, KnowledgeIndex, compile_index, load_sources,  # noqa: E402
+                            source_signature)
+from topic_catalog import TopicMatcher, freeze  # noqa: E402
+
+TOPICS = (
+    'Impacto de las tecnologías digitales en el rendimiento académico de estudiantes universitarios',
+    'Calidad de atención en pacientes del hospital regional de Arequipa',
+    'Percepción ciudadana sobre la seguridad en el distrito de San Juan de Lurigancho',
+)
+
+
+def write_sources(directory, size, seed=11):
+    """Real generator.json and domains, padded with synthetic disciplines up to ``size`` files"""
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(directory, 'domains'))
+    shutil.copy(os.path.join(DEFAULT_SOURCE_DIR, 'generator.json'), directory)
+    domains = load_sources(DEFAULT_SOURCE_DIR)[1]
+    template = domains[0]['variables']
+    for position in range(size):
+        if position < len(domains):
+            domain = domains[position]
+        else:
+            keywords = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 12))) for _ in range(5)]
+            variables = json.loads(json.dumps(template))
+            variables['independiente']['nombre'] = f'Variable de la disciplina {position}'
+            domain = {'key': f'disciplina_{position}', 'keywords': keywords, 'variables': variables}
+        with open(os.path.join(directory, 'domains', f'{position:05d}.json'), 'w', encoding='utf-8') as handle:
+            json.dump(domain, handle, ensure_ascii=False)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1e3
+
+
+def heap_kib(fn):
+    """Python heap retained by the object ``fn`` builds"""
+    tracemalloc.start()
+    kept = fn()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return current / 1024
+
+
+def in_memory_catalog(source):
+    general, domains = load_sources(source)
+    return (freeze(general), {domain['key']: freeze(domain['variables']) for domain in domains},
+            TopicMatcher((domain['key'], domain['keywords']) for domain in domains))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000')
+    args = parser.parse_args()
+
+    print(f'{"domains":>8} {"compile ms":>11} {"index KiB":>10} {"open ms":>8} {"1st match ms":>13} '
+          f'{"match us":>9} {"check ms":>9} {"heap mmap KiB":>14} {"heap dicts KiB":>15}')
+    for size in (int(value) for value in args.sizes.split(',')):
+        workdir = tempfile.mkdtemp(prefix='thesis_kb_')
+        try:
+            source = os.path.join(workdir, 'knowledge')
+            path = os.path.join(workdir, 'knowledge.tkb')
+            write_sources(source, size)
+
+            _, compile_ms = timed(lambda: compile_index(source, path))
+            index, open_ms = timed(lambda: KnowledgeIndex(path))
+            _, first_ms = timed(lambda: index.match(TOPICS[0]))
+            started = time.perf_counter()
+            for _ in range(200):
+                for tema in TOPICS:
+                    index.match(tema)
+            match_us = (time.perf_counter() - started) / (200 * len(TOPICS)) * 1e6
+            _, check_ms = timed(lambda: source_signature(source))
+
+            def open_and_match():
+                fresh = KnowledgeIndex(path)
+                for tema in TOPICS:
+                    fresh.match(tema)
+                return fresh
+
+            mapped_kib = heap_kib(open_and_match)
+            dicts_kib = heap_kib(lambda: in_memory_catalog(source))
+            print(f'{size:>8} {compile_ms:>11.1f} {os.path.getsize(path) / 1024:>10.1f} {open_ms:>8.2f} '
+                  f'{first_ms:>13.3f} {match_us:>9.1f} {check_ms:>9.1f} {mapped_kib:>14.1f} {dicts_kib:>15.1f}')
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Bulk import benchmark: existing consistency matrices from CSV and XLSX spreadsheets.
+
+Writes spreadsheets of --rows existing matrices (from the shared corpus,
+with 2 to 60 variables each, some with their dimensions and indicators),
+imports them through the same path as ``POST /batch`` and reports rows per
+second and the peak Python memory of the import. The peak should stay flat
+as rows grow: rows are read and generated a few at a time. It also times
+the pasted-variables parser alone as pastes grow to thousands of
+variables, which should scale linearly.
+
+    python benchmarks/bench_matrix_import.py
+    python benchmarks/bench_matrix_import.py --rows 1000,10000 --workers 4
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import EXISTING_FIELDS, run_batch  # noqa: E402
+from benchmarks.corpus import existing_matrices  # noqa: E402
+from matrix_import import iter_csv_rows, iter_xlsx_rows, parse_row  # noqa: E402
+from matrix_parser import parse_variables  # noqa: E402
+from thesis_generator import ThesisGenerator  # noqa: E402
+
+HEADER = ('id', 'tipo_tesis') + EXISTING_FIELDS
+
+_STRUCTURED = '''Variable independiente: Clima institucional {n}
+  Dimensiones: Liderazgo directivo; Comunicación interna; Trabajo en equipo
+  Indicadores: Frecuencia de reuniones, Claridad de las metas
+Variable dependiente: Satisfacción laboral
+  - Reconocimiento
+    - Felicitaciones recibidas
+    - Incentivos otorgados
+  - Condiciones de trabajo
+Variables de control: Edad, género, años de servicio'''
+
+_WORKBOOK = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+             '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+             'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+             '<sheets><sheet name="Matrices" sheetId="1" r:id="rId1"/></sheets></workbook>')
+_WORKBOOK_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                  '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                  '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+                  'worksheet" Target="worksheets/sheet1.xml"/></Relationships>')
+
+
+def matrix_rows(count):
+    """``count`` spreadsheet rows (header first) cycling through the corpus matrices"""
+    matrices = existing_matrices()
+    yield HEADER
+    for index in range(count):
+        matriz = dict(matrices[index % len(matrices)])
+        if index % 4 == 3:
+            matriz['variables'] = _STRUCTURED.format(n=index)
+        yield (f'fila-{index}', 'Maestría') + tuple(matriz[field] for field in EXISTING_FIELDS)
+
+
+def write_csv(path, count):
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        csv.writer(handle, delimiter=';').writerows(matrix_rows(count))
+
+
+def write_xlsx(path, count):
+    """A minimal workbook with inline strings, written row by row"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('xl/workbook.xml', _WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for number, row in enumerate(matrix_rows(count), 1):
+                cells = ''.join(f'<c t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+                                for value in row)
+                sheet.write(f'<row r="{number}">{cells}</row>'.encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+
+
+def run_import(path, reader, generator, workers):
+    """(rows imported, errors) for one spreadsheet through the /batch pipeline"""
+    with open(path, 'rb') as handle:
+        records = run_batch(reader(handle), generator, workers=workers, parse=parse_row)
+        report = [record for record in records if record['type'] == 'report'][0]
+    return report['ok'], report['errors']
+
+
+def bench_import(rows, workers, workdir):
+    generator = ThesisGenerator()
+    print(f'{"format":<6} {"rows":>7} {"file MiB":>9} {"rows/s":>9} {"peak MiB":>9} {"errors":>7}')
+    for name, writer, reader in (('csv', write_csv, iter_csv_rows), ('xlsx', write_xlsx, iter_xlsx_rows)):
+        for count in rows:
+            path = os.path.join(workdir, f'matrices_{count}.{name}')
+            writer(path, count)
+            started = time.perf_counter()
+            ok, errors = run_import(path, reader, generator, workers)
+            elapsed = time.perf_counter() - started
+            tracemalloc.start()
+            run_import(path, reader, generator, workers)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{name:<6} {count:>7} {os.path.getsize(path) / 2 ** 20:>9.1f} {ok / elapsed:>9.0f} '
+                  f'{peak / 2 ** 20:>9.1f} {errors:>7}')
+
+
+def bench_parser(sizes):
+    print(f'\n{"variables":>9} {"parse ms":>9} {"us/variable":>12}')
+    for size in sizes:
+        lines = []
+        for index in range(size):
+            lines.append(f'Variable interviniente {index + 1}: Factor contextual {index + 1}')
+            lines.append(f'  Dimensiones: Acceso {index}; Uso {index}')
+            lines.append(f'  Indicador: Horas semanales {index}')
+        text = '\n'.join(lines)
+        repeats = max(1, 20000 // size)
+        started = time.perf_counter()
+        for _ in range(repeats):
+            parsed = parse_variables(text)
+        elapsed = (time.perf_counter() - started) / repeats
+        assert len(parsed) == size
+        print(f'{size:>9} {elapsed * 1e3:>9.2f} {elapsed / size * 1e6:>12.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1000,10000', help='Comma-separated spreadsheet sizes')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--variables', default='10,100,1000,10000', help='Comma-separated paste sizes for the parser')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='thesis_import_') as workdir:
+        bench_import([int(value) for value in args.rows.split(',')], args.workers, workdir)
+    bench_parser([int(value) for value in args.variables.split(',')])
+
+
+if __name__ == '__main__':
+    main()
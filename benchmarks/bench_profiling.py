@@ -0,0 +1,87 @@
+"""Request profiling overhead: /results with profiling disabled, enabled but idle, and profiled.
+
+Disabled (no PROFILE_SECRET) installs nothing, so it is the baseline.
+Enabled but idle is what every request pays once PROFILE_SECRET is set: a
+header lookup in the middleware and a thread-local check in each phase
+timer. Profiled requests carry a signed X-Profile header and run under
+cProfile with the stack sampler, and their profiles are written to disk.
+Both a cached page (the common case) and a regenerated one are measured.
+
+    python benchmarks/bench_profiling.py
+    python benchmarks/bench_profiling.py --requests 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app  # noqa: E402
+from benchmarks.corpus import wizard_inputs  # noqa: E402
+from profiling import sign  # noqa: E402
+
+SECRET = 'bench-profiling'
+MODES = ('disabled', 'idle', 'profiled')
+
+
+def build_app(workdir, mode):
+    config = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, f'{mode}.sqlite3'),
+              'PREGENERATION_WORKERS': 0, 'ADMISSION_MAX_CONCURRENT': 0, 'ADMISSION_RATE': 0,
+              'METRICS_DIR': os.path.join(workdir, 'metrics'), 'PROFILE_DIR': os.path.join(workdir, 'profiles')}
+    if mode != 'disabled':
+        config['PROFILE_SECRET'] = SECRET
+    return create_app(config)
+
+
+def completed_client(app, spec):
+    client = app.test_client()
+    client.post('/start', data={'tiene_matriz': 'cero'})
+    client.post('/step2', data={key: spec[key] for key in ('tema_general', 'tipo_tesis', 'enfoque', 'diseno')})
+    client.post('/step3', data={'tema_delimitado': spec['tema_delimitado']})
+    client.post('/step4', data={key: spec[key] for key in ('lugar', 'publico', 'periodo', 'problema_mod',
+                                                           'generar_matriz', 'generar_titulos')})
+    return client
+
+
+def measure(app, mode, requests, cached):
+    """Median and p99 microseconds of GET /results"""
+    specs = wizard_inputs()
+    headers = {'X-Profile': sign(SECRET, '/results', time.time() + 3600)} if mode == 'profiled' else {}
+    client = completed_client(app, specs[0])
+    client.get('/results')
+    timings = []
+    for index in range(requests):
+        if not cached:
+            # A new topic each time, so the page and its content are generated again
+            with client.session_transaction() as session:
+                session['tema_delimitado'] = f'{specs[index % len(specs)]["tema_delimitado"]} ({index})'
+                session.pop('project_key', None)
+        started = time.perf_counter()
+        client.get('/results', headers=headers).get_data()
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f'{"mode":<10} {"page":<10} {"p50 us":>9} {"p99 us":>9}')
+    with tempfile.TemporaryDirectory(prefix='thesis_profiling_') as workdir:
+        for mode in MODES:
+            app = build_app(workdir, mode)
+            for cached in (True, False):
+                # Profiled requests write files, so fewer of them
+                count = args.requests if mode != 'profiled' else max(20, args.requests // 10)
+                p50, p99 = measure(app, mode, count, cached)
+                print(f'{mode:<10} {"cached" if cached else "generated":<10} {p50:>9.0f} {p99:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
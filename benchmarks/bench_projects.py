@@ -0,0 +1,97 @@
+"""Project store: per-row vs bulk insert, and keyset vs OFFSET pagination.
+
+Inserts a synthetic cohort one commit per project (what the wizard does)
+and through projects.bulk_insert in chunks, then times fetching a page
+deep into the listing with the keyset cursor and with LIMIT/OFFSET.
+Uses a temporary SQLite file unless --database-url points at PostgreSQL.
+
+    python benchmarks/bench_projects.py --rows 20000
+    python benchmarks/bench_projects.py --database-url postgresql://localhost/tesis_bench
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import wizard_inputs  # noqa: E402
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--single-rows', type=int, default=1000, help='Rows inserted one commit at a time')
+    parser.add_argument('--chunk', type=int, default=500)
+    parser.add_argument('--page', type=int, default=20)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='thesis_projects_')
+    url = args.database_url or f'sqlite:///{os.path.join(workdir, "projects.sqlite3")}'
+    os.environ.setdefault('METRICS_DIR', os.path.join(workdir, 'metrics'))
+    try:
+        from app import create_app
+        from generation_cache import CachedThesisGenerator
+        from projects import Project, bulk_insert, db, list_projects, project_row, save_project
+        from results_builder import build_results
+
+        app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'EXPORT_CACHE_DIR': os.path.join(workdir, 'exports')})
+        generator = CachedThesisGenerator()
+        specs = wizard_inputs()
+        results = [build_results(generator, spec) for spec in specs]
+
+        with app.app_context():
+            db.session.query(Project).filter(Project.cohort.like('bench-%')).delete(synchronize_session=False)
+            db.session.commit()
+
+            def single():
+                for i in range(args.single_rows):
+                    save_project(specs[i % len(specs)], results[i % len(specs)], cohort='bench-single')
+
+            def bulk():
+                for start in range(0, args.rows, args.chunk):
+                    bulk_insert([project_row(specs[i % len(specs)], results[i % len(specs)], cohort='bench-bulk')
+                                 for i in range(start, min(start + args.chunk, args.rows))])
+
+            _, single_s = timed(single)
+            _, bulk_s = timed(bulk)
+            print(f'{url.split(":")[0]}: per-row commit {args.single_rows / single_s:>9.0f} rows/s; '
+                  f'bulk_insert (chunk {args.chunk}) {args.rows / bulk_s:>9.0f} rows/s')
+
+            # Walk to the last page with the cursor, then fetch the same page with OFFSET
+            before, pages = None, 0
+            while True:
+                (page, cursor), elapsed = timed(lambda: list_projects(cohort='bench-bulk', before=before,
+                                                                      limit=args.page))
+                pages += 1
+                if cursor is None:
+                    break
+                before = cursor
+            offset = (pages - 1) * args.page
+
+            def offset_page():
+                query = (db.select(Project).where(Project.cohort == 'bench-bulk').order_by(Project.id.desc())
+                         .offset(offset).limit(args.page))
+                return db.session.execute(query).scalars().all()
+
+            _, offset_s = timed(offset_page)
+            print(f'last page ({pages} pages): keyset {elapsed * 1e3:.2f} ms; OFFSET {offset} {offset_s * 1e3:.2f} ms')
+
+            db.session.query(Project).filter(Project.cohort.like('bench-%')).delete(synchronize_session=False)
+            db.session.commit()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Memory and serialized size of generated results per 10k student sessions.
+
+Builds the complete results (consistency matrix, titles, operationalization
+matrix) of --sessions students through one generation cache, as a worker
+does, and reports:
+
+- the Python memory the cached results hold (tracemalloc, after a GC)
+- the wizard state each session stores, with the compact session serializer
+- results encoded as the JSON API sends them (MessagePack and JSON) and as
+  saved with a project (JSON)
+- the time to build and to render the operationalization matrix page
+
+Every student has their own topic; a quarter paste an existing matrix.
+
+    python benchmarks/bench_results_memory.py
+    python benchmarks/bench_results_memory.py --sessions 50000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import msgspec  # noqa: E402
+
+from api import _enc_hook  # noqa: E402
+from app import create_app  # noqa: E402
+from benchmarks.corpus import existing_matrices, wizard_inputs  # noqa: E402
+from results_builder import build_results, json_default  # noqa: E402
+from session_backends import CompactSerializer  # noqa: E402
+from title_engine import title_signature  # noqa: E402
+
+PER = 10_000
+
+
+def sessions(count):
+    """Session-shaped wizard states, each with its own topic"""
+    specs = wizard_inputs()
+    matrices = existing_matrices()
+    states = []
+    for index in range(count):
+        if index % 4 == 3:
+            matriz = dict(matrices[index % len(matrices)])
+            matriz['objetivo_general'] = f'{matriz["objetivo_general"]} en la institución {index}'
+            states.append({'tiene_matriz': 'ya_tengo', 'tipo_tesis': 'Maestría', 'generar_titulos': 'si',
+                           'matriz_existente': matriz, 'step': 'complete'})
+        else:
+            spec = dict(specs[index % len(specs)])
+            spec['tema_delimitado'] = f'{spec["tema_delimitado"]} de la institución {index}'
+            spec['step'] = 'complete'
+            states.append(spec)
+    return states
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=PER)
+    args = parser.parse_args()
+    scale = PER / args.sessions
+
+    with tempfile.TemporaryDirectory(prefix='thesis_results_') as workdir:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'projects.sqlite3'),
+                          'PREGENERATION_WORKERS': 0, 'GENERATION_CACHE_SIZE': args.sessions * 4,
+                          'METRICS_DIR': os.path.join(workdir, 'metrics'),
+                          'JOBS_DB_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+                          'JOBS_DIR': os.path.join(workdir, 'jobs')})
+        generator = app.extensions['generator']
+        states = sessions(args.sessions)
+        # Warm the knowledge index and title engine so only the results are measured
+        build_results(generator, states[0])
+        generator.cache.clear()
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        results = [build_results(generator, state) for state in states]
+        build_s = time.perf_counter() - started
+        # Drop the title engine's bounded word-set cache: it is the same size whatever the results hold
+        title_signature.cache_clear()
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        session_bytes = sum(len(CompactSerializer().encode(state)) for state in states)
+        msgpack = msgspec.msgpack.Encoder(enc_hook=_enc_hook)
+        msgpack_bytes = sum(len(msgpack.encode(result)) for result in results)
+        json_bytes = sum(len(json.dumps(result, ensure_ascii=False, default=json_default).encode())
+                         for result in results)
+
+        template = app.jinja_env.get_template('matriz_operacionalizacion.html')
+        renders = results[:2000]
+        with app.test_request_context('/matriz_operacionalizacion'):
+            started = time.perf_counter()
+            for state, result in zip(states, renders):
+                template.render(matriz_operacionalizacion=result['matriz_operacionalizacion'], session_data=state)
+            render_us = (time.perf_counter() - started) / len(renders) * 1e6
+
+    print(f'{args.sessions} sessions; figures per {PER:,} sessions')
+    print(f'{"results in memory (MiB)":<34} {held * scale / 2 ** 20:>10.1f}')
+    print(f'{"session state, compact (MiB)":<34} {session_bytes * scale / 2 ** 20:>10.1f}')
+    print(f'{"results as MessagePack (MiB)":<34} {msgpack_bytes * scale / 2 ** 20:>10.1f}')
+    print(f'{"results as JSON (MiB)":<34} {json_bytes * scale / 2 ** 20:>10.1f}')
+    print(f'{"build per session (us)":<34} {build_s / args.sessions * 1e6:>10.0f}')
+    print(f'{"render matrix page (us)":<34} {render_us:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""Concurrent wizard users per core: legacy gunicorn command vs gunicorn.conf.py.
+
+Each simulated user walks the whole wizard (landing page, the four steps,
+results and operationalization matrix) over a keep-alive connection, then
+starts again with a fresh session. The script starts gunicorn itself for
+each profile, or drives an already running server with --url.
+
+    python benchmarks/bench_serving.py --users 1,8,32,64 --duration 20
+    python benchmarks/bench_serving.py --url http://127.0.0.1:5000 --users 16
+
+Profiles:
+    legacy      gunicorn --bind ... main:app with DEBUG logging (the old
+                deployment: one sync worker)
+    production  gunicorn -c gunicorn.conf.py (preloaded, gthread, a worker
+                per core)
+
+The /core column divides wall-clock throughput by the core count. /cpu-s
+divides completed wizards by the CPU time of the gunicorn processes, so it
+stays meaningful when the load generator shares the cores.
+
+Results (gunicorn 26.2, Python 3.11, 1 core shared with the load
+generator, --duration 20):
+
+    profile       users  wizards/s    /core   /cpu-s     req/s   p50 ms   p99 ms  errors
+    legacy            1        5.7      5.7      8.5      45.8      4.2    206.4       0
+    legacy            8        7.3      7.3      8.3      58.7     72.4    828.3       0
+    legacy           32        7.6      7.6      9.5      60.6    234.2   2973.0       0
+    legacy           64        6.4      6.4      7.6      51.1    431.9   5861.8       0
+    production        1        7.9      7.9      9.5      63.3      3.6    143.9       0
+    production        8        7.6      7.6      8.2      61.1     67.0    797.1       0
+    production       32        8.5      8.5      9.0      68.2    238.0   2079.5       0
+    production       64        9.4      9.4      9.9      75.3    527.4   3356.0       0
+
+A wizard costs the same server CPU (about 0.11 s) in both profiles, so on
+one core the production profile gains 12-47% throughput and a 30-43% lower
+p99 from 32 users up, not more work per CPU second. Repeated runs on this
+host varied by up to 2x in wizards/s, and one run had production behind
+legacy at 8-64 users; /cpu-s stayed between 6.9 and 9.9 in every run. The
+multi-core gain (a worker per core against one sync worker) needs a host
+with more than one core.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import wizard_inputs  # noqa: E402
+
+PROFILES = {
+    'legacy': (['main:app'], {'LOG_LEVEL': 'DEBUG'}),
+    'production': (['-c', os.path.join(ROOT, 'gunicorn.conf.py')], {}),
+}
+
+
+class WizardUser:
+    """One browser: a keep-alive connection and a cookie jar"""
+
+    def __init__(self, host, port, spec):
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        self.spec = spec
+        self.cookies = {}
+        self.latencies = []
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            # Server closed the idle connection; http.client reopens on the next request
+            self.connection.close()
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        self.latencies.append(time.perf_counter() - started)
+        for header in response.headers.get_all('Set-Cookie') or ():
+            name, _, rest = header.partition('=')
+            value = rest.split(';', 1)[0]
+            if value and 'expires=Thu, 01 Jan 1970' not in header:
+                self.cookies[name] = value
+            else:
+                self.cookies.pop(name, None)
+        if response.status >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status}')
+
+    def run_wizard(self):
+        spec = self.spec
+        self.cookies.clear()
+        self.request('GET', '/')
+        self.request('GET', '/start')
+        self.request('POST', '/start', {'tiene_matriz': 'cero'})
+        self.request('POST', '/step2', {key: spec[key] for key in ('tema_general', 'tipo_tesis', 'enfoque', 'diseno')})
+        self.request('POST', '/step3', {'tema_delimitado': spec['tema_delimitado']})
+        self.request('POST', '/step4', {key: spec[key] for key in ('lugar', 'publico', 'periodo', 'problema_mod',
+                                                                   'generar_matriz', 'generar_titulos')})
+        self.request('GET', '/results')
+        self.request('GET', '/matriz_operacionalizacion')
+
+
+def drive(url, users, duration):
+    """Run ``users`` concurrent wizard loops for ``duration`` seconds"""
+    parsed = urllib.parse.urlsplit(url)
+    specs = wizard_inputs()
+    deadline = time.perf_counter() + duration
+    completed = [0] * users
+    errors = []
+    population = [WizardUser(parsed.hostname, parsed.port or 80, specs[i % len(specs)]) for i in range(users)]
+
+    def loop(index):
+        user = population[index]
+        while time.perf_counter() < deadline:
+            try:
+                user.run_wizard()
+                completed[index] += 1
+            except Exception as exc:  # keep the other users going
+                errors.append(repr(exc))
+                user.connection.close()
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for user in population for latency in user.latencies)
+    return {
+        'wizards': sum(completed),
+        'wizards_per_s': sum(completed) / elapsed,
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1e3 if latencies else None,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3 if latencies else None,
+        'errors': len(errors),
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _cpu_seconds(pid):
+    """CPU time used so far by ``pid`` and its children (the gunicorn arbiter and workers)"""
+    ticks = os.sysconf('SC_CLK_TCK')
+    total = 0.0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/stat') as handle:
+                fields = handle.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{current}/task/{current}/children') as handle:
+                pending.extend(int(child) for child in handle.read().split())
+        except OSError:
+            continue
+        # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+        total += (int(fields[11]) + int(fields[12])) / ticks
+    return total
+
+
+def start_server(profile, workdir):
+    args, extra_env = PROFILES[profile]
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT, METRICS_DIR=os.path.join(workdir, 'metrics'),
+               EXPORT_CACHE_DIR=os.path.join(workdir, 'export_cache'),
+               JINJA_BYTECODE_CACHE_DIR=os.path.join(workdir, 'jinja_cache'),
+               # Capacity is measured without admission control shedding the load
+               ADMISSION_MAX_CONCURRENT='0', ADMISSION_RATE='0', **extra_env)
+    command = [sys.executable, '-m', 'gunicorn', '--chdir', workdir, *args, '--bind', f'127.0.0.1:{port}']
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise SystemExit(f'gunicorn ({profile}) did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', default='1,8,32,64', help='Comma-separated concurrent user counts')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per measurement')
+    parser.add_argument('--profiles', default='legacy,production')
+    parser.add_argument('--url', help='Benchmark a running server instead of starting gunicorn')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    user_counts = [int(value) for value in args.users.split(',')]
+    targets = [('url', args.url)] if args.url else [(profile, None) for profile in args.profiles.split(',')]
+
+    print(f'{cores} core(s); wizard = 8 requests; /cpu-s = wizards per second of server CPU time')
+    print(f'{"profile":<12} {"users":>6} {"wizards/s":>10} {"/core":>8} {"/cpu-s":>8} {"req/s":>9} {"p50 ms":>8} '
+          f'{"p99 ms":>8} {"errors":>7}')
+    for profile, url in targets:
+        workdir = tempfile.mkdtemp(prefix='thesis_serving_')
+        process = None
+        try:
+            if url is None:
+                process, url = start_server(profile, workdir)
+            drive(url, 1, 1.0)  # warm up caches and workers
+            for users in user_counts:
+                cpu_before = _cpu_seconds(process.pid) if process else None
+                stats = drive(url, users, args.duration)
+                per_cpu = '-'
+                if process:
+                    cpu = _cpu_seconds(process.pid) - cpu_before
+                    per_cpu = f'{stats["wizards"] / cpu:.1f}' if cpu else '-'
+                print(f'{profile:<12} {users:>6} {stats["wizards_per_s"]:>10.1f} {stats["wizards_per_s"] / cores:>8.1f} '
+                      f'{per_cpu:>8} {stats["requests_per_s"]:>9.1f} {stats["p50_ms"]:>8.1f} {stats["p99_ms"]:>8.1f} '
+                      f'{stats["errors"]:>7}')
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Per-step session latency: filesystem vs SQLite (WAL) vs Redis protocol.
+
+Each backend is pre-populated with N live wizard sessions, then a sample
+of wizard steps is replayed: open the session from its cookie, update the
+step fields and save it, exactly as Flask does around a request. The
+Redis-protocol backend runs against benchmarks/resp_standin.py unless
+--redis-url points at a real server.
+
+    python benchmarks/bench_session_backends.py --sizes 1000,100000
+
+Results (1 core, local disk, Redis stand-in, 2000 samples):
+
+        backend sessions   p50 (us)   p99 (us)    steps/s
+     filesystem     1000      586.9     5526.4       1149
+         sqlite     1000      258.3    11248.8       1546
+          redis     1000      319.1     3615.2       1956
+     filesystem   100000      670.1     2004.7       1382
+         sqlite   100000      289.7     1196.1       2536
+          redis   100000      329.2      829.6       2854
+
+Going from 1k to 100k sessions moves the median step by 15% or less
+for every backend. SQLite stays at under half the filesystem's median.
+The 1k p99s are dominated by the first steps of each run (cold page cache
+and file creation), not by the store size.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request  # noqa: E402
+from flask_session.base import ServerSideSession  # noqa: E402
+from flask_session.filesystem import FileSystemSessionInterface  # noqa: E402
+
+from benchmarks.resp_standin import RespStandIn  # noqa: E402
+from session_backends import RespClient, RespSessionInterface, SQLiteSessionInterface  # noqa: E402
+
+WIZARD_STATE = {
+    'tiene_matriz': 'cero',
+    'step': 4,
+    'tema_general': 'Uso de tecnologías digitales en la enseñanza de matemáticas',
+    'tipo_tesis': 'Licenciatura',
+    'enfoque': 'cuantitativo',
+    'diseno': 'correlacional',
+    'tema_delimitado': 'Uso de tecnologías digitales y rendimiento en matemáticas en estudiantes de secundaria',
+}
+STEP_UPDATE = {
+    'lugar': 'Institución Educativa N° 1234, Arequipa',
+    'publico': 'Estudiantes de 4to y 5to de secundaria',
+    'periodo': '2024',
+    'problema_mod': '¿Cuál es la relación entre el uso de tecnologías digitales y el rendimiento en matemáticas?',
+    'generar_matriz': 'si',
+    'generar_titulos': 'si',
+    'step': 'complete',
+}
+LIFETIME = timedelta(hours=6)
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.secret_key = 'bench'
+    app.config['SESSION_PERMANENT'] = False
+    return app
+
+
+def _filesystem(app, workdir, size):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return FileSystemSessionInterface(app, cache_dir=os.path.join(workdir, 'fs'),
+                                          threshold=size * 2, permanent=False)
+
+
+def _sqlite(app, workdir, size):
+    return SQLiteSessionInterface(app, os.path.join(workdir, 'sessions.sqlite3'), permanent=False)
+
+
+def _populate(interface, size):
+    sids = [f'bench{i:08d}' for i in range(size)]
+    if isinstance(interface, RespSessionInterface):
+        payload = interface.serializer.encode(WIZARD_STATE)
+        for start in range(0, size, 1000):
+            interface.client.pipeline(*[('SET', interface._get_store_id(sid), payload, 'EX', 3600)
+                                        for sid in sids[start:start + 1000]])
+    elif isinstance(interface, SQLiteSessionInterface):
+        payload = interface.serializer.encode(WIZARD_STATE)
+        expiry = int(time.time()) + 3600
+        conn = interface._conn
+        conn.execute('BEGIN')
+        conn.executemany('INSERT OR REPLACE INTO sessions (id, data, expiry) VALUES (?, ?, ?)',
+                         ((interface._get_store_id(sid), payload, expiry) for sid in sids))
+        conn.execute('COMMIT')
+    else:
+        for sid in sids:
+            interface._upsert_session(LIFETIME, ServerSideSession(dict(WIZARD_STATE), sid=sid), interface._get_store_id(sid))
+    return sids
+
+
+def _replay(app, interface, sids, samples):
+    cookie = app.config['SESSION_COOKIE_NAME']
+    timings = []
+    for sid in random.Random(1).sample(sids, min(samples, len(sids))):
+        with app.test_request_context('/step4', method='POST', headers={'Cookie': f'{cookie}={sid}'}):
+            started = time.perf_counter()
+            session = interface.open_session(app, request)
+            session.update(STEP_UPDATE)
+            interface.save_session(app, session, app.response_class())
+            timings.append(time.perf_counter() - started)
+        assert session.get('tema_general'), 'session was not loaded'
+    return timings
+
+
+def _report(name, size, timings):
+    timings.sort()
+    p50 = statistics.median(timings) * 1e6
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1e6
+    print(f'{name:>11} {size:>8} {p50:>10.1f} {p99:>10.1f} {len(timings) / sum(timings):>10.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000')
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--redis-url', help='Use a real Redis-compatible server instead of the stand-in')
+    args = parser.parse_args()
+
+    standin = None
+    redis_url = args.redis_url
+    if not redis_url:
+        standin = RespStandIn().start()
+        redis_url = standin.url
+
+    def _redis(app, workdir, size):
+        client = RespClient.from_url(redis_url)
+        client.execute('FLUSHDB')
+        return RespSessionInterface(app, client, permanent=False)
+
+    backends = (('filesystem', _filesystem), ('sqlite', _sqlite), ('redis', _redis))
+    print(f'{"backend":>11} {"sessions":>8} {"p50 (us)":>10} {"p99 (us)":>10} {"steps/s":>10}')
+    for size in (int(value) for value in args.sizes.split(',')):
+        for name, factory in backends:
+            workdir = tempfile.mkdtemp(prefix='bench_sessions_')
+            try:
+                app = _make_app()
+                interface = factory(app, workdir, size)
+                sids = _populate(interface, size)
+                _report(name, size, _replay(app, interface, sids, args.samples))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    if standin:
+        standin.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark for the similarity index at 10k, 100k and 1M stored texts.
+
+The corpus varies the titles the generator proposes for the wizard inputs in
+benchmarks/corpus.py (place, public, period and a few swapped words), so it
+has the near-duplicates students actually produce. For each size, reports:
+snapshot build and write time, file size, time for a worker to open it,
+top-5 query latency (p50/p99) with the default minimum score, the rate of
+incremental inserts into the in-memory delta, and recall@5 against an exact
+Jaccard scan of the same shingles, counting ties (at sizes up to --exact-limit).
+
+    python benchmarks/bench_similarity.py
+    python benchmarks/bench_similarity.py --sizes 10000,100000
+"""
+import argparse
+import heapq
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import wizard_inputs  # noqa: E402
+from similarity_index import SimilarityIndex, SnapshotBuilder, jaccard, shingles  # noqa: E402
+from thesis_generator import ThesisGenerator  # noqa: E402
+
+PLACES = ('Lima', 'Arequipa', 'Cusco', 'Trujillo', 'Piura', 'Chiclayo', 'Huancayo', 'Iquitos', 'Tacna', 'Puno',
+          'Cajamarca', 'Ayacucho', 'Huánuco', 'Ica', 'Moquegua', 'Tumbes', 'Pucallpa', 'Chimbote', 'Juliaca',
+          'Huaraz')
+PUBLICS = ('estudiantes de secundaria', 'docentes de primaria', 'enfermeras del hospital regional',
+           'colaboradores de una empresa minera', 'madres de familia', 'pacientes adultos mayores',
+           'trabajadores municipales', 'estudiantes universitarios', 'pequeños comerciantes',
+           'agricultores de la provincia')
+SWAPS = (('influencia', 'efecto'), ('relación', 'asociación'), ('nivel', 'grado'), ('estrategia', 'programa'),
+         ('desempeño', 'rendimiento'), ('análisis', 'estudio'))
+
+
+def base_texts():
+    """Titles and problem statements the generator proposes for the benchmark corpus"""
+    generator = ThesisGenerator()
+    texts = []
+    for data in wizard_inputs():
+        texts.extend(('titulo', titulo['titulo']) for titulo in generator.generate_thesis_titles(data, k=20))
+        texts.append(('problema', generator.generate_consistency_matrix(data)['problema_general']))
+    return sorted(set(texts))
+
+
+def synthetic_corpus(size, seed=7):
+    """``size`` stored (kind, text) entries varied from the generator's output"""
+    rng = random.Random(seed)
+    bases = base_texts()
+    for _ in range(size):
+        kind, text = rng.choice(bases)
+        text = f'{text} en {rng.choice(PUBLICS)} de {rng.choice(PLACES)}, {rng.randint(2015, 2025)}'
+        for original, replacement in SWAPS:
+            if original in text and rng.random() < 0.3:
+                text = text.replace(original, replacement)
+        yield kind, text
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1e3
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def exact_threshold(query, corpus_shingles, k, min_score):
+    """Number of true top-``k`` neighbours of ``query`` and the exact Jaccard similarity of the ``k``-th
+
+    The corpus has many entries tied at the same similarity, so any of the
+    tied entries counts as a correct answer.
+    """
+    wanted = shingles(query)
+    top = [score for score in heapq.nlargest(k, (jaccard(wanted, other) for other in corpus_shingles))
+           if score >= min_score]
+    return len(top), (top[-1] if top else 1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--inserts', type=int, default=2000)
+    parser.add_argument('--min-score', type=float, default=0.5)
+    parser.add_argument('--exact-limit', type=int, default=10000, help='Largest size checked by an exact scan')
+    args = parser.parse_args()
+
+    print(f'{"entries":>8} {"build s":>8} {"write s":>8} {"MiB":>7} {"open ms":>8} {"p50 ms":>7} '
+          f'{"p99 ms":>7} {"inserts/s":>10} {"recall@5":>9}')
+    for size in (int(value) for value in args.sizes.split(',')):
+        workdir = tempfile.mkdtemp(prefix='thesis_similarity_')
+        try:
+            path = os.path.join(workdir, 'similarity.tsi')
+            corpus = list(synthetic_corpus(size))
+            builder = SnapshotBuilder()
+
+            def build():
+                for number, (kind, text) in enumerate(corpus, 1):
+                    builder.add(number, f'{number:032x}', kind, text)
+
+            _, build_ms = timed(build)
+            _, write_ms = timed(lambda: builder.write(path))
+            del builder
+            index, open_ms = timed(lambda: SimilarityIndex(path))
+
+            queries = [text for _, text in synthetic_corpus(args.queries, seed=size + 1)]
+            latencies = []
+            for query in queries:
+                _, elapsed = timed(lambda: index.search(query, k=5, min_score=args.min_score))
+                latencies.append(elapsed)
+
+            recall = '-'
+            if size <= args.exact_limit:
+                corpus_shingles = [shingles(text) for _, text in corpus]
+                found = expected = 0
+                for query in queries[:50]:
+                    wanted, threshold = exact_threshold(query, corpus_shingles, 5, args.min_score)
+                    for match in index.search(query, k=5, min_score=args.min_score)[:wanted]:
+                        other = corpus_shingles[int(match['proyecto'], 16) - 1]
+                        found += jaccard(shingles(query), other) >= threshold
+                    expected += wanted
+                recall = f'{found / expected:.3f}' if expected else 'n/a'
+
+            # Inserted after the recall check, which expects only the snapshot entries
+            inserts = list(synthetic_corpus(args.inserts, seed=size + 2))
+            _, insert_ms = timed(lambda: [index.add(size + number, f'{size + number:032x}', [entry])
+                                          for number, entry in enumerate(inserts, 1)])
+
+            print(f'{size:>8} {build_ms / 1e3:>8.1f} {write_ms / 1e3:>8.1f} {os.path.getsize(path) / 2 ** 20:>7.1f} '
+                  f'{open_ms:>8.2f} {percentile(latencies, 0.5):>7.2f} {percentile(latencies, 0.99):>7.2f} '
+                  f'{args.inserts / (insert_ms / 1e3):>10.0f} {recall:>9}')
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
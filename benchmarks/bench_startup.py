@@ -0,0 +1,151 @@
+"""Cold-start benchmark: how long a fresh instance takes to serve its first request.
+
+Starts the app the way a deployment does (``import main``) in a new
+interpreter, serves it with the Werkzeug server and reports, as the median
+over --runs fresh processes: module import time, app creation time, time from
+process spawn to the first 200 response for ``/``, and the resident memory
+of the process after that response (the cost of each extra worker without
+preloading). With --check it exits non-zero when a median exceeds its
+budget, so the deployment build fails instead of shipping a slower start.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --check --runs 3
+    python benchmarks/bench_startup.py --imports 15    # slowest packages to import
+"""
+import argparse
+import collections
+import http.client
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budgets for the median of each measurement
+BUDGETS = {
+    'import_ms': 1500.0,
+    'create_ms': 500.0,
+    'first_response_ms': 2500.0,
+    'rss_mib': 160.0,
+}
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter()
+import main
+created = time.perf_counter()
+import logging
+from werkzeug.serving import make_server
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
+server = make_server('127.0.0.1', {port}, main.app, threaded=True)
+print(json.dumps({{'import_ms': (imported - started) * 1e3, 'create_ms': (created - imported) * 1e3}}), flush=True)
+server.serve_forever()
+'''
+
+_IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+\d+ \| (\s*)(\S+)')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _rss_mib(pid):
+    try:
+        with open(f'/proc/{pid}/status') as handle:
+            for line in handle:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+def _environment():
+    env = dict(os.environ, LOG_LEVEL='WARNING', PYTHONUNBUFFERED='1')
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def cold_start(timeout=30.0):
+    """Measurements of one fresh process serving its first request"""
+    port = _free_port()
+    spawned = time.perf_counter()
+    child = subprocess.Popen([sys.executable, '-c', CHILD.format(root=ROOT, port=port)], cwd=ROOT,
+                             env=_environment(), stdout=subprocess.PIPE, text=True)
+    try:
+        while True:
+            if time.perf_counter() - spawned > timeout or child.poll() is not None:
+                raise SystemExit('The app did not start; run it directly to see the error')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+                connection.request('GET', '/')
+                status = connection.getresponse().status
+                connection.close()
+            except OSError:
+                time.sleep(0.005)
+                continue
+            if status != 200:
+                raise SystemExit(f'GET / answered {status}')
+            break
+        result = {'first_response_ms': (time.perf_counter() - spawned) * 1e3, 'rss_mib': _rss_mib(child.pid)}
+        result.update(json.loads(child.stdout.readline()))
+        return result
+    finally:
+        child.kill()
+        child.wait()
+
+
+def slowest_imports(count):
+    """Self import time of ``import main`` summed per top-level package, slowest first"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=ROOT,
+                               env=_environment(), capture_output=True, text=True, check=True)
+    totals = collections.Counter()
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            totals[match.group(3).split('.')[0]] += int(match.group(1)) / 1e3
+    return totals.most_common(count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--check', action='store_true', help='Exit non-zero when a median exceeds its budget')
+    parser.add_argument('--imports', type=int, default=0, metavar='N', help='Also list the N slowest packages to import')
+    for name, budget in BUDGETS.items():
+        parser.add_argument(f'--max-{name.replace("_", "-")}', dest=name, type=float, default=budget)
+    args = parser.parse_args()
+
+    # Bytecode written by the first run is what precompile.py ships with a build
+    cold_start()
+    runs = [cold_start() for _ in range(args.runs)]
+    failed = []
+    print(f'{"measurement":<18} {"median":>9} {"max":>9} {"budget":>9}')
+    for name in BUDGETS:
+        values = [run[name] for run in runs]
+        median, budget = statistics.median(values), getattr(args, name)
+        print(f'{name:<18} {median:>9.1f} {max(values):>9.1f} {budget:>9.1f}{"  OVER BUDGET" if median > budget else ""}')
+        if median > budget:
+            failed.append(name)
+
+    if args.imports:
+        print(f'\n{"package":<24} {"import ms":>9}')
+        for package, milliseconds in slowest_imports(args.imports):
+            print(f'{package:<24} {milliseconds:>9.1f}')
+
+    if args.check and failed:
+        raise SystemExit(f'Startup budget exceeded: {", ".join(failed)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Top-k title ranking: candidates rendered versus the size of the candidate space.
+
+Runs the wizard corpus through TitleEngine for k=5 and k=100, first with the
+shipped vocabulary and then with an enlarged one (extra actions, connectors
+and place/period phrasings; x3 gives ~20k candidate titles per topic), and
+compares each against rendering, scoring and deduplicating the whole space.
+
+    python benchmarks/bench_title_engine.py
+    python benchmarks/bench_title_engine.py --ks 5,20,100 --rounds 50
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import wizard_inputs  # noqa: E402
+from knowledge_base import DEFAULT_SOURCE_DIR, load_sources  # noqa: E402
+from title_engine import TitleEngine, lower_first, title_signature  # noqa: E402
+
+
+def enlarged(general, factor):
+    """Copy of ``general`` with ``factor`` times more actions and phrasings per slot"""
+    general = json.loads(json.dumps(general))
+    titles = general['titulos']
+    for key, verbs in general['accion_palabras'].items():
+        general['accion_palabras'][key] = verbs + [f'{verb} v{n}' for n in range(1, factor) for verb in verbs]
+    for slot in ('conectores', 'lugar', 'periodo'):
+        titles[slot] = titles[slot] + [dict(item, texto=f'{item["texto"]} v{n}', peso=item['peso'] - 0.01 * n)
+                                       for n in range(1, factor) for item in titles[slot]]
+    return general
+
+
+def contexts():
+    return [{
+        'tema': spec['tema_delimitado'], 'enfoque': spec['enfoque'], 'diseno': spec['diseno'],
+        'lugar': spec['lugar'], 'periodo': spec['periodo'], 'publico': spec['publico'],
+        'vi': 'Uso de tecnologías digitales', 'vd': 'Rendimiento académico',
+    } for spec in wizard_inputs()]
+
+
+def exhaustive(engine, k, context):
+    """Reference: render, score and deduplicate every candidate, then keep the k best"""
+    shape = engine._shape(context)
+    fields = {name: lower_first(context[name]) for name in ('tema', 'vi', 'vd', 'publico')}
+    best = {}
+    for base, _, template, verb, connector in engine._plan(shape):
+        for fill_weight, lugar, periodo, enfoque in engine._fills(template, context, shape):
+            title = template.render(accion=verb, conector=connector, lugar=lugar, periodo=periodo,
+                                    enfoque=enfoque, **fields)
+            if len(title) > engine.max_length:
+                continue
+            words = title.count(' ') + 1
+            score = base + fill_weight - max(0, words - engine.ideal_words) * engine.word_penalty
+            signature = title_signature.__wrapped__(title)
+            if signature not in best or score > best[signature][0]:
+                best[signature] = (score, title)
+    return heapq.nlargest(k, best.values())
+
+
+def timed_us(fn, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ks', default='5,100')
+    parser.add_argument('--factor', type=int, default=3, help='Vocabulary multiplier for the enlarged run')
+    parser.add_argument('--topics', type=int, default=20, help='Corpus topics to rank')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    base = load_sources(DEFAULT_SOURCE_DIR)[0]
+    samples = contexts()[:args.topics]
+    print(f'{"vocabulary":<10} {"k":>4} {"space":>7} {"rendered":>9} {"top-k us":>10} {"exhaustive us":>14} '
+          f'{"speedup":>8}')
+    for label, general in (('shipped', base), (f'x{args.factor}', enlarged(base, args.factor))):
+        engine = TitleEngine(general)
+        space = sum(engine.space(context) for context in samples) / len(samples)
+        for k in (int(value) for value in args.ks.split(',')):
+            stats = {}
+            rendered = 0
+            for context in samples:
+                ranked = engine.top(k, context, stats)
+                rendered += stats['rendered']
+                # Pruning must not change the answer
+                assert [score for score, _ in ranked] == [score for score, _ in exhaustive(engine, k, context)]
+            cycle = itertools.cycle(samples)
+            top_us = timed_us(lambda: engine.top(k, next(cycle)), args.rounds * len(samples))
+            full_us = timed_us(lambda: exhaustive(engine, k, next(cycle)), args.rounds * len(samples))
+            print(f'{label:<10} {k:>4} {space:>7.0f} {rendered / len(samples):>9.0f} {top_us:>10.1f} '
+                  f'{full_us:>14.1f} {full_us / top_us:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Micro-benchmark: per-call cost of topic matching as the catalog grows.
+
+Compares the memory-mapped knowledge index (Aho-Corasick automaton stored
+as flat arrays) with the same automaton held in Python dicts and with the
+original linear ``pattern in tema`` scan over a dict rebuilt on every call.
+
+    python benchmarks/bench_topic_catalog.py
+"""
+import os
+import json
+import random
+import string
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from knowledge_base import DEFAULT_SOURCE_DIR, KnowledgeIndex, compile_index, load_sources  # noqa: E402
+from topic_catalog import TopicMatcher, normalize_text  # noqa: E402
+
+SIZES = (4, 50, 200, 800)
+TOPICS = (
+    'Impacto de las tecnologías digitales en el rendimiento académico de estudiantes universitarios',
+    'Estrategias de enseñanza y aprendizaje en la educación básica regular',
+    'Calidad de atención en pacientes del hospital regional de Arequipa',
+    'Gestión del talento humano en empresas comerciales de Lima Metropolitana',
+    'Percepción ciudadana sobre la seguridad en el distrito de San Juan de Lurigancho',
+)
+
+
+def synthetic_catalog(size, seed=7):
+    """Return the real domains padded with random ones up to ``size``"""
+    rng = random.Random(seed)
+    domains = load_sources(DEFAULT_SOURCE_DIR)[1]
+    template = domains[0]['variables']
+    while len(domains) < size:
+        keywords = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 10))) for _ in range(4)]
+        domains.append({'key': f'dominio_{len(domains)}', 'keywords': keywords, 'variables': template})
+    return domains[:size]
+
+
+def compiled_index(domains, workdir):
+    """Compile ``domains`` (plus the real generator.json) and open the index"""
+    source = os.path.join(workdir, f'source_{len(domains)}')
+    os.makedirs(os.path.join(source, 'domains'))
+    with open(os.path.join(DEFAULT_SOURCE_DIR, 'generator.json'), encoding='utf-8') as handle:
+        general = handle.read()
+    with open(os.path.join(source, 'generator.json'), 'w', encoding='utf-8') as handle:
+        handle.write(general)
+    with open(os.path.join(source, 'domains', 'catalog.json'), 'w', encoding='utf-8') as handle:
+        json.dump(domains, handle, ensure_ascii=False)
+    path = os.path.join(workdir, f'catalog_{len(domains)}.tkb')
+    compile_index(source, path)
+    return KnowledgeIndex(path)
+
+
+def linear_lookup(domains, tema):
+    """Reproduce the original implementation: rebuild the dict and scan it linearly"""
+    patterns = {domain['key']: dict(domain['variables']) for domain in domains}
+    for pattern, variables in patterns.items():
+        if pattern in tema:
+            return variables
+    return None
+
+
+def per_call_us(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='thesis_topics_')
+    print(f'{"domains":>8} {"mmap index (us/call)":>22} {"in-memory (us/call)":>21} {"linear (us/call)":>18}')
+    for size in SIZES:
+        domains = synthetic_catalog(size)
+        index = compiled_index(domains, workdir)
+        matcher = TopicMatcher((domain['key'], domain['keywords']) for domain in domains)
+        topics = [normalize_text(t) for t in TOPICS]
+
+        def mapped():
+            for tema in topics:
+                index.match(tema)
+
+        def in_memory():
+            for tema in topics:
+                matcher.best(tema)
+
+        def linear():
+            for tema in topics:
+                linear_lookup(domains, tema)
+
+        mapped_us = per_call_us(mapped, 2000) / len(topics)
+        in_memory_us = per_call_us(in_memory, 2000) / len(topics)
+        linear_us = per_call_us(linear, 200) / len(topics)
+        print(f'{size:>8} {mapped_us:>22.2f} {in_memory_us:>21.2f} {linear_us:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
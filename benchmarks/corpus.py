@@ -0,0 +1,78 @@
+"""Realistic Spanish thesis inputs shared by the benchmark scripts."""
+from itertools import product
+
+TIPOS_TESIS = ('Pregrado', 'Maestría', 'Doctorado', 'Especialización')
+ENFOQUES = ('Cuantitativo', 'Cualitativo', 'Mixto')
+DISENOS = (
+    'Descriptivo', 'Descriptivo-propositivo', 'Comparativo', 'Correlacional',
+    'Experimental', 'Cuasi-experimental', 'Explicativo'
+)
+
+# (tema_general, tema_delimitado): the first four hit catalog domains, the rest do not
+TOPICS = (
+    ('Tecnología en el aula',
+     'Uso de tecnologías digitales y rendimiento académico en estudiantes de secundaria'),
+    ('Educación inicial',
+     'Estrategias de enseñanza lúdicas y desarrollo del lenguaje en niños de cinco años'),
+    ('Salud mental en trabajadores',
+     'Programa de pausas activas y niveles de estrés laboral en personal de salud'),
+    ('Gestión empresarial',
+     'Estrategia de marketing digital y desempeño comercial de pequeñas empresas'),
+    ('Participación ciudadana',
+     'Percepción de la seguridad ciudadana en vecinos del distrito de San Juan de Lurigancho'),
+    ('Derecho ambiental',
+     'Aplicación de sanciones por contaminación minera en la región de Cajamarca'),
+    ('Turismo rural',
+     'Potencial del turismo vivencial en comunidades altoandinas del Cusco'),
+)
+PLACES = (('Lima', '2024'), ('Arequipa', ''), ('', '2023-2024'), ('', ''))
+
+
+def wizard_inputs():
+    """Every enfoque/diseño combination crossed with each topic and place/period variant"""
+    inputs = []
+    for index, ((tema_general, tema_delimitado), enfoque, diseno) in enumerate(product(TOPICS, ENFOQUES, DISENOS)):
+        lugar, periodo = PLACES[index % len(PLACES)]
+        inputs.append({
+            'tiene_matriz': 'cero',
+            'tema_general': tema_general,
+            'tipo_tesis': TIPOS_TESIS[index % len(TIPOS_TESIS)],
+            'enfoque': enfoque,
+            'diseno': diseno,
+            'tema_delimitado': tema_delimitado,
+            'lugar': lugar,
+            'publico': 'Estudiantes de educación secundaria',
+            'periodo': periodo,
+            'problema_mod': f'Cuál es la relación en {tema_delimitado.lower()}',
+            'generar_matriz': 'si',
+            'generar_titulos': 'si',
+        })
+    return inputs
+
+
+def _variables(count):
+    lines = ['Variable independiente: Uso de tecnologías digitales',
+             'Variable dependiente: Rendimiento académico']
+    for i in range(count - 2):
+        lines.append(f'Variable interviniente {i + 1}: Factor contextual número {i + 1} '
+                     f'(nivel socioeconómico, acceso a internet y acompañamiento familiar)')
+    return '\n'.join(lines[:count])
+
+
+def existing_matrices():
+    """Pasted consistency matrices, from a minimal one to a very long paste"""
+    matrices = []
+    for enfoque, diseno, count in product(ENFOQUES, ('Correlacional', 'Experimental', 'Descriptivo'), (2, 6, 60)):
+        matrices.append({
+            'problema_general': '¿Cuál es la relación entre el uso de tecnologías digitales y el rendimiento académico?',
+            'objetivo_general': 'Determinar la relación entre el uso de tecnologías digitales y el rendimiento académico',
+            'hipotesis_general': 'Existe una relación significativa entre ambas variables',
+            'variables': _variables(count),
+            'metodologia_enfoque': enfoque,
+            'metodologia_tipo': diseno,
+            'metodologia_poblacion': '320 estudiantes de secundaria',
+            'metodologia_muestra': '175 estudiantes (muestreo probabilístico estratificado)',
+            'metodologia_tecnicas': 'Encuesta y análisis documental',
+            'metodologia_instrumentos': 'Cuestionario tipo Likert y registro de notas',
+        })
+    return matrices
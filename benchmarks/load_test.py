@@ -0,0 +1,386 @@
+"""End-to-end load test: virtual students walking whole wizard journeys against a running server.
+
+Each virtual student is a browser with its own keep-alive connection and
+cookie jar. It opens the landing page and step 1, then takes one of two
+branches. Most go through steps 2, 3 and 4. The rest (--existing) paste an
+existing matrix at /matriz_input. Either way they end at /results and
+/matriz_operacionalizacion, then start over as a new student. Forms are
+posted after an exponential think time (mean --think seconds) and
+redirects are followed at once, as a browser does. A busy page (503/429)
+is reloaded after its Retry-After, like the real page does. A redirect
+somewhere other than the next step (usually '/', when the session was
+lost) fails the journey. Students arrive evenly over --ramp seconds and
+keep walking until --duration ends.
+
+For each configuration the report gives, per step: requests per second,
+p50/p95/p99 latency, error rate and shed rate (busy pages). It also gives
+completed and failed journeys per second, and how far the session store
+grew on disk: bytes per completed journey, and files or rows. Sessions
+live in the server's working directory, so the same paths are measured
+whatever the backend.
+
+By default each configuration starts its own server: the pooled Werkzeug
+server from bench_admission.py, or gunicorn with --server gunicorn. A
+configuration is NAME:VAR=VALUE,VAR=VALUE with the environment variables
+that set it, for example:
+
+    python benchmarks/load_test.py --users 500 --duration 60
+    python benchmarks/load_test.py --users 2000 --think 5 --server gunicorn \\
+        --config files:SESSION_BACKEND=filesystem --config sqlite:SESSION_BACKEND=sqlite \\
+        --config client:SESSION_BACKEND=sqlite,SESSION_CLIENT_STATE=1
+    python benchmarks/load_test.py --url http://10.0.0.5:5000 --session-path /srv/app/instance
+
+The load generator shares the CPU with a local server; for capacity figures
+run it from another machine with --url. --json writes the results for
+comparing runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_admission import start_server  # noqa: E402
+from benchmarks.corpus import existing_matrices, wizard_inputs  # noqa: E402
+
+DEFAULT_CONFIGS = ('filesystem:SESSION_BACKEND=filesystem', 'sqlite:SESSION_BACKEND=sqlite')
+# Session stores inside the server's working directory
+SESSION_PATHS = ('flask_session', 'sessions.sqlite3', 'sessions.sqlite3-wal')
+SHED = (429, 503)
+MAX_RELOADS = 5
+
+STEP2_FIELDS = ('tema_general', 'tipo_tesis', 'enfoque', 'diseno')
+STEP4_FIELDS = ('lugar', 'publico', 'periodo', 'problema_mod', 'generar_matriz', 'generar_titulos')
+
+
+class JourneyError(Exception):
+    """A step answered with an error, an unexpected redirect or not at all"""
+
+
+class _Deadline(Exception):
+    """The run ended while the student was thinking"""
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.shed = 0
+
+    @property
+    def requests(self):
+        return len(self.latencies) + self.errors + self.shed
+
+
+class Browser:
+    """One virtual student: a keep-alive HTTP/1.1 connection and a cookie jar"""
+
+    def __init__(self, host, port, steps, timeout):
+        self.host = host
+        self.port = port
+        self.steps = steps
+        self.timeout = timeout
+        self.cookies = {}
+        self._reader = None
+        self._writer = None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+    async def _exchange(self, method, path, body):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        if body:
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{name}={value}' for name, value in self.cookies.items()))
+        self._writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by the server')
+        status = int(status_line.split()[1])
+        headers = []
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip().lower(), value.strip()))
+        fields = dict(headers)
+        if fields.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                await self._reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in fields:
+            await self._reader.readexactly(int(fields['content-length']))
+        else:
+            # HTTP/1.0 without a length: the body ends with the connection
+            await self._reader.read()
+            self.close()
+            return status, headers
+        if fields.get('connection', '').lower() == 'close':
+            self.close()
+        return status, headers
+
+    async def request(self, method, path, form=None):
+        """Send one request and return (status, headers), reconnecting once if a kept-alive connection died"""
+        body = urllib.parse.urlencode(form).encode() if form else b''
+        label = f'{method} {path}'
+        stats = self.steps.setdefault(label, StepStats())
+        started = time.perf_counter()
+        try:
+            reused = self._writer is not None
+            try:
+                status, headers = await asyncio.wait_for(self._exchange(method, path, body), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused:
+                    raise
+                status, headers = await asyncio.wait_for(self._exchange(method, path, body), self.timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, IndexError) as exc:
+            self.close()
+            stats.errors += 1
+            raise JourneyError(f'{label}: {type(exc).__name__}') from None
+        elapsed = time.perf_counter() - started
+        for name, value in headers:
+            if name == 'set-cookie':
+                cookie_name, _, rest = value.partition('=')
+                cookie_value = rest.split(';', 1)[0]
+                if cookie_value and 'expires=Thu, 01 Jan 1970' not in value:
+                    self.cookies[cookie_name] = cookie_value
+                else:
+                    self.cookies.pop(cookie_name, None)
+        if status in SHED:
+            stats.shed += 1
+        elif status >= 400:
+            stats.errors += 1
+            raise JourneyError(f'{label}: HTTP {status}')
+        else:
+            stats.latencies.append(elapsed)
+        return status, headers
+
+    async def page(self, path):
+        """GET a page, reloading it after Retry-After while the server sheds it"""
+        for _ in range(MAX_RELOADS):
+            status, headers = await self.request('GET', path)
+            if status not in SHED:
+                return status
+            await asyncio.sleep(float(dict(headers).get('retry-after', 1)))
+        raise JourneyError(f'GET {path}: still busy after {MAX_RELOADS} reloads')
+
+    async def submit(self, path, form, expected):
+        """POST a form and follow its redirect, which must lead to ``expected``"""
+        status, headers = await self.request('POST', path, form)
+        location = urllib.parse.urlsplit(dict(headers).get('location', '')).path
+        if status not in (302, 303) or location != expected:
+            raise JourneyError(f'POST {path}: redirected to {location or status} instead of {expected}')
+        await self.page(expected)
+
+
+class Student:
+    """A virtual student walking wizard journeys in a loop until ``deadline``"""
+
+    def __init__(self, browser, rng, think, existing_share, deadline):
+        self.browser = browser
+        self.rng = rng
+        self.think = think
+        self.existing_share = existing_share
+        self.deadline = deadline
+        self.completed = 0
+        self.failures = {}
+
+    async def pause(self):
+        if self.think:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think))
+        if time.monotonic() >= self.deadline:
+            raise _Deadline
+
+    async def journey(self):
+        browser = self.browser
+        # A new student: no session and no owner cookie
+        browser.cookies.clear()
+        await browser.page('/')
+        await self.pause()
+        await browser.page('/start')
+        await self.pause()
+        if self.rng.random() < self.existing_share:
+            matriz = self.rng.choice(existing_matrices())
+            await browser.submit('/start', {'tiene_matriz': 'ya_tengo'}, '/matriz_input')
+            await self.pause()
+            form = dict(matriz, tipo_tesis='Maestría', generar_titulos=self.rng.choice(('si', 'no')))
+            await browser.submit('/matriz_input', form, '/results')
+        else:
+            spec = self.rng.choice(wizard_inputs())
+            await browser.submit('/start', {'tiene_matriz': 'cero'}, '/step2')
+            await self.pause()
+            await browser.submit('/step2', {key: spec[key] for key in STEP2_FIELDS}, '/step3')
+            await self.pause()
+            await browser.submit('/step3', {'tema_delimitado': spec['tema_delimitado']}, '/step4')
+            await self.pause()
+            await browser.submit('/step4', {key: spec[key] for key in STEP4_FIELDS}, '/results')
+        await self.pause()
+        await browser.page('/matriz_operacionalizacion')
+
+    async def run(self, start_delay):
+        await asyncio.sleep(start_delay)
+        while time.monotonic() < self.deadline:
+            try:
+                await self.journey()
+                self.completed += 1
+            except _Deadline:
+                break
+            except JourneyError as exc:
+                reason = str(exc)
+                self.failures[reason] = self.failures.get(reason, 0) + 1
+                await asyncio.sleep(self.think)
+        self.browser.close()
+
+
+def session_store_size(paths):
+    """(bytes, entries) of the session stores found at ``paths``: files in directories, rows in SQLite files"""
+    size = entries = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in os.scandir(path):
+                if entry.is_file():
+                    size += entry.stat().st_size
+                    entries += 1
+        elif os.path.isfile(path):
+            size += os.path.getsize(path)
+            if path.endswith('.sqlite3'):
+                try:
+                    with sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=1) as conn:
+                        entries += conn.execute('SELECT count(*) FROM sessions').fetchone()[0]
+                except sqlite3.Error:
+                    pass
+    return size, entries
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))] * 1e3 if values else float('nan')
+
+
+async def drive(url, users, duration, ramp, think, existing_share, timeout, seed):
+    parsed = urllib.parse.urlsplit(url)
+    deadline = time.monotonic() + duration
+    steps = {}
+    students = [Student(Browser(parsed.hostname, parsed.port or 80, steps, timeout), random.Random(seed + index),
+                        think, existing_share, deadline) for index in range(users)]
+    started = time.perf_counter()
+    await asyncio.gather(*(student.run(ramp * index / users) for index, student in enumerate(students)))
+    elapsed = time.perf_counter() - started
+    failures = {}
+    for student in students:
+        for reason, count in student.failures.items():
+            failures[reason] = failures.get(reason, 0) + count
+    return {
+        'elapsed_s': elapsed,
+        'completed': sum(student.completed for student in students),
+        'failed': sum(failures.values()),
+        'failures': dict(sorted(failures.items(), key=lambda item: -item[1])[:5]),
+        'steps': {
+            label: {
+                'requests': stats.requests,
+                'per_s': stats.requests / elapsed,
+                'p50_ms': percentile(sorted(stats.latencies), 0.5),
+                'p95_ms': percentile(sorted(stats.latencies), 0.95),
+                'p99_ms': percentile(sorted(stats.latencies), 0.99),
+                'error_pct': 100 * stats.errors / max(1, stats.requests),
+                'shed_pct': 100 * stats.shed / max(1, stats.requests),
+            } for label, stats in steps.items()
+        },
+    }
+
+
+def parse_config(value):
+    name, _, assignments = value.partition(':')
+    env = dict(item.split('=', 1) for item in assignments.split(',') if item)
+    return name, env
+
+
+def report(name, result, store_before, store_after):
+    elapsed = result['elapsed_s']
+    print(f'\n== {name}: {result["completed"]} journeys completed ({result["completed"] / elapsed:.1f}/s), '
+          f'{result["failed"]} failed, {elapsed:.0f} s')
+    print(f'{"step":<32} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"err %":>6} {"shed %":>7}')
+    for label, step in result['steps'].items():
+        print(f'{label:<32} {step["per_s"]:>8.1f} {step["p50_ms"]:>8.1f} {step["p95_ms"]:>8.1f} '
+              f'{step["p99_ms"]:>8.1f} {step["error_pct"]:>6.1f} {step["shed_pct"]:>7.1f}')
+    for reason, count in result['failures'].items():
+        print(f'  failed {count}x: {reason}')
+    if store_before is not None:
+        grown = store_after[0] - store_before[0]
+        per_journey = grown / result['completed'] if result['completed'] else float('nan')
+        print(f'session store: {store_before[0] / 2 ** 20:.1f} -> {store_after[0] / 2 ** 20:.1f} MiB '
+              f'({per_journey:,.0f} bytes per journey), {store_before[1]} -> {store_after[1]} sessions')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='Concurrent virtual students')
+    parser.add_argument('--duration', type=float, default=60.0, help='Seconds of load per configuration')
+    parser.add_argument('--ramp', type=float, default=10.0, help='Seconds over which students arrive')
+    parser.add_argument('--think', type=float, default=2.0, help='Mean think time before each form, in seconds')
+    parser.add_argument('--existing', type=float, default=0.25, help='Share of journeys through /matriz_input')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a request counts as failed')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--config', action='append', help='NAME:VAR=VALUE,... (repeatable)')
+    parser.add_argument('--server', choices=('pooled', 'gunicorn'), default='pooled')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per worker')
+    parser.add_argument('--url', help='Drive a running server instead of starting one per configuration')
+    parser.add_argument('--session-path', action='append', default=[],
+                        help='Session store (directory or SQLite file) to measure with --url')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+    run = (args.users, args.duration, args.ramp, args.think, args.existing, args.timeout, args.seed)
+
+    print(f'{args.users} students, {args.duration:.0f} s, think {args.think} s, '
+          f'{100 * args.existing:.0f}% pasting an existing matrix')
+    results = {}
+    if args.url:
+        before = session_store_size(args.session_path) if args.session_path else None
+        result = asyncio.run(drive(args.url, *run))
+        after = session_store_size(args.session_path) if args.session_path else None
+        report(args.url, result, before, after)
+        results[args.url] = result
+    for name, env in map(parse_config, [] if args.url else args.config or DEFAULT_CONFIGS):
+        workdir = tempfile.mkdtemp(prefix='thesis_load_')
+        # Pre-generation as deployed, unless the configuration sets it
+        process, port = start_server(args.server, workdir, {'PREGENERATION_WORKERS': '2', **env}, args.threads)
+        try:
+            paths = [os.path.join(workdir, path) for path in SESSION_PATHS]
+            before = session_store_size(paths)
+            result = asyncio.run(drive(f'http://127.0.0.1:{port}', *run))
+            after = session_store_size(paths)
+        finally:
+            process.kill()
+            process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+        report(name, result, before, after)
+        result['session_store'] = {'bytes_before': before[0], 'bytes_after': after[0], 'sessions_before': before[1],
+                                   'sessions_after': after[1]}
+        results[name] = result
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump({'args': vars(args), 'results': results}, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
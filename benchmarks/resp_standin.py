@@ -0,0 +1,131 @@
+"""In-process Redis-protocol stand-in for exercising RespSessionInterface locally.
+
+Implements only what the session store uses (GET, SET with EX/PX, DEL,
+EXPIRE, TTL, DBSIZE, FLUSHDB, PING, SELECT, AUTH) with lazy expiry.
+
+    python benchmarks/resp_standin.py --port 6399
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class _Store:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+            return False
+        return key in self.data
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            self.wfile.write(self._dispatch(store, args[0].upper(), args[1:]))
+
+    @staticmethod
+    def _bulk(value):
+        return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _dispatch(self, store, command, args):
+        with store.lock:
+            if command == b'PING':
+                return b'+PONG\r\n'
+            if command in (b'SELECT', b'AUTH'):
+                return b'+OK\r\n'
+            if command == b'GET':
+                key = args[0]
+                return self._bulk(store.data[key] if store._alive(key) else None)
+            if command == b'SET':
+                key, value = args[0], args[1]
+                store.data[key] = value
+                store.expires.pop(key, None)
+                options = [arg.upper() for arg in args[2:]]
+                if b'EX' in options:
+                    store.expires[key] = time.monotonic() + int(args[2 + options.index(b'EX') + 1])
+                elif b'PX' in options:
+                    store.expires[key] = time.monotonic() + int(args[2 + options.index(b'PX') + 1]) / 1000
+                return b'+OK\r\n'
+            if command == b'DEL':
+                removed = 0
+                for key in args:
+                    if store.data.pop(key, None) is not None:
+                        removed += 1
+                    store.expires.pop(key, None)
+                return b':%d\r\n' % removed
+            if command == b'EXPIRE':
+                if not store._alive(args[0]):
+                    return b':0\r\n'
+                store.expires[args[0]] = time.monotonic() + int(args[1])
+                return b':1\r\n'
+            if command == b'TTL':
+                if not store._alive(args[0]):
+                    return b':-2\r\n'
+                deadline = store.expires.get(args[0])
+                return b':%d\r\n' % (-1 if deadline is None else int(deadline - time.monotonic()))
+            if command == b'DBSIZE':
+                return b':%d\r\n' % len(store.data)
+            if command == b'FLUSHDB':
+                store.data.clear()
+                store.expires.clear()
+                return b'+OK\r\n'
+        return b'-ERR unknown command\r\n'
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'redis://{host}:{port}/0'
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6399)
+    args = parser.parse_args()
+    server = RespStandIn(args.host, args.port)
+    print(f'Listening on {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+"""Reproducible benchmark suite for ThesisGenerator and every Flask route.
+
+Measures ops/sec, p50/p99 latency and peak bytes allocated per call for
+each generator method over the corpus in benchmarks/corpus.py, and for
+each route driven through the Flask test client. Results are written as
+JSON; with --baseline the run fails (exit 1) on regressions.
+
+    python benchmarks/run_suite.py --output bench.json
+    python benchmarks/run_suite.py --baseline benchmarks/baseline.json
+    python benchmarks/run_suite.py --update-baseline
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import existing_matrices, wizard_inputs  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+
+class Case:
+    def __init__(self, name, call, setup=None, iterations=None):
+        self.name = name
+        self.call = call
+        self.setup = setup
+        self.iterations = iterations
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(case, iterations, warmup):
+    iterations = case.iterations or iterations
+    for _ in range(warmup):
+        if case.setup:
+            case.setup()
+        case.call()
+
+    gc.collect()
+    timings = []
+    for _ in range(iterations):
+        if case.setup:
+            case.setup()
+        started = time.perf_counter_ns()
+        case.call()
+        timings.append(time.perf_counter_ns() - started)
+
+    # Separate, shorter pass for allocations: tracemalloc slows calls down
+    alloc_samples = []
+    tracemalloc.start()
+    for _ in range(min(iterations, 100)):
+        if case.setup:
+            case.setup()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        case.call()
+        alloc_samples.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    timings.sort()
+    total_s = sum(timings) / 1e9
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / total_s, 1) if total_s else None,
+        'p50_us': round(_percentile(timings, 0.50) / 1e3, 2),
+        'p99_us': round(_percentile(timings, 0.99) / 1e3, 2),
+        'peak_alloc_bytes_per_call': int(sum(alloc_samples) / len(alloc_samples)),
+    }
+
+
+def _cycle(items):
+    state = {'index': 0}
+
+    def next_item():
+        item = items[state['index'] % len(items)]
+        state['index'] += 1
+        return item
+    return next_item
+
+
+def generator_cases():
+    from thesis_generator import ThesisGenerator
+    from thesis_spec import ThesisSpec
+
+    generator = ThesisGenerator()
+    # Requests build their ThesisSpec once and share it; the spec cases measure that step
+    wizard_dicts = _cycle(wizard_inputs())
+    matrix_dicts = _cycle(existing_matrices())
+    wizard = _cycle([ThesisSpec.from_session(spec) for spec in wizard_inputs()])
+    existing = _cycle([ThesisSpec.from_matrix(matriz) for matriz in existing_matrices()])
+    topics = _cycle([spec['tema_delimitado'].lower() for spec in wizard_inputs()])
+    return [
+        Case('spec.ThesisSpec.from_session', lambda: ThesisSpec.from_session(wizard_dicts())),
+        Case('spec.ThesisSpec.from_matrix', lambda: ThesisSpec.from_matrix(matrix_dicts())),
+        Case('generator.generate_consistency_matrix', lambda: generator.generate_consistency_matrix(wizard())),
+        Case('generator.generate_thesis_titles', lambda: generator.generate_thesis_titles(wizard())),
+        Case('generator.generate_thesis_titles[k=100]', lambda: generator.generate_thesis_titles(wizard(), k=100)),
+        Case('generator.generate_operationalization_matrix',
+             lambda: generator.generate_operationalization_matrix(wizard())),
+        Case('generator._generate_variable_suggestions', lambda: generator._generate_variable_suggestions(topics())),
+        Case('generator.generate_consistency_matrix_from_existing',
+             lambda: generator.generate_consistency_matrix_from_existing(existing())),
+        Case('generator.generate_thesis_titles_from_existing',
+             lambda: generator.generate_thesis_titles_from_existing(existing())),
+        Case('generator.generate_operationalization_matrix_from_existing',
+             lambda: generator.generate_operationalization_matrix_from_existing(existing())),
+    ]
+
+
+PROFILE_SECRET = 'bench-suite'
+EXPORT_TOKEN = 'bench-suite'
+
+
+def route_cases(workdir):
+    # Everything the app writes goes to the scratch directory, never to the repository's instance/
+    os.environ.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'projects.sqlite3'),
+        'EXPORT_CACHE_DIR': os.path.join(workdir, 'export_cache'),
+        'SESSION_SQLITE_PATH': os.path.join(workdir, 'sessions.sqlite3'),
+        'SIMILARITY_INDEX_PATH': os.path.join(workdir, 'similarity.tsi'),
+        'JOBS_DB_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+        'JOBS_DIR': os.path.join(workdir, 'jobs'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'COHORT_EXPORT_TOKEN': EXPORT_TOKEN,
+    })
+    # Repeated requests from one client would be shed after the first burst; measure the pages, not the limiter
+    os.environ['ADMISSION_MAX_CONCURRENT'] = '0'
+    os.environ['ADMISSION_RATE'] = '0'
+    os.chdir(workdir)
+    import logging
+    from main import app
+    from app import create_app
+    from profiling import ProfileStore, sign
+    from projects import OWNER_COOKIE, bulk_insert, new_key, project_row
+    from results_builder import build_results
+    logging.getLogger().setLevel(logging.WARNING)
+    app.config['TESTING'] = True
+    client = app.test_client()
+
+    wizard = wizard_inputs()[0]
+    existing = existing_matrices()[1]
+    complete = dict(wizard, step='complete')
+    complete_existing = {'tiene_matriz': 'ya_tengo', 'tipo_tesis': 'Maestría', 'generar_titulos': 'no',
+                         'matriz_existente': existing, 'step': 'complete'}
+    batch_body = '\n'.join(json.dumps(dict(spec, id=i), ensure_ascii=False)
+                           for i, spec in enumerate(wizard_inputs()[:50])).encode('utf-8')
+
+    # Saved projects: a page of them for this browser's /proyectos, and a cohort to export
+    owner = new_key()
+    generator = app.extensions['generator']
+    rows = [project_row(spec, build_results(generator, spec), owner=owner, cohort='bench')
+            for spec in wizard_inputs()[:20]]
+    with app.app_context():
+        bulk_insert(rows)
+    client.set_cookie(OWNER_COOKIE, owner)
+    export_auth = {'Authorization': f'Bearer {EXPORT_TOKEN}'}
+    export = client.post('/exportaciones?cohorte=bench&formatos=docx', headers=export_auth).get_json()
+    while client.get(f'/exportaciones/{export["id"]}', headers=export_auth).get_json()['status'] not in ('done', 'failed'):
+        time.sleep(0.05)
+
+    # The profiling pages only exist with PROFILE_SECRET set, so they get an app of their own
+    profiled = create_app({'PROFILE_SECRET': PROFILE_SECRET, 'JOBS_WORKERS': 0, 'PREGENERATION_WORKERS': 0})
+    profiled.config['TESTING'] = True
+    profiled_client = profiled.test_client()
+    with profiled_client.session_transaction() as sess:
+        sess.update(complete)
+    profiled_client.get('/results', headers={'X-Profile': sign(PROFILE_SECRET, '/results', time.time() + 3600)})
+    profile_store = ProfileStore(os.environ['PROFILE_DIR'])
+    while not profile_store.ids():
+        time.sleep(0.05)
+    profile_id = profile_store.ids()[0]
+    profile_auth = {'Authorization': f'Bearer {PROFILE_SECRET}'}
+    bundles = app.extensions['assets'].files
+
+    def at(state):
+        def setup():
+            with client.session_transaction() as sess:
+                sess.clear()
+                sess.update(state)
+        return setup
+
+    def get(path, target=client, **kwargs):
+        return lambda: _check(target.get(path, **kwargs))
+
+    def post(path, data, **kwargs):
+        return lambda: _check(client.post(path, data=data, **kwargs))
+
+    step2_form = {key: wizard[key] for key in ('tema_general', 'tipo_tesis', 'enfoque', 'diseno')}
+    step4_form = {key: wizard[key] for key in ('lugar', 'publico', 'periodo', 'problema_mod',
+                                               'generar_matriz', 'generar_titulos')}
+    matriz_form = dict(existing, tipo_tesis='Maestría', generar_titulos='no')
+    api_body = {key: value for key, value in wizard.items() if key != 'tiene_matriz'}
+
+    cases = [
+        Case('route.GET /', get('/')),
+        Case('route.GET /start', get('/start')),
+        Case('route.POST /start', post('/start', {'tiene_matriz': 'cero'})),
+        Case('route.GET /step2', get('/step2'), at(dict(wizard, step=2))),
+        Case('route.POST /step2', post('/step2', step2_form), at(dict(wizard, step=2))),
+        Case('route.GET /step3', get('/step3'), at(dict(wizard, step=3))),
+        Case('route.POST /step3', post('/step3', {'tema_delimitado': wizard['tema_delimitado']}), at(dict(wizard, step=3))),
+        Case('route.GET /step4', get('/step4'), at(dict(wizard, step=4))),
+        Case('route.POST /step4', post('/step4', step4_form), at(dict(wizard, step=4))),
+        Case('route.GET /matriz_input', get('/matriz_input'), at({'step': 'matriz_input'})),
+        Case('route.POST /matriz_input', post('/matriz_input', matriz_form), at({'step': 'matriz_input'})),
+        Case('route.GET /results', get('/results'), at(complete)),
+        Case('route.GET /results (matriz existente)', get('/results'), at(complete_existing)),
+        Case('route.GET /matriz_operacionalizacion', get('/matriz_operacionalizacion'), at(complete)),
+        Case('route.GET /matriz_operacionalizacion (matriz existente)', get('/matriz_operacionalizacion'),
+             at(complete_existing)),
+        Case('route.GET /download_results?formato=json', get('/download_results?formato=json'), at(complete)),
+        Case('route.GET /download_results?formato=csv', get('/download_results?formato=csv'), at(complete)),
+        Case('route.GET /download_results?formato=docx', get('/download_results?formato=docx'), at(complete)),
+        Case('route.GET /download_results?formato=pdf', get('/download_results?formato=pdf'), at(complete)),
+        Case('route.GET /proyectos', get('/proyectos')),
+        Case('route.GET /proyectos/<key>', get(f'/proyectos/{rows[0]["key"]}')),
+        Case('route.POST /batch (50 specs)',
+             lambda: _check(client.post('/batch', data=io.BytesIO(batch_body), content_type='application/x-ndjson')),
+             iterations=50),
+        Case('route.POST /api/v1/titles', post('/api/v1/titles', json.dumps(api_body, ensure_ascii=False),
+                                               content_type='application/json')),
+        Case('route.POST /api/v1/consistency-matrix',
+             post('/api/v1/consistency-matrix', json.dumps(api_body, ensure_ascii=False),
+                  content_type='application/json')),
+        Case('route.POST /api/v1/operationalization',
+             post('/api/v1/operationalization', json.dumps(api_body, ensure_ascii=False),
+                  content_type='application/json')),
+        Case('route.GET /exportaciones/<id>', get(f'/exportaciones/{export["id"]}', headers=export_auth)),
+        Case('route.GET /exportaciones/<id>/archivo', get(f'/exportaciones/{export["id"]}/archivo',
+                                                          headers=export_auth)),
+        Case('route.GET /admin/perfiles/', get('/admin/perfiles/', profiled_client, headers=profile_auth)),
+        Case('route.GET /admin/perfiles/<id>', get(f'/admin/perfiles/{profile_id}', profiled_client,
+                                                   headers=profile_auth)),
+        Case('route.GET /admin/perfiles/<id>.folded', get(f'/admin/perfiles/{profile_id}.folded', profiled_client,
+                                                          headers=profile_auth)),
+        Case('route.GET /static/<file>', get('/static/css/custom.css')),
+        Case('route.GET /metrics', get('/metrics')),
+        Case('route.GET /cache_stats', get('/cache_stats')),
+        Case('route.GET /reset', get('/reset'), at(complete)),
+    ]
+    for bundle, filename in sorted(bundles.items()):
+        # Only once build_assets.py has run
+        cases.append(Case(f'route.GET /static/dist/{bundle}', get(f'/static/dist/{filename}',
+                                                                   headers={'Accept-Encoding': 'gzip'})))
+    # Last: an export finished meanwhile is queued and built again in the background
+    cases.append(Case('route.POST /exportaciones',
+                      post('/exportaciones?cohorte=bench&formatos=docx', None, headers=export_auth)))
+    return cases
+
+
+def _check(response):
+    # A shed page (429/503) is not the page being measured
+    if response.status_code >= 500 or response.status_code == 429:
+        raise RuntimeError(f'{response.request.path} returned {response.status_code}')
+    response.get_data()
+    return response
+
+
+def compare(results, baseline, tolerance, p99_tolerance):
+    """Return a list of human-readable regressions against ``baseline``"""
+    regressions = []
+    for name, current in results['cases'].items():
+        reference = baseline.get('cases', {}).get(name)
+        if not reference:
+            continue
+        if current['ops_per_sec'] < reference['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f'{name}: ops/sec {current["ops_per_sec"]} < baseline {reference["ops_per_sec"]}')
+        if current['p99_us'] > reference['p99_us'] * (1 + p99_tolerance):
+            regressions.append(f'{name}: p99 {current["p99_us"]}us > baseline {reference["p99_us"]}us')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this text')
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Compare against this results JSON and fail on regressions')
+    parser.add_argument('--update-baseline', action='store_true', help=f'Overwrite {BASELINE_PATH}')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed ops/sec drop (fraction)')
+    parser.add_argument('--p99-tolerance', type=float, default=0.5, help='Allowed p99 increase (fraction)')
+    args = parser.parse_args()
+    # Route cases chdir into a scratch directory, so resolve user paths first
+    args.output = args.output and os.path.abspath(args.output)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+
+    workdir = tempfile.mkdtemp(prefix='thesis_bench_')
+    cases = generator_cases() + route_cases(workdir)
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'iterations': args.iterations,
+        },
+        'cases': {}
+    }
+
+    print(f'{"case":<62} {"ops/s":>10} {"p50 us":>9} {"p99 us":>9} {"alloc B":>9}')
+    for case in cases:
+        if args.filter not in case.name:
+            continue
+        stats = measure(case, args.iterations, args.warmup)
+        results['cases'][case.name] = stats
+        print(f'{case.name:<62} {stats["ops_per_sec"]:>10} {stats["p50_us"]:>9} '
+              f'{stats["p99_us"]:>9} {stats["peak_alloc_bytes_per_call"]:>9}')
+
+    output = BASELINE_PATH if args.update_baseline else args.output
+    if output:
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, indent=2, ensure_ascii=False)
+            handle.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as handle:
+            regressions = compare(results, json.load(handle), args.tolerance, args.p99_tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
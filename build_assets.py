@@ -0,0 +1,160 @@
+"""Bundle, minify, fingerprint and precompress the static assets.
+
+Concatenates the sources listed in assets.ASSET_BUNDLES into one CSS and one
+JS file named after their content hash, writes gzip (and brotli, when the
+``brotli`` package is installed) variants next to them and records the
+names in a manifest read by the app at startup.
+
+The third-party files (assets.VENDOR_SOURCES) are not kept in the
+repository; ``--fetch`` downloads the ones missing from static/vendor/, so
+a clean checkout builds with it and the built bundle serves everything
+locally.
+
+    python build_assets.py --fetch    # vendor missing third-party files first
+    python build_assets.py            # rebuild from the files already vendored
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import urllib.request
+
+from assets import ASSET_BUNDLES, MANIFEST_NAME, VENDOR_SOURCES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_CSS_PRESERVED = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/)''', re.S)
+_CSS_TIGHT = re.compile(r'\s*([{};,])\s*')
+
+
+def minify_css(text):
+    """Drop comments (except /*! licenses) and redundant whitespace, leaving strings untouched"""
+    out = []
+    plain = []
+
+    def flush():
+        out.append(_CSS_TIGHT.sub(r'\1', re.sub(r'\s+', ' ', ''.join(plain))))
+        plain.clear()
+
+    for index, token in enumerate(_CSS_PRESERVED.split(text)):
+        if index % 2 == 0:
+            plain.append(token)
+        elif token.startswith('/*') and not token.startswith('/*!'):
+            plain.append(' ')
+        else:
+            flush()
+            out.append(token)
+    flush()
+    return ''.join(out).replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Line-level minification: strip indentation, blank lines and whole-line // comments
+
+    Newlines are kept so automatic semicolon insertion behaves as in the source.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def fetch_vendor(static_dir):
+    for source, url in VENDOR_SOURCES.items():
+        path = os.path.join(static_dir, source)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f'fetching {url}')
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+        except OSError as exc:
+            raise SystemExit(f'could not fetch {source} from {url}: {exc}')
+        if not data:
+            raise SystemExit(f'could not fetch {source} from {url}: empty response')
+        # Written under a temporary name, so an interrupted download is fetched again next time
+        with open(path + '.tmp', 'wb') as handle:
+            handle.write(data)
+        os.replace(path + '.tmp', path)
+
+
+def bundle(static_dir, name, sources):
+    pieces = []
+    for source in sources:
+        path = os.path.join(static_dir, source)
+        if not os.path.exists(path):
+            raise SystemExit(f'{source} is missing; run build_assets.py --fetch to vendor it')
+        with open(path, encoding='utf-8') as handle:
+            text = handle.read()
+        if '.min.' not in source:
+            text = minify_css(text) if name.endswith('.css') else minify_js(text)
+        pieces.append(text.strip())
+    # The semicolon guards against a source ending without one
+    separator = '\n' if name.endswith('.css') else ';\n'
+    return (separator.join(pieces) + '\n').encode('utf-8')
+
+
+def write_variants(dist_dir, filename, data):
+    with open(os.path.join(dist_dir, filename), 'wb') as handle:
+        handle.write(data)
+    with open(os.path.join(dist_dir, filename + '.gz'), 'wb') as handle:
+        # mtime=0 keeps the output byte-for-byte reproducible
+        handle.write(gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        with open(os.path.join(dist_dir, filename + '.br'), 'wb') as handle:
+            handle.write(brotli.compress(data, quality=11))
+
+
+def build(static_dir, dist_dir):
+    """Build every bundle into ``dist_dir`` and return the manifest"""
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+    for name, sources in ASSET_BUNDLES.items():
+        data = bundle(static_dir, name, sources)
+        stem, ext = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        write_variants(dist_dir, filename, data)
+        manifest[name] = filename
+        print(f'{name} -> {filename} ({len(data)} bytes)')
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+    # Remove bundles from earlier builds
+    current = set(manifest.values())
+    for entry in os.listdir(dist_dir):
+        base = re.sub(r'\.(gz|br)$', '', entry)
+        if entry != MANIFEST_NAME and base not in current:
+            os.remove(os.path.join(dist_dir, entry))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--static', default=os.path.join(ROOT, 'static'), help='Static source directory')
+    parser.add_argument('--dist', default=os.environ.get('ASSET_DIST_DIR', os.path.join(ROOT, 'static', 'dist')),
+                        help='Output directory')
+    parser.add_argument('--fetch', action='store_true', help='Download vendor files missing from static/vendor')
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_vendor(args.static)
+    if brotli is None:
+        print('brotli not installed; writing gzip variants only', file=sys.stderr)
+    build(args.static, args.dist)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import base64
+import hashlib
+import zlib
+
+import msgspec
+from flask import current_app, request, session
+from flask.sessions import SessionInterface
+from itsdangerous import BadSignature, TimestampSigner
+from markupsafe import Markup, escape
+
+STATE_VERSION = 'v1'
+STATE_FIELD = '_state'
+
+# Wire format: "v1." + base64url(flag byte + msgpack, zlib'd when smaller) + signer suffix
+_RAW = b'\x00'
+_ZLIB = b'\x01'
+
+
+class ClientStateCodec:
+    """Packs the wizard state into a compact, signed, versioned token"""
+
+    def __init__(self, secret_key, max_bytes=3800, max_age=None, max_decoded_bytes=256 * 1024):
+        self.signer = TimestampSigner(secret_key, salt=f'wizard-state-{STATE_VERSION}',
+                                      digest_method=hashlib.sha256)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_decoded_bytes = max_decoded_bytes
+        self._encoder = msgspec.msgpack.Encoder()
+        self._decoder = msgspec.msgpack.Decoder(dict)
+
+    def encode(self, state):
+        """Return the token for ``state``, or None when it exceeds ``max_bytes``"""
+        packed = self._encoder.encode(state)
+        compressed = zlib.compress(packed, 9)
+        body = _ZLIB + compressed if len(compressed) < len(packed) else _RAW + packed
+        encoded = base64.urlsafe_b64encode(body).rstrip(b'=')
+        token = f'{STATE_VERSION}.'.encode() + self.signer.sign(encoded)
+        if len(token) > self.max_bytes:
+            return None
+        return token.decode('ascii')
+
+    def decode(self, token):
+        """Return the state dict carried by ``token``, or None if it is unusable"""
+        if not token or len(token) > self.max_bytes:
+            return None
+        version, _, signed = token.partition('.')
+        if version != STATE_VERSION:
+            return None
+        try:
+            encoded = self.signer.unsign(signed.encode('ascii'), max_age=self.max_age)
+            body = base64.urlsafe_b64decode(encoded + b'=' * (-len(encoded) % 4))
+            payload = body[1:]
+            if body[:1] == _ZLIB:
+                inflater = zlib.decompressobj()
+                payload = inflater.decompress(payload, self.max_decoded_bytes)
+                if inflater.unconsumed_tail:
+                    return None
+            elif body[:1] != _RAW:
+                return None
+            return self._decoder.decode(payload)
+        except (BadSignature, ValueError, UnicodeEncodeError, zlib.error, msgspec.DecodeError):
+            return None
+
+
+class ClientStateSessionInterface(SessionInterface):
+    """Keeps the wizard state in a signed client-side token when it fits
+
+    Requests carrying a valid token (cookie or ``_state`` form field) are
+    served without touching the server store. When the state outgrows the
+    token size limit, typically because of a long pasted matrix, it is saved
+    through the wrapped server-side interface instead.
+    """
+
+    def __init__(self, server_interface, codec, cookie_name='tm_state'):
+        self.server = server_interface
+        self.codec = codec
+        self.cookie_name = cookie_name
+
+    def open_session(self, app, request):
+        token = request.cookies.get(self.cookie_name)
+        if token is None and request.method == 'POST':
+            token = request.form.get(STATE_FIELD)
+        state = self.codec.decode(token) if token else None
+        if state is not None:
+            session = self.server.session_class(state, sid=self.server._generate_sid(self.server.sid_length),
+                                                permanent=self.server.permanent)
+            session.client_state = True
+            return session
+        session = self.server.open_session(app, request)
+        session.client_state = False
+        return session
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified:
+                response.delete_cookie(self.cookie_name, domain=domain, path=path)
+                self.server.save_session(app, session, response)
+            return
+
+        token = self.codec.encode(dict(session))
+        if token is None:
+            # Too large for the client: fall back to server-side storage
+            if request.cookies.get(self.cookie_name) is not None:
+                response.delete_cookie(self.cookie_name, domain=domain, path=path)
+                session.modified = True
+            self.server.save_session(app, session, response)
+            return
+
+        server_cookie = app.config['SESSION_COOKIE_NAME']
+        if not session.client_state and request.cookies.get(server_cookie):
+            # State moved back to the client; drop the server-side copy
+            self.server._delete_session(self.server._get_store_id(session.sid))
+            response.delete_cookie(server_cookie, domain=domain, path=path)
+        elif session.client_state and not session.modified:
+            return
+
+        response.set_cookie(
+            self.cookie_name,
+            token,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+        response.vary.add('Cookie')
+
+
+def state_field():
+    """Hidden form input carrying the state token, for clients without cookies"""
+    interface = current_app.session_interface
+    if not isinstance(interface, ClientStateSessionInterface) or not session:
+        return Markup('')
+    token = interface.codec.encode(dict(session))
+    if token is None:
+        return Markup('')
+    return Markup(f'<input type="hidden" name="{STATE_FIELD}" value="{escape(token)}">')
@@ -0,0 +1,386 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import textwrap
+import zipfile
+from html import escape
+
+from results_builder import json_default
+
+# Bump when the rendered layout changes so cached artifacts are not reused
+EXPORT_VERSION = 1
+
+EXPORT_FORMATS = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'pdf': 'application/pdf',
+    'csv': 'text/csv',
+    'json': 'application/json'
+}
+
+SUMMARY_FIELDS = (
+    ('tipo_tesis', 'Tipo de Tesis'),
+    ('enfoque', 'Enfoque Metodológico'),
+    ('diseno', 'Diseño de Investigación'),
+    ('lugar', 'Lugar de Estudio'),
+    ('publico', 'Población Objetivo'),
+    ('periodo', 'Período de Estudio'),
+    ('tema_delimitado', 'Tema Delimitado'),
+    ('problema_mod', 'Problema de Investigación')
+)
+
+CHUNK_SIZE = 16 * 1024
+
+
+def build_document(session_data, results):
+    """Collect the exported content: summary fields plus the generated results"""
+    return {
+        'resumen': {field: session_data.get(field) for field, _ in SUMMARY_FIELDS if session_data.get(field)},
+        'matriz_consistencia': results.get('matriz'),
+        'titulos': results.get('titulos'),
+        'matriz_operacionalizacion': results.get('matriz_operacionalizacion')
+    }
+
+
+def content_hash(fmt, document):
+    raw = json.dumps([EXPORT_VERSION, fmt, document], ensure_ascii=False, sort_keys=True,
+                     separators=(',', ':'), default=json_default)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+# Layout shared by the CSV, DOCX and PDF writers: a flat stream of
+# ('heading', text), ('field', section, label, text) and ('item', section, label, text)
+
+def iter_blocks(document):
+    resumen = document['resumen']
+    if resumen:
+        yield ('heading', 'Resumen de tu Investigación')
+        for field, label in SUMMARY_FIELDS:
+            if field in resumen:
+                yield ('field', 'Resumen', label, resumen[field])
+
+    matriz = document['matriz_consistencia']
+    if matriz:
+        section = 'Matriz de Consistencia'
+        yield ('heading', section)
+        yield ('field', section, 'Problema General', matriz.get('problema_general'))
+        yield ('field', section, 'Objetivo General', matriz.get('objetivo_general'))
+        yield ('field', section, 'Hipótesis General', matriz.get('hipotesis_general'))
+        for variable in matriz.get('variables') or ():
+            yield ('item', section, 'Variables/Categorías', variable)
+        metodologia = matriz.get('metodologia') or {}
+        for key, label in (('enfoque', 'Enfoque'), ('tipo', 'Tipo'), ('poblacion', 'Población'),
+                           ('muestra', 'Muestra'), ('tecnicas', 'Técnicas'), ('instrumentos', 'Instrumentos')):
+            yield ('field', section, f'Metodología - {label}', metodologia.get(key))
+
+    titulos = document['titulos']
+    if titulos:
+        section = 'Propuestas de Títulos'
+        yield ('heading', section)
+        for titulo in titulos:
+            yield ('field', section, f'Opción {titulo["numero"]}', titulo['titulo'])
+            yield ('item', section, 'Justificación', titulo['justificacion'])
+
+    matriz_op = document['matriz_operacionalizacion']
+    if matriz_op:
+        yield ('heading', 'Matriz de Operacionalización')
+        for elemento in matriz_op:
+            if elemento.get('variable'):
+                section = elemento['variable']
+                fields = (('definicion_conceptual', 'Definición Conceptual'),
+                          ('definicion_operacional', 'Definición Operacional'),
+                          ('dimensiones', 'Dimensiones'), ('indicadores', 'Indicadores'),
+                          ('elementos_items', 'Ítems'), ('escala', 'Escala de Medición'),
+                          ('instrumento', 'Instrumento'))
+            else:
+                section = elemento.get('categoria')
+                fields = (('definicion_conceptual', 'Definición Conceptual'),
+                          ('subcategorias', 'Subcategorías'), ('indicadores', 'Indicadores'),
+                          ('preguntas_guia', 'Preguntas Guía'), ('tecnica', 'Técnica'),
+                          ('instrumento', 'Instrumento'))
+            yield ('heading', section)
+            for key, label in fields:
+                value = elemento.get(key)
+                if isinstance(value, (list, tuple)):
+                    for entry in value:
+                        yield ('item', section, label, entry)
+                else:
+                    yield ('field', section, label, value)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def drain(self, force=False):
+        if self._chunks and (force or self._size >= CHUNK_SIZE):
+            data = b''.join(self._chunks)
+            self._chunks.clear()
+            self._size = 0
+            return data
+        return b''
+
+
+def iter_json(document):
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=2, default=json_default)
+    buffer = []
+    size = 0
+    for piece in encoder.iterencode(document):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer.clear()
+            size = 0
+    buffer.append('\n')
+    yield ''.join(buffer).encode('utf-8')
+
+
+def iter_csv(document):
+    line = io.StringIO()
+    writer = csv.writer(line)
+    # BOM so spreadsheet software detects UTF-8
+    yield '\ufeff'.encode('utf-8')
+    writer.writerow(['seccion', 'campo', 'valor'])
+    for block in iter_blocks(document):
+        if block[0] == 'heading':
+            continue
+        _, section, label, value = block
+        writer.writerow([section, label, '' if value is None else value])
+        if line.tell() >= CHUNK_SIZE:
+            yield line.getvalue().encode('utf-8')
+            line.seek(0)
+            line.truncate()
+    yield line.getvalue().encode('utf-8')
+
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def _docx_paragraph(text, bold=False, size=None, indent=False):
+    props = ''
+    if bold or size:
+        props = '<w:rPr>' + ('<w:b/>' if bold else '') + (f'<w:sz w:val="{size}"/>' if size else '') + '</w:rPr>'
+    ppr = '<w:pPr><w:ind w:left="360"/></w:pPr>' if indent else ''
+    return f'<w:p>{ppr}<w:r>{props}<w:t xml:space="preserve">{escape(str(text), quote=False)}</w:t></w:r></w:p>'
+
+
+def _docx_body(document):
+    yield ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>')
+    yield _docx_paragraph('TesisPlan Asistente - Plan de Tesis', bold=True, size=36)
+    last_label = None
+    for block in iter_blocks(document):
+        if block[0] == 'heading':
+            last_label = None
+            yield _docx_paragraph(block[1], bold=True, size=28)
+        elif block[0] == 'field':
+            last_label = None
+            yield f'<w:p><w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">{escape(block[2], quote=False)}: </w:t></w:r>' \
+                  f'<w:r><w:t xml:space="preserve">{escape(str(block[3] or ""), quote=False)}</w:t></w:r></w:p>'
+        else:
+            if block[2] != last_label:
+                last_label = block[2]
+                yield _docx_paragraph(f'{block[2]}:', bold=True)
+            yield _docx_paragraph(f'• {block[3]}', indent=True)
+    yield '<w:sectPr><w:pgSz w:w="11906" w:h="16838"/></w:sectPr></w:body></w:document>'
+
+
+def iter_docx(document):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _DOCX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _DOCX_RELS)
+        with archive.open('word/document.xml', 'w') as part:
+            for piece in _docx_body(document):
+                part.write(piece.encode('utf-8'))
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+    yield sink.drain(force=True)
+
+
+# Minimal PDF writer: A4 pages, built-in Helvetica fonts, WinAnsi (cp1252) text
+_PDF_PAGE_WIDTH, _PDF_PAGE_HEIGHT = 595, 842
+_PDF_MARGIN = 56
+_PDF_WRAP = 92
+
+
+def _pdf_text(text):
+    raw = str(text).encode('cp1252', errors='replace')
+    return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _pdf_lines(document):
+    """Yield (font, size, text) lines already wrapped to the page width"""
+    yield ('F2', 16, 'TesisPlan Asistente - Plan de Tesis')
+    last_label = None
+    for block in iter_blocks(document):
+        if block[0] == 'heading':
+            last_label = None
+            yield ('F2', 10, '')
+            yield ('F2', 12, block[1])
+            continue
+        if block[0] == 'field':
+            last_label = None
+            text = f'{block[2]}: {block[3] or ""}'
+        else:
+            if block[2] != last_label:
+                last_label = block[2]
+                yield ('F2', 10, f'{block[2]}:')
+            text = f'   - {block[3]}'
+        for wrapped in textwrap.wrap(text, _PDF_WRAP, subsequent_indent='     ') or ['']:
+            yield ('F1', 10, wrapped)
+
+
+def _pdf_pages(document):
+    """Group lines into per-page content streams"""
+    top = _PDF_PAGE_HEIGHT - _PDF_MARGIN
+    y = top
+    ops = []
+    for font, size, text in _pdf_lines(document):
+        leading = size + 4
+        if y - leading < _PDF_MARGIN and ops:
+            yield b'\n'.join(ops)
+            ops = []
+            y = top
+        y -= leading
+        ops.append(b'BT /%s %d Tf %d %d Td (%s) Tj ET' % (font.encode(), size, _PDF_MARGIN, y, _pdf_text(text)))
+    if ops:
+        yield b'\n'.join(ops)
+
+
+def iter_pdf(document):
+    offsets = {}
+    position = 0
+
+    def emit(data):
+        nonlocal position
+        position += len(data)
+        return data
+
+    def obj(number, body):
+        offsets[number] = position
+        return emit(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    # 1: catalog, 2: page tree (written last), 3-4: fonts, 5+: page/content pairs
+    yield emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield obj(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    yield obj(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+
+    page_numbers = []
+    number = 5
+    for content in _pdf_pages(document):
+        page_numbers.append(number)
+        yield obj(number, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                          b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>'
+                  % (_PDF_PAGE_WIDTH, _PDF_PAGE_HEIGHT, number + 1))
+        yield obj(number + 1, b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+        number += 2
+
+    kids = b' '.join(b'%d 0 R' % n for n in page_numbers)
+    yield obj(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_numbers)))
+
+    xref_offset = position
+    xref = [b'xref\n0 %d\n' % number, b'0000000000 65535 f \n']
+    xref.extend(b'%010d 00000 n \n' % offsets[n] for n in range(1, number))
+    yield b''.join(xref)
+    yield b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (number, xref_offset)
+
+
+WRITERS = {
+    'docx': iter_docx,
+    'pdf': iter_pdf,
+    'csv': iter_csv,
+    'json': iter_json
+}
+
+
+class ExportCache:
+    """Rendered exports stored on disk under their content hash"""
+
+    def __init__(self, directory, max_files=512):
+        self.directory = directory
+        self.max_files = max_files
+
+    def path_for(self, fmt, digest):
+        return os.path.join(self.directory, f'{digest}.{fmt}')
+
+    def open(self, fmt, document):
+        """Open the rendered artifact for reading, rendering it on a cache miss
+
+        Returns the open file and its content hash. The file stays readable even if
+        another request prunes it before the download finishes.
+        """
+        digest = content_hash(fmt, document)
+        path = self.path_for(fmt, digest)
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return self._render(fmt, document, path), digest
+        # Hits refresh the mtime, so pruning drops the least recently used exports
+        os.utime(handle.fileno())
+        return handle, digest
+
+    def _render(self, fmt, document, path):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        handle = os.fdopen(fd, 'w+b')
+        try:
+            for chunk in WRITERS[fmt](document):
+                handle.write(chunk)
+            handle.seek(0)
+            os.replace(tmp_path, path)
+        except BaseException:
+            handle.close()
+            os.unlink(tmp_path)
+            raise
+        self._prune()
+        return handle
+
+    def _prune(self):
+        entries = [entry for entry in os.scandir(self.directory) if not entry.name.endswith('.tmp')]
+        if len(entries) <= self.max_files:
+            return
+        used = []
+        for entry in entries:
+            try:
+                used.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+        used.sort()
+        for _, path in used[:len(used) - self.max_files]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from thesis_generator import TITLE_COUNT, ThesisGenerator
+from thesis_spec import as_spec
+from topic_catalog import freeze
+
+# ThesisSpec fields read by each generator method. Only these take part in the
+# cache key, so inputs a method ignores never cause misses.
+_EXISTING_SLOTS = ('problema_general', 'objetivo_general', 'hipotesis', 'variables', 'enfoque', 'diseno',
+                   'poblacion', 'muestra', 'tecnicas', 'instrumentos')
+METHOD_SLOTS = {
+    'generate_consistency_matrix': ('tema', 'enfoque', 'diseno', 'problema', 'publico', 'lugar', 'periodo'),
+    'generate_thesis_titles': ('tema', 'enfoque', 'diseno', 'lugar', 'periodo', 'publico'),
+    'generate_operationalization_matrix': ('tema', 'enfoque'),
+    'generate_consistency_matrix_from_existing': _EXISTING_SLOTS,
+    'generate_thesis_titles_from_existing': ('tema', 'enfoque', 'diseno', 'variables'),
+    'generate_operationalization_matrix_from_existing': ('variables', 'enfoque'),
+}
+_FROM_EXISTING = {name for name in METHOD_SLOTS if name.endswith('_from_existing')}
+# Arguments after the spec each method gets from the result pages; they end its cache key
+DEFAULT_ARGS = {
+    'generate_thesis_titles': (TITLE_COUNT,),
+    'generate_thesis_titles_from_existing': (TITLE_COUNT,),
+}
+
+
+def method_spec(method_name, data):
+    """ThesisSpec ``method_name`` reads, built from ``data`` unless it already is one"""
+    return as_spec(data, from_matrix=method_name in _FROM_EXISTING)
+
+
+def spec_key(method_name, spec):
+    """Hashable in-process key: the method and the spec fields it reads"""
+    return (method_name,) + tuple(getattr(spec, slot) for slot in METHOD_SLOTS[method_name])
+
+
+def input_fingerprint(method_name, data):
+    """Canonical SHA-256 of the spec fields ``method_name`` reads, stable across processes"""
+    spec = method_spec(method_name, data)
+    raw = json.dumps(spec_key(method_name, spec), ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """Thread-safe bounded LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        # Values being computed, by key, so concurrent misses wait for one computation
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def __contains__(self, key):
+        """Whether ``key`` holds a live entry; leaves the counters and LRU order alone"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > self._clock()
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None, updating the counters"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """Return the cached value, computing and storing it on a miss
+
+        Concurrent misses on the same key wait for the first one's
+        computation (and get its exception if it fails) instead of repeating
+        it. Different keys are computed in parallel, outside the lock.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                # Stored between the miss above and taking the lock
+                return entry[1]
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = Future()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            return flight.result()
+        try:
+            value = factory()
+        except BaseException as exc:
+            flight.set_exception(exc)
+            raise
+        else:
+            self.set(key, value)
+            flight.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'coalesced': self.coalesced
+            }
+
+
+class CachedThesisGenerator(ThesisGenerator):
+    """ThesisGenerator that memoizes its public outputs in a GenerationCache
+
+    Cached results are frozen (read-only mappings and tuples) because the same
+    object is shared between every request that hits the entry.
+    """
+
+    def __init__(self, cache=None, knowledge=None):
+        super().__init__(knowledge)
+        self.cache = cache if cache is not None else GenerationCache()
+
+    def cache_key(self, method_name, spec, *args):
+        """Cache key of ``method_name`` for ``spec``; keyed on the knowledge version
+        too, so a hot reload never serves stale output"""
+        return (self.knowledge.version,) + spec_key(method_name, spec) + args
+
+    def _cached(self, method_name, data, *args):
+        # The spec is built once here and handed to the generator, so a miss does not normalize again
+        spec = method_spec(method_name, data)
+        method = getattr(super(), method_name)
+        return self.cache.get_or_create(self.cache_key(method_name, spec, *args),
+                                        lambda: freeze(method(spec, *args)))
+
+    def generate_consistency_matrix(self, spec):
+        return self._cached('generate_consistency_matrix', spec)
+
+    def generate_thesis_titles(self, spec, k=TITLE_COUNT):
+        return self._cached('generate_thesis_titles', spec, k)
+
+    def generate_operationalization_matrix(self, spec):
+        return self._cached('generate_operationalization_matrix', spec)
+
+    def generate_consistency_matrix_from_existing(self, spec):
+        return self._cached('generate_consistency_matrix_from_existing', spec)
+
+    def generate_thesis_titles_from_existing(self, spec, k=TITLE_COUNT):
+        return self._cached('generate_thesis_titles_from_existing', spec, k)
+
+    def generate_operationalization_matrix_from_existing(self, spec):
+        return self._cached('generate_operationalization_matrix_from_existing', spec)
@@ -0,0 +1,44 @@
+"""Production serving profile.
+
+    gunicorn -c gunicorn.conf.py
+
+One preloaded app forked into a worker per core, each running a thread pool
+(gthread). Every setting can be overridden from the environment; see
+benchmarks/bench_serving.py for how the defaults were chosen.
+"""
+import glob
+import multiprocessing
+import os
+
+wsgi_app = 'main:app'
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# The generator is pure Python, so beyond one process per core extra
+# processes only add memory; threads cover time spent on session I/O and
+# slow clients
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Load the app (templates, topic catalog, asset manifest) once in the
+# arbiter and share it copy-on-write with every worker
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def on_starting(server):
+    """Drop metric snapshots left by workers of a previous run"""
+    directory = os.environ.get('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'instance', 'metrics'))
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        os.remove(path)
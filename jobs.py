@@ -0,0 +1,327 @@
+import csv
+import glob
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+
+from exporters import WRITERS, build_document
+from projects import count_cohort, is_key, iter_cohort, new_key
+from results_builder import build_results
+from topic_catalog import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Formats already compressed inside are stored as they are
+_STORED_FORMATS = ('docx',)
+
+_COLUMNS = 'id, kind, params, status, total, done, error, size, attempts, created_at, updated_at'
+
+
+class LeaseLost(Exception):
+    """Another worker took the job over after this one stopped renewing its lease"""
+
+
+class _Progress:
+    """Progress callback handed to a job; each report also renews the job's lease
+
+    Reports are written at most once per ``interval`` seconds, and always
+    when the total changes.
+    """
+
+    def __init__(self, queue, job_id, lease, interval):
+        self.queue = queue
+        self.job_id = job_id
+        self.lease = lease
+        self.interval = interval
+        self._written = 0.0
+
+    def __call__(self, done, total=None):
+        now = time.monotonic()
+        if total is None and now - self._written < self.interval:
+            return
+        self._written = now
+        self.queue._report(self.job_id, self.lease, done, total)
+
+
+class JobQueue:
+    """Persistent queue of background jobs in a SQLite file, run by threads in every worker process
+
+    ``handlers`` maps a job kind to ``handler(params, path, progress)``,
+    which writes the job's result to ``path``. A worker claims a job with a
+    lease and renews it on every progress report; a job whose lease runs
+    out (its process was restarted or killed) goes back to the queue and
+    starts over in whichever worker claims it next, at most
+    ``max_attempts`` times. Results live in ``directory`` for ``keep``
+    seconds after the job ends.
+    """
+
+    def __init__(self, path, directory, handlers, workers=1, lease=60, poll_interval=2.0, max_attempts=3,
+                 keep=24 * 3600):
+        self.path = path
+        self.directory = directory
+        self.handlers = handlers
+        self.workers = workers
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.keep = keep
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._next_prune = 0.0
+        self._stats_lock = threading.Lock()
+        self._running = 0
+        self._finished = dict.fromkeys(('done', 'failed', 'resumed'), 0)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, '
+                         'total INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0, error TEXT, '
+                         'size INTEGER, attempts INTEGER NOT NULL DEFAULT 0, lease TEXT, lease_expires REAL, '
+                         'created_at REAL NOT NULL, updated_at REAL NOT NULL'
+                         ') WITHOUT ROWID')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def start(self):
+        """Start this process's worker threads, once per process (gunicorn forks after create_app)"""
+        if self._pid == os.getpid() or not self.workers:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Connections opened before a fork must not be shared with the parent
+            self._local = threading.local()
+            for number in range(self.workers):
+                threading.Thread(target=self._work, name=f'jobs-{number}', daemon=True).start()
+
+    def submit(self, kind, params):
+        """Queue a ``kind`` job and return it; an identical job still queued or running is returned instead"""
+        encoded = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        now = time.time()
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE kind = ? AND params = ? "
+                               f"AND status IN ('queued', 'running')", (kind, encoded)).fetchone()
+            if row is None:
+                job_id = new_key()
+                conn.execute('INSERT INTO jobs (id, kind, params, status, created_at, updated_at) '
+                             "VALUES (?, ?, ?, 'queued', ?, ?)", (job_id, kind, encoded, now, now))
+                row = conn.execute(f'SELECT {_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._wake.set()
+        return _job(row)
+
+    def get(self, job_id):
+        """Return the job with ``job_id`` as a dict, or None"""
+        if not is_key(job_id):
+            return None
+        row = self._conn.execute(f'SELECT {_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def result_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.zip')
+
+    def _claim(self):
+        """Lease the oldest queued job, or a running one whose lease ran out, and return (job, lease)"""
+        now = time.time()
+        conn = self._conn
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE status = 'queued' "
+                                   f"OR (status = 'running' AND lease_expires < ?) ORDER BY created_at LIMIT 1",
+                                   (now,)).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None, None
+                job = _job(row)
+                if job['attempts'] >= self.max_attempts:
+                    conn.execute("UPDATE jobs SET status = 'failed', error = ?, lease = NULL, updated_at = ? "
+                                 'WHERE id = ?', ('El trabajo se interrumpió demasiadas veces', now, job['id']))
+                    conn.execute('COMMIT')
+                    continue
+                lease = new_key()
+                conn.execute("UPDATE jobs SET status = 'running', lease = ?, lease_expires = ?, "
+                             'attempts = attempts + 1, done = 0, updated_at = ? WHERE id = ?',
+                             (lease, now + self.lease, now, job['id']))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            if job['status'] == 'running':
+                logger.warning('Resuming job %s after its worker stopped (attempt %d)', job['id'],
+                               job['attempts'] + 1)
+                with self._stats_lock:
+                    self._finished['resumed'] += 1
+            return job, lease
+
+    def _report(self, job_id, lease, done, total=None):
+        now = time.time()
+        cursor = self._conn.execute('UPDATE jobs SET done = ?, total = COALESCE(?, total), lease_expires = ?, '
+                                    "updated_at = ? WHERE id = ? AND lease = ? AND status = 'running'",
+                                    (done, total, now + self.lease, now, job_id, lease))
+        if cursor.rowcount == 0:
+            raise LeaseLost(job_id)
+
+    def _finish(self, job_id, lease, status, error=None, size=None):
+        cursor = self._conn.execute('UPDATE jobs SET status = ?, error = ?, size = ?, done = total, lease = NULL, '
+                                    "updated_at = ? WHERE id = ? AND lease = ? AND status = 'running'",
+                                    (status, error, size, time.time(), job_id, lease))
+        return cursor.rowcount > 0
+
+    def _work(self):
+        while True:
+            try:
+                job, lease = self._claim()
+                if job is None:
+                    self._prune()
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+                self._run(job, lease)
+            except Exception:
+                # The database was busy or unreadable; a lease, if taken, runs out and the job is retried
+                logger.exception('Job worker error')
+                time.sleep(self.poll_interval)
+
+    def _run(self, job, lease):
+        final = self.result_path(job['id'])
+        # A worker that was interrupted on this job may have left its partial file behind
+        for stale in glob.glob(f'{final}.*.tmp'):
+            os.unlink(stale)
+        tmp_path = f'{final}.{lease}.tmp'
+        with self._stats_lock:
+            self._running += 1
+        try:
+            self.handlers[job['kind']](job['params'], tmp_path, _Progress(self, job['id'], lease, self.lease / 4))
+            os.replace(tmp_path, final)
+            status, error, size = 'done', None, os.path.getsize(final)
+        except LeaseLost:
+            logger.warning('Job %s was taken over by another worker', job['id'])
+            status = None
+        except Exception as exc:
+            logger.exception('Job %s failed', job['id'])
+            status, error, size = 'failed', str(exc)[:500], None
+        finally:
+            with self._stats_lock:
+                self._running -= 1
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        if status is not None and self._finish(job['id'], lease, status, error, size):
+            with self._stats_lock:
+                self._finished[status] += 1
+
+    def _prune(self):
+        """Forget jobs that ended more than ``keep`` seconds ago and delete their results"""
+        now = time.time()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 60
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (now - self.keep,))]
+        for job_id in expired:
+            try:
+                os.unlink(self.result_path(job_id))
+            except FileNotFoundError:
+                pass
+            self._conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._finished, running=self._running)
+
+    def metric_samples(self):
+        """Samples for metrics.Registry.add_collector (this process's share; /metrics sums the workers)"""
+        stats = self.stats()
+        for event in ('done', 'failed', 'resumed'):
+            yield 'counter', 'thesis_jobs_total', {'event': event}, stats[event]
+        yield 'gauge', 'thesis_jobs_running', None, stats['running']
+
+
+def _job(row):
+    job = dict(zip(('id', 'kind', 'params', 'status', 'total', 'done', 'error', 'size', 'attempts', 'created_at',
+                    'updated_at'), row))
+    job['params'] = json.loads(job['params'])
+    return job
+
+
+def _slug(text, length=40):
+    return re.sub(r'[^a-z0-9]+', '-', normalize_text(text or ''))[:length].strip('-') or 'proyecto'
+
+
+def write_cohort_archive(path, cohort, formats, generator, progress):
+    """Write a ZIP with the exported plan of every project in ``cohort`` to ``path``
+
+    Projects are read in batches and each document is generated and
+    compressed straight into its archive entry, so no document is held
+    whole; only the archive's directory grows with the cohort.
+    ``indice.csv`` lists the entries.
+    """
+    total = count_cohort(cohort)
+    progress(0, total)
+    # The index grows with the cohort, so it waits on disk until the documents are written
+    index = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+    writer = csv.writer(index)
+    writer.writerow(['numero', 'proyecto', 'tema', 'creado', 'archivo', 'error'])
+    with index, zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for number, project in enumerate(iter_cohort(cohort), 1):
+            base = f'{number:04d}_{_slug(project.tema)}_{project.key[:8]}'
+            error = ''
+            try:
+                document = build_document(project.inputs, build_results(generator, project.inputs))
+                for fmt in formats:
+                    entry = zipfile.ZipInfo(f'{base}.{fmt}', date_time=project.created_at.timetuple()[:6])
+                    entry.compress_type = zipfile.ZIP_STORED if fmt in _STORED_FORMATS else zipfile.ZIP_DEFLATED
+                    with archive.open(entry, 'w') as handle:
+                        for chunk in WRITERS[fmt](document):
+                            handle.write(chunk)
+            except Exception as exc:
+                # One broken project is listed in the index instead of failing the whole cohort
+                logger.exception('Exporting project %s failed', project.key)
+                error = str(exc)[:200]
+            writer.writerow([number, project.key, project.tema, project.created_at.isoformat(),
+                             '' if error else base, error])
+            progress(number)
+        index.seek(0)
+        with io.TextIOWrapper(archive.open('indice.csv', 'w'), encoding='utf-8-sig', newline='') as handle:
+            shutil.copyfileobj(index, handle)
+
+
+def cohort_export(app, generator):
+    """Handler for 'cohort_export' jobs, run with ``app``'s project store"""
+    def run(params, path, progress):
+        with app.app_context():
+            write_cohort_archive(path, params['cohort'], params['formats'], generator, progress)
+    return run
@@ -0,0 +1,471 @@
+"""Domain knowledge compiled from knowledge/ into a shared, memory-mapped index.
+
+Content staff edit JSON (or YAML, when PyYAML is installed) files:
+
+    knowledge/generator.json        title verbs, justifications, qualitative
+                                    categories and fallback variables
+    knowledge/domains/*.json        one discipline per file (or a list of
+                                    them); file order breaks keyword ties
+
+compile_index() turns them into a single binary file holding the keyword
+automaton as flat uint32 arrays plus msgpack records. Every worker mmaps the
+same file, so the operating system keeps one copy in the page cache, and
+nothing is decoded until a domain is actually matched. KnowledgeBase watches
+the sources and swaps in a recompiled index without restarting workers.
+
+    python knowledge_base.py            # compile knowledge/ into the default index
+"""
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+
+import msgspec
+
+from topic_catalog import TopicMatcher, freeze, normalize_text
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms compile without a lock
+    fcntl = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE_DIR = os.path.join(ROOT, 'knowledge')
+DEFAULT_INDEX_PATH = os.path.join(ROOT, 'instance', 'knowledge.tkb')
+
+MAGIC = b'TKB1'
+FORMAT_VERSION = 1
+# magic, format version, source signature, node/edge/output/domain counts,
+# general record length, reserved
+_HEADER = struct.Struct('<4sI32s6I')
+_NODE_FIELDS = 5  # edge start, edge end, fail link, output start, output end
+# Automaton states decoded into dicts per process, at most
+HOT_STATES = 65536
+
+SOURCE_SUFFIXES = ('.json', '.yaml', '.yml')
+VARIABLE_ROLES = ('independiente', 'dependiente')
+VARIABLE_FIELDS = ('nombre', 'definicion_conceptual', 'definicion_operacional', 'dimensiones', 'indicadores', 'items')
+GENERAL_FIELDS = ('accion_palabras', 'accion_por_defecto', 'justificaciones_titulo', 'categorias_base',
+                  'variables_por_defecto', 'titulos')
+TITLE_FIELDS = ('plantillas', 'conectores', 'lugar', 'periodo', 'enfoque', 'peso_diseno', 'peso_orden_accion',
+                'palabras_ideales', 'penalizacion_palabra', 'longitud_maxima')
+TITLE_PLACEHOLDERS = ('accion', 'conector', 'tema', 'vi', 'vd', 'publico', 'lugar', 'periodo', 'enfoque')
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeError(ValueError):
+    """Raised when the knowledge sources or a compiled index are invalid"""
+
+
+def fill_template(value, **fields):
+    """Recursively substitute ``{name}`` placeholders in every string of ``value``"""
+    if isinstance(value, str):
+        return value.format_map(fields)
+    if hasattr(value, 'items'):
+        return {key: fill_template(item, **fields) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [fill_template(item, **fields) for item in value]
+    return value
+
+
+def _source_files(source_dir):
+    files = []
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(SOURCE_SUFFIXES):
+                files.append(os.path.join(dirpath, filename))
+    return files
+
+
+def source_signature(source_dir):
+    """Cheap change detector: hash of every source file's name, size and mtime"""
+    digest = hashlib.sha256()
+    for path in _source_files(source_dir):
+        stat = os.stat(path)
+        digest.update(f'{os.path.relpath(path, source_dir)}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.digest()
+
+
+@functools.lru_cache(maxsize=None)
+def _yaml():
+    """PyYAML, or None when it is not installed; only imported once a YAML source turns up"""
+    try:
+        import yaml
+    except ImportError:
+        return None
+    return yaml
+
+
+def _read_source(path):
+    if path.endswith('.json'):
+        parse, errors = json.load, (ValueError,)
+    else:
+        yaml = _yaml()
+        if yaml is None:
+            raise KnowledgeError(f'{path}: install PyYAML to use YAML knowledge files')
+        parse, errors = yaml.safe_load, (ValueError, yaml.YAMLError)
+    with open(path, encoding='utf-8') as handle:
+        try:
+            return parse(handle)
+        except errors as exc:
+            raise KnowledgeError(f'{path}: {exc}') from exc
+
+
+def _check_variables(variables, where):
+    if not isinstance(variables, dict):
+        raise KnowledgeError(f'{where}: "variables" must be an object')
+    for role in VARIABLE_ROLES:
+        variable = variables.get(role)
+        if not isinstance(variable, dict):
+            raise KnowledgeError(f'{where}: missing variable "{role}"')
+        missing = [field for field in VARIABLE_FIELDS if field not in variable]
+        if missing:
+            raise KnowledgeError(f'{where}: variable "{role}" lacks {", ".join(missing)}')
+
+
+def load_sources(source_dir):
+    """Read and validate the sources; return (general, [domain, ...]) in catalog order"""
+    general_path = None
+    domains = []
+    seen = {}
+    for path in _source_files(source_dir):
+        relative = os.path.relpath(path, source_dir)
+        if os.path.splitext(relative)[0] == 'generator':
+            general_path = path
+            continue
+        data = _read_source(path)
+        for position, domain in enumerate(data if isinstance(data, list) else [data]):
+            where = f'{relative}[{position}]' if isinstance(data, list) else relative
+            if not isinstance(domain, dict) or not isinstance(domain.get('key'), str):
+                raise KnowledgeError(f'{where}: each domain needs a string "key"')
+            keywords = domain.get('keywords')
+            if not keywords or not all(isinstance(keyword, str) and normalize_text(keyword) for keyword in keywords):
+                raise KnowledgeError(f'{where}: "keywords" must be a non-empty list of words')
+            _check_variables(domain.get('variables'), where)
+            if domain['key'] in seen:
+                raise KnowledgeError(f'{where}: domain "{domain["key"]}" already defined in {seen[domain["key"]]}')
+            seen[domain['key']] = where
+            domains.append({'key': domain['key'], 'keywords': list(keywords), 'variables': domain['variables']})
+
+    if general_path is None:
+        raise KnowledgeError(f'{source_dir}: generator.json not found')
+    general = _read_source(general_path)
+    missing = [field for field in GENERAL_FIELDS if field not in (general or {})]
+    if missing:
+        raise KnowledgeError(f'{general_path}: missing {", ".join(missing)}')
+    if general['accion_por_defecto'] not in general['accion_palabras']:
+        raise KnowledgeError(f'{general_path}: "accion_por_defecto" is not a key of "accion_palabras"')
+    _check_variables(general['variables_por_defecto'], general_path)
+    titles = general['titulos']
+    missing = [field for field in TITLE_FIELDS if field not in (titles or {})]
+    if missing:
+        raise KnowledgeError(f'{general_path}: "titulos" lacks {", ".join(missing)}')
+    try:
+        for template in general['justificaciones_titulo']:
+            template.format(enfoque='', diseno='')
+        fill_template(general['variables_por_defecto'], tema='')
+        for template in titles['plantillas']:
+            template['patron'].format(**dict.fromkeys(TITLE_PLACEHOLDERS, ''))
+        for field in ('lugar', 'periodo'):
+            for phrase in titles[field]:
+                phrase['texto'].format(**{field: ''})
+    except (KeyError, IndexError, ValueError, TypeError) as exc:
+        raise KnowledgeError(f'{general_path}: bad placeholder {exc}') from exc
+    return general, domains
+
+
+def _u32(values):
+    packed = array('I', values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def compile_index(source_dir, index_path):
+    """Compile ``source_dir`` into ``index_path`` atomically; return the domain count"""
+    signature = source_signature(source_dir)
+    general, domains = load_sources(source_dir)
+    matcher = TopicMatcher((position, domain['keywords']) for position, domain in enumerate(domains))
+
+    nodes, edge_chars, edge_targets, out_domains, out_weights = [], [], [], [], []
+    for state, transitions in enumerate(matcher._goto):
+        edge_start = len(edge_chars)
+        for ch in sorted(transitions):
+            edge_chars.append(ord(ch))
+            edge_targets.append(transitions[ch])
+        output_start = len(out_domains)
+        for position, weight in matcher._output[state]:
+            out_domains.append(position)
+            out_weights.append(weight)
+        nodes.extend((edge_start, len(edge_chars), matcher._fail[state], output_start, len(out_domains)))
+
+    encoder = msgspec.msgpack.Encoder()
+    general_blob = encoder.encode(general)
+    blob = bytearray(general_blob)
+    spans = []
+    for domain in domains:
+        record = encoder.encode(domain)
+        spans.extend((len(blob), len(blob) + len(record)))
+        blob += record
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, signature, len(matcher._goto), len(edge_chars),
+                          len(out_domains), len(domains), len(general_blob), 0)
+    directory = os.path.dirname(os.path.abspath(index_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(header)
+            for section in (nodes, edge_chars, edge_targets, out_domains, out_weights, spans):
+                handle.write(_u32(section))
+            handle.write(blob)
+        # Readers holding the old file keep their mapping; new opens see the new one
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(domains)
+
+
+class KnowledgeIndex:
+    """Read-only view over a compiled index file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            stat = os.fstat(handle.fileno())
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if len(self._map) < _HEADER.size:
+            raise KnowledgeError(f'{path}: truncated knowledge index')
+        (magic, version, self.signature, node_count, edge_count, output_count, domain_count,
+         general_length, _) = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise KnowledgeError(f'{path}: not a version {FORMAT_VERSION} knowledge index')
+
+        view = memoryview(self._map)
+        offset = _HEADER.size
+        sections = []
+        for count in (node_count * _NODE_FIELDS, edge_count, edge_count, output_count, output_count,
+                      domain_count * 2):
+            end = offset + count * 4
+            section = view[offset:end].cast('I')
+            if sys.byteorder != 'little':
+                swapped = array('I', section)
+                swapped.byteswap()
+                section = memoryview(swapped)
+            sections.append(section)
+            offset = end
+        self._nodes, self._edge_chars, self._edge_targets, self._out_domains, self._out_weights, self._spans = sections
+        self._blob = view[offset:]
+        if len(self._blob) < general_length or (domain_count and self._spans[-1] > len(self._blob)):
+            raise KnowledgeError(f'{path}: truncated knowledge index')
+
+        self._decoder = msgspec.msgpack.Decoder()
+        self.general = freeze(self._decoder.decode(self._blob[:general_length]))
+        self.domain_count = domain_count
+        # Only the automaton states topics actually reach, and the domains
+        # that actually get matched, are ever materialized in this process
+        self._hot = {}
+        self.domain = functools.lru_cache(maxsize=1024)(self._decode_domain)
+
+    def __len__(self):
+        return self.domain_count
+
+    @property
+    def version(self):
+        return self.signature.hex()[:16]
+
+    def _decode_domain(self, position):
+        start, end = self._spans[2 * position], self._spans[2 * position + 1]
+        return freeze(self._decoder.decode(self._blob[start:end]))
+
+    def _state(self, state):
+        """Return (transitions, fail link, outputs) for ``state``, caching visited states as dicts"""
+        entry = self._hot.get(state)
+        if entry is None:
+            base = state * _NODE_FIELDS
+            nodes = self._nodes
+            start, end = nodes[base], nodes[base + 1]
+            transitions = dict(zip(map(chr, self._edge_chars[start:end]), self._edge_targets[start:end]))
+            outputs = tuple(zip(self._out_domains[nodes[base + 3]:nodes[base + 4]],
+                                self._out_weights[nodes[base + 3]:nodes[base + 4]]))
+            entry = (transitions, nodes[base + 2], outputs)
+            if len(self._hot) < HOT_STATES:
+                self._hot[state] = entry
+        return entry
+
+    def scores(self, text, folded=False):
+        """Return {domain position: score}, where each keyword hit adds its length
+
+        Pass ``folded=True`` when ``text`` is already normalize_text() output.
+        """
+        hot, load = self._hot, self._state
+        totals = {}
+        state = 0
+        transitions, fail, outputs = hot.get(0) or load(0)
+        for ch in text if folded else normalize_text(text):
+            while state and ch not in transitions:
+                state = fail
+                transitions, fail, outputs = hot.get(state) or load(state)
+            next_state = transitions.get(ch)
+            if next_state is None:
+                # Only reachable at the root: stay there
+                continue
+            state = next_state
+            transitions, fail, outputs = hot.get(state) or load(state)
+            for position, weight in outputs:
+                totals[position] = totals.get(position, 0) + weight
+        return totals
+
+    def best(self, text, folded=False):
+        """Return the position of the highest scoring domain, earlier files winning ties"""
+        totals = self.scores(text, folded)
+        if not totals:
+            return None
+        return max(totals, key=lambda position: (totals[position], -position))
+
+    def match(self, tema, folded=False):
+        """Return the suggested variables of the best matching domain, or None"""
+        position = self.best(tema, folded)
+        return self.domain(position)['variables'] if position is not None else None
+
+
+class KnowledgeBase:
+    """Always-current knowledge: recompiles changed sources and reopens the index
+
+    Every ``check_interval`` seconds the next access starts a background
+    refresh (requests keep using the current index meanwhile). Compilation is
+    serialized across processes with a lock file, so a pool of workers
+    compiles once and the others just reopen the new file. A broken edit is
+    logged once and the previous index keeps serving.
+    """
+
+    def __init__(self, source_dir=DEFAULT_SOURCE_DIR, index_path=DEFAULT_INDEX_PATH, check_interval=2.0,
+                 auto_compile=True, clock=time.monotonic):
+        self.source_dir = source_dir
+        self.index_path = index_path
+        self.check_interval = check_interval
+        self.auto_compile = auto_compile
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._index = None
+        self._failed_signature = None
+        self._next_check = 0.0
+        self.refresh()
+        if self._index is None:
+            raise KnowledgeError(f'No usable knowledge index at {index_path}')
+
+    @property
+    def index(self):
+        if self._clock() >= self._next_check and self._lock.acquire(blocking=False):
+            self._next_check = self._clock() + self.check_interval
+            threading.Thread(target=self._background_refresh, name='knowledge-refresh', daemon=True).start()
+        return self._index
+
+    @property
+    def version(self):
+        return self.index.version
+
+    def refresh(self):
+        """Check for changes now, on the calling thread"""
+        with self._lock:
+            self._refresh_locked()
+
+    def _background_refresh(self):
+        try:
+            self._refresh_locked()
+        finally:
+            self._lock.release()
+
+    def _refresh_locked(self):
+        self._next_check = self._clock() + self.check_interval
+        try:
+            if self.auto_compile and os.path.isdir(self.source_dir):
+                self._compile_if_stale()
+            if self._index is None or self._stamp() != self._index.stamp:
+                self._index = KnowledgeIndex(self.index_path)
+                logger.info('Loaded knowledge index %s (%d domains)', self.index_path, len(self._index))
+        except (OSError, KnowledgeError) as exc:
+            if self._index is None:
+                raise
+            logger.error('Keeping the current knowledge index: %s', exc)
+
+    def _stamp(self):
+        stat = os.stat(self.index_path)
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _on_disk_signature(self):
+        try:
+            with open(self.index_path, 'rb') as handle:
+                header = handle.read(_HEADER.size)
+            return _HEADER.unpack(header)[2] if len(header) == _HEADER.size else None
+        except OSError:
+            return None
+
+    def _compile_if_stale(self):
+        signature = source_signature(self.source_dir)
+        if signature == self._failed_signature or self._on_disk_signature() == signature:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        with open(self.index_path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another worker may have compiled while we waited for the lock
+            if self._on_disk_signature() != signature:
+                try:
+                    count = compile_index(self.source_dir, self.index_path)
+                except KnowledgeError:
+                    # Do not retry (and log) the same broken sources every interval
+                    self._failed_signature = signature
+                    raise
+                logger.info('Compiled %d knowledge domains into %s', count, self.index_path)
+
+    # Shortcuts used by ThesisGenerator
+
+    def match(self, tema, folded=False):
+        return self.index.match(tema, folded)
+
+    @property
+    def general(self):
+        return self.index.general
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_knowledge_base():
+    """Process-wide KnowledgeBase for generators created without one"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = KnowledgeBase(os.environ.get('KNOWLEDGE_DIR', DEFAULT_SOURCE_DIR),
+                                     os.environ.get('KNOWLEDGE_INDEX_PATH', DEFAULT_INDEX_PATH))
+        return _default
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the knowledge sources into a binary index')
+    parser.add_argument('--source', default=os.environ.get('KNOWLEDGE_DIR', DEFAULT_SOURCE_DIR))
+    parser.add_argument('--output', default=os.environ.get('KNOWLEDGE_INDEX_PATH', DEFAULT_INDEX_PATH))
+    args = parser.parse_args()
+    try:
+        count = compile_index(args.source, args.output)
+    except KnowledgeError as exc:
+        raise SystemExit(str(exc))
+    print(f'{count} domains -> {args.output} ({os.path.getsize(args.output)} bytes)')
+
+
+if __name__ == '__main__':
+    main()
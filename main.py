@@ -1 +1,9 @@
-from app import app
+import os
+
+from app import configure_logging, create_app
+
+configure_logging()
+app = create_app()
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get("FLASK_DEBUG", "0") == "1")
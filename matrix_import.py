@@ -0,0 +1,189 @@
+import csv
+import io
+import itertools
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from batch import EXISTING_FIELDS, SpecError, batch_defaults, spec_from_payload
+from topic_catalog import normalize_text
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_MIMETYPES = ('text/csv', 'application/csv')
+
+# Spreadsheet column -> spec field. Columns may use the full field name or a
+# short one ('enfoque', 'poblacion'), with spaces and accents in any form
+_COLUMNS = {'id': 'id', 'tipo_tesis': 'tipo_tesis', 'generar_titulos': 'generar_titulos',
+            'generar_matriz': 'generar_matriz', 'hipotesis': 'hipotesis_general'}
+for _field in EXISTING_FIELDS:
+    _COLUMNS[_field] = _field
+    _COLUMNS[_field.removeprefix('metodologia_').removesuffix('_general')] = _field
+_COLUMNS['diseno'] = 'metodologia_tipo'
+
+_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_RELATIONSHIPS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_DOCUMENT_RELATIONSHIPS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+
+def upload_format(filename, mimetype):
+    """'csv', 'xlsx' or 'jsonl' for an upload, by file extension first and content type second"""
+    extension = posixpath.splitext((filename or '').lower())[1]
+    if extension == '.xlsx' or (not extension and mimetype == XLSX_MIMETYPE):
+        return 'xlsx'
+    if extension == '.csv' or (not extension and mimetype in CSV_MIMETYPES):
+        return 'csv'
+    return 'jsonl'
+
+
+def _column(header):
+    return _COLUMNS.get('_'.join(normalize_text(header or '').split()))
+
+
+def _rows(header, cells):
+    """(row_number, {column: value}) for the data rows after ``header``; blank rows are skipped"""
+    columns = [_column(name) for name in header]
+    if not any(columns):
+        raise SpecError('La primera fila debe nombrar las columnas de la matriz (problema_general, variables, ...)')
+    return _values(columns, cells)
+
+
+def _values(columns, cells):
+    for row_number, row in cells:
+        if row is None:
+            yield row_number, None
+            continue
+        values = {column: value for column, value in zip(columns, row) if column and value and value.strip()}
+        if values:
+            yield row_number, values
+
+
+def iter_csv_rows(stream, max_cell_bytes=64 * 1024):
+    """Yield (row_number, values) from a CSV upload (binary stream) one row at a time
+
+    The delimiter is ';' when the header has more of them than commas, as in
+    spreadsheets saved with a Spanish locale. Cells may span lines. A row
+    with a cell longer than ``max_cell_bytes`` characters is yielded as None
+    (so is one past the csv module's own field limit, which is left alone:
+    it is shared by every reader in the process).
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    first = text.readline()
+    delimiter = ';' if first.count(';') > first.count(',') else ','
+    reader = csv.reader(itertools.chain([first], text), delimiter=delimiter)
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise SpecError('El archivo CSV está vacío') from None
+
+    def cells():
+        row_number = 1
+        while True:
+            row_number += 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error:
+                yield row_number, None
+                continue
+            yield row_number, None if any(len(cell) > max_cell_bytes for cell in row) else row
+
+    return _rows(header, cells())
+
+
+def _shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as handle:
+        events = iterparse(handle, ('start', 'end'))
+        _, root = next(events)
+        for event, element in events:
+            if event == 'end' and element.tag == _MAIN + 'si':
+                strings.append(''.join(text.text or '' for text in element.iter(_MAIN + 't')))
+                root.clear()
+    return strings
+
+
+def _first_sheet(archive):
+    """Path of the first worksheet in the workbook's sheet order"""
+    with archive.open('xl/workbook.xml') as handle:
+        sheet = next(element for _, element in iterparse(handle) if element.tag == _MAIN + 'sheet')
+    relation = sheet.get(_DOCUMENT_RELATIONSHIPS + 'id')
+    with archive.open('xl/_rels/workbook.xml.rels') as handle:
+        for _, element in iterparse(handle):
+            if element.tag == _RELATIONSHIPS + 'Relationship' and element.get('Id') == relation:
+                target = element.get('Target')
+                return target.lstrip('/') if target.startswith('/') else posixpath.normpath('xl/' + target)
+    raise KeyError(relation)
+
+
+def _column_index(reference):
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index - 1
+
+
+def _sheet_rows(archive, path, strings):
+    """(row_number, cells) of a worksheet, parsed incrementally and cleared row by row"""
+    with archive.open(path) as handle:
+        parent, row_number = None, 0
+        for event, element in iterparse(handle, ('start', 'end')):
+            if event == 'start':
+                if element.tag == _MAIN + 'sheetData':
+                    parent = element
+                continue
+            if element.tag != _MAIN + 'row':
+                continue
+            cells = []
+            for cell in element.iter(_MAIN + 'c'):
+                kind = cell.get('t')
+                if kind == 'inlineStr':
+                    value = ''.join(text.text or '' for text in cell.iter(_MAIN + 't'))
+                else:
+                    value = cell.findtext(_MAIN + 'v') or ''
+                    if kind == 's' and value:
+                        value = strings[int(value)]
+                reference = cell.get('r')
+                index = _column_index(reference) if reference else len(cells)
+                cells.extend([''] * (index - len(cells)))
+                cells.append(value)
+            row_number = int(element.get('r') or row_number + 1)
+            yield row_number, cells
+            # Drop the finished row from the tree, so memory stays flat over the sheet
+            if parent is not None:
+                parent.clear()
+
+
+def iter_xlsx_rows(file):
+    """Yield (row_number, values) from the first sheet of an XLSX workbook (a seekable binary file)
+
+    The sheet is parsed incrementally, so memory is bounded by the largest
+    row and the workbook's shared strings rather than by the row count. The
+    workbook is opened before the first row is asked for, so a broken file
+    raises SpecError here and not halfway through a response.
+    """
+    try:
+        archive = zipfile.ZipFile(file)
+        strings = _shared_strings(archive)
+        rows = _sheet_rows(archive, _first_sheet(archive), strings)
+        header = next(rows, (0, []))[1]
+    except (zipfile.BadZipFile, KeyError, StopIteration, SyntaxError, ValueError) as exc:
+        raise SpecError(f'No se pudo leer el archivo XLSX: {exc}') from None
+    return _rows(header, rows)
+
+
+def parse_row(values):
+    """Turn one spreadsheet row into the session-shaped dict the generator expects"""
+    if values is None:
+        raise SpecError('Fila demasiado larga')
+    payload = {key: value for key, value in values.items() if key not in EXISTING_FIELDS}
+    payload['matriz_existente'] = {key: value for key, value in values.items() if key in EXISTING_FIELDS}
+    if not payload['matriz_existente'].get('variables'):
+        raise SpecError('La fila no tiene variables')
+    # The row is the student's own consistency matrix, so show it instead of generating one
+    payload.setdefault('generar_matriz', 'no')
+    return payload.get('id'), batch_defaults(spec_from_payload(payload))
@@ -0,0 +1,172 @@
+import io
+import re
+from dataclasses import dataclass
+
+from topic_catalog import normalize_text
+
+# Variable roles, checked in this order ('independiente' contains 'dependiente')
+ROLES = ('independiente', 'dependiente', 'interviniente', 'moderadora', 'control')
+
+# List markers stripped before a line is read: '-', '*', '•', '1.', '2)', 'a)'
+_BULLET = re.compile(r'(?:[-*•·–]|\d{1,3}[.)]|[a-zA-Z][.)](?=\s))\s*')
+# Labels that start a variable, and its role when the label is an abbreviation
+_VARIABLE_LABEL = re.compile(r'(variables?|categorias?|v[id]|v\d+)\b')
+_ABBREVIATED_ROLES = {'vi': 'independiente', 'vd': 'dependiente'}
+
+
+@dataclass(frozen=True, slots=True)
+class Dimension:
+    """A dimension (or subcategory) and the indicators listed under it"""
+
+    nombre: str
+    indicadores: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class Variable:
+    """A variable (or category of analysis) read from a pasted matrix"""
+
+    nombre: str
+    rol: str = ''
+    dimensiones: tuple[Dimension, ...] = ()
+
+
+class _Builder:
+    """Mutable state of one parse; frozen into Variables as each one ends"""
+
+    def __init__(self):
+        self.variables = []
+        self._nombre = None
+        self._rol = ''
+        self._dimensiones = []
+        self._indicadores = None
+        self._indent = 0
+        self._child_indent = None
+        # (role, indent) of a label listing its variables on the lines below ('Variables de control:')
+        self.listing = ('', -1)
+
+    def _close_dimension(self):
+        if self._indicadores is not None:
+            self._dimensiones[-1] = Dimension(self._dimensiones[-1], tuple(self._indicadores))
+            self._indicadores = None
+
+    def close(self):
+        if self._nombre is None:
+            return
+        self._close_dimension()
+        self.variables.append(Variable(self._nombre, self._rol, tuple(self._dimensiones)))
+        self._nombre = None
+
+    def variable(self, nombre, rol='', indent=0):
+        self.close()
+        self._nombre, self._rol, self._dimensiones = nombre, rol, []
+        self._indent, self._child_indent = indent, None
+
+    def dimension(self, nombre):
+        if self._nombre is None:
+            self.variable('')
+        self._close_dimension()
+        self._dimensiones.append(nombre)
+        self._indicadores = []
+
+    def indicator(self, nombre):
+        if self._indicadores is None:
+            self.dimension('')
+        self._indicadores.append(nombre)
+
+    def child(self, text, indent):
+        """An unlabeled line indented under the current variable: a dimension, or an indicator one level deeper"""
+        if self._child_indent is None or indent < self._child_indent:
+            self._child_indent = indent
+        if indent > self._child_indent and self._indicadores is not None:
+            self.indicator(text)
+        else:
+            self.dimension(text)
+
+    def nested(self, indent):
+        return self._nombre is not None and indent > self._indent
+
+
+def _role(label):
+    return next((role for role in ROLES if role in label), '')
+
+
+def _names(value, plural):
+    """Names given after a label; a plural label ('Dimensiones:') may list several, split on ';' or else ','"""
+    if not plural:
+        return [value] if value else []
+    return [name.strip() for name in value.split(';' if ';' in value else ',') if name.strip()]
+
+
+def _read_line(builder, line):
+    stripped = line.lstrip()
+    if not stripped:
+        return
+    prefix = line[:len(line) - len(stripped)]
+    indent = len(prefix.expandtabs(4)) if '\t' in prefix else len(prefix)
+    bullet = _BULLET.match(stripped)
+    if bullet:
+        stripped = stripped[bullet.end():]
+        # A marker counts as one more level, so '- Acceso' under a variable is a dimension
+        indent += 1
+    text = stripped.rstrip()
+    if not text:
+        return
+
+    label, colon, value = text.partition(':')
+    folded = normalize_text(label).strip() if colon and len(label) <= 60 else ''
+    value = value.strip()
+    variable = _VARIABLE_LABEL.match(folded)
+    if variable:
+        keyword = variable.group(1)
+        if keyword.startswith('categoria'):
+            rol = 'categoria'
+        else:
+            rol = _ABBREVIATED_ROLES.get(keyword) or _role(folded)
+        names = _names(value, keyword.endswith('s'))
+        if keyword.endswith('s') and not names:
+            builder.close()
+            builder.listing = (rol, indent)
+            return
+        builder.listing = ('', -1)
+        for nombre in names or ['']:
+            builder.variable(nombre, rol, indent)
+    elif folded.startswith(('dimension', 'subcategoria')):
+        for nombre in _names(value, folded.startswith(('dimensiones', 'subcategorias'))):
+            builder.dimension(nombre)
+    elif folded.startswith('indicador'):
+        for nombre in _names(value, folded.startswith('indicadores')):
+            builder.indicator(nombre)
+    elif builder.nested(indent):
+        builder.child(text, indent)
+    else:
+        rol, listed_under = builder.listing
+        builder.variable(text, rol if indent > listed_under else '', indent)
+
+
+def parse_variables(lines):
+    """Variables, dimensions and indicators from the pasted 'Variables' field, in one pass
+
+    ``lines`` is the pasted text or any iterable of its lines (a file, a
+    spreadsheet cell split on newlines), read once and never held whole.
+    Understood forms, freely mixed:
+
+        Variable independiente: Uso de tecnologías digitales
+          Dimensiones: Acceso; Frecuencia de uso
+          Indicador: Horas de conexión semanal
+        Variables de control: Edad, género
+        Categoría: Convivencia escolar
+          - Normas del aula
+            - Cumplimiento de acuerdos
+
+    A labeled line starts a variable (plural labels list several), an
+    indented or bulleted line under it is a dimension and one indented
+    further is an indicator of it; any other line is a variable by itself.
+    """
+    if isinstance(lines, str):
+        lines = io.StringIO(lines)
+    builder = _Builder()
+    for line in lines:
+        _read_line(builder, line)
+    builder.close()
+    return tuple(builder.variables)
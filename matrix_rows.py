@@ -0,0 +1,76 @@
+import sys
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+# Distinct tuples kept by shared_tuple before the table starts over
+SHARED_TUPLES = 8192
+
+_tuples = {}
+
+
+def shared_text(text):
+    """The single shared copy of a fixed text that recurs across results (catalog labels, placeholders)
+
+    Interned strings live in a process-wide table, so text built from user input stays a plain ``str``.
+    """
+    return sys.intern(text)
+
+
+def shared_tuple(items):
+    """Tuple of ``items``, the same object for every result that lists the same texts"""
+    key = tuple(items)
+    shared = _tuples.get(key)
+    if shared is None:
+        if len(_tuples) >= SHARED_TUPLES:
+            _tuples.clear()
+        shared = _tuples.setdefault(key, key)
+    return shared
+
+
+class _Row(Mapping):
+    """Read-only mapping over the fields of a slotted row, so rows read like the dicts they replace"""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+
+@dataclass(frozen=True, slots=True)
+class VariableRow(_Row):
+    """A variable of a quantitative operationalization matrix"""
+    variable: str
+    definicion_conceptual: str
+    definicion_operacional: str
+    dimensiones: tuple
+    indicadores: tuple
+    elementos_items: tuple
+    escala: str
+    instrumento: str
+
+
+@dataclass(frozen=True, slots=True)
+class CategoryRow(_Row):
+    """A category of a qualitative operationalization matrix"""
+    categoria: str
+    definicion_conceptual: str
+    subcategorias: tuple
+    indicadores: tuple
+    preguntas_guia: tuple
+    tecnica: str
+    instrumento: str
+
+
+@dataclass(frozen=True, slots=True)
+class TitleRow(_Row):
+    """A suggested thesis title"""
+    numero: int
+    titulo: str
+    justificacion: str
@@ -0,0 +1,262 @@
+import bisect
+import functools
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import before_render_template, g, request, template_rendered
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+METRIC_HELP = {
+    'thesis_request_duration_seconds': ('histogram', 'Request latency by endpoint, method and status'),
+    'thesis_requests_in_flight': ('gauge', 'Requests currently being handled'),
+    'thesis_generator_duration_seconds': ('histogram', 'ThesisGenerator call latency by method'),
+    'thesis_session_io_duration_seconds': ('histogram', 'Session backend load/store latency'),
+    'thesis_template_render_duration_seconds': ('histogram', 'Jinja template render latency'),
+    'thesis_generation_cache_events_total': ('counter', 'Generation cache hits, misses, evictions, expirations, coalesced'),
+    'thesis_generation_cache_entries': ('gauge', 'Entries held in the generation cache'),
+    'thesis_admission_events_total': ('counter', 'Expensive requests admitted, queued or shed by the admission controller'),
+    'thesis_admission_running': ('gauge', 'Expensive requests holding an admission slot'),
+    'thesis_admission_waiting': ('gauge', 'Expensive requests waiting for an admission slot'),
+    'thesis_jobs_total': ('counter', 'Background jobs finished, failed or resumed after a worker restart'),
+    'thesis_jobs_running': ('gauge', 'Background jobs being run'),
+}
+
+
+class Registry:
+    """Per-process metric store, snapshotted to a shared directory for aggregation
+
+    Every worker writes its own ``metrics_<pid>.json``; ``/metrics`` merges
+    all of them, so the figures cover the whole gunicorn pool.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0, buckets=DEFAULT_BUCKETS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+        self._last_flush = 0.0
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())) if labels else ())
+
+    def inc(self, name, labels=None, value=1):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge_add(self, name, labels=None, value=1):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=None):
+        key = self._key(name, labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def add_collector(self, collector):
+        """Register a callable returning (kind, name, labels, value) samples at snapshot time"""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'pid': os.getpid(),
+                'buckets': list(self.buckets),
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self._gauges.items()],
+                'histograms': [[name, list(labels), values] for (name, labels), values in self._histograms.items()],
+            }
+        for collector in self._collectors:
+            for kind, name, labels, value in collector():
+                data['counters' if kind == 'counter' else 'gauges'].append(
+                    [name, sorted(labels.items()) if labels else [], value])
+        return data
+
+    def flush(self, force=False):
+        """Write this process's snapshot, at most once per ``flush_interval``"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(tmp_path, os.path.join(self.directory, f'metrics_{os.getpid()}.json'))
+
+    def collect(self):
+        """Merge the snapshots of every worker, including this one"""
+        self.flush(force=True)
+        snapshots = []
+        paths = glob.glob(os.path.join(self.directory, 'metrics_*.json')) if self.directory else []
+        for path in paths:
+            try:
+                with open(path) as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                continue
+        if not self.directory:
+            snapshots.append(self.snapshot())
+        return merge(snapshots)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge(snapshots):
+    """Sum counters and histograms across workers; gauges only from live workers"""
+    merged = {'counters': {}, 'gauges': {}, 'histograms': {}, 'buckets': list(DEFAULT_BUCKETS)}
+    for snapshot in snapshots:
+        merged['buckets'] = snapshot['buckets']
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        if _pid_alive(snapshot['pid']):
+            for name, labels, value in snapshot['gauges']:
+                key = (name, tuple(map(tuple, labels)))
+                merged['gauges'][key] = merged['gauges'].get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            current = merged['histograms'].get(key)
+            merged['histograms'][key] = values[:] if current is None else [a + b for a, b in zip(current, values)]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render_prometheus(merged):
+    """Render merged metrics in the Prometheus text exposition format"""
+    lines = []
+    by_name = {}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for (name, labels), value in merged[kind].items():
+            by_name.setdefault(name, []).append((kind, labels, value))
+
+    for name in sorted(by_name):
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for sample_kind, labels, value in sorted(by_name[name], key=lambda sample: sample[1]):
+            if sample_kind != 'histograms':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(merged['buckets']) + ['+Inf'], value[:-2]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, ("le", bound))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def timed_method(registry, metric, labels, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            registry.observe(metric, time.perf_counter() - started, labels)
+    return wrapper
+
+
+def init_metrics(app, generator=None):
+    """Instrument requests, templates, the session backend and ``generator``"""
+    registry = Registry(app.config.get('METRICS_DIR'), app.config.get('METRICS_FLUSH_INTERVAL', 1.0))
+    app.extensions['metrics'] = registry
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_started = time.perf_counter()
+        registry.gauge_add('thesis_requests_in_flight')
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            registry.observe('thesis_request_duration_seconds', time.perf_counter() - started, {
+                'endpoint': request.endpoint or 'unmatched',
+                'method': request.method,
+                'status': str(response.status_code)
+            })
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            # after_request did not run: the view raised
+            registry.observe('thesis_request_duration_seconds', time.perf_counter() - started, {
+                'endpoint': request.endpoint or 'unmatched', 'method': request.method, 'status': '500'
+            })
+        registry.gauge_add('thesis_requests_in_flight', value=-1)
+        registry.flush()
+
+    def _template_started(sender, template, context, **extra):
+        g.setdefault('_metrics_templates', []).append(time.perf_counter())
+
+    def _template_finished(sender, template, context, **extra):
+        stack = g.get('_metrics_templates')
+        if stack:
+            registry.observe('thesis_template_render_duration_seconds', time.perf_counter() - stack.pop(),
+                             {'template': template.name or 'string'})
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)
+
+    interface = app.session_interface
+    interface.open_session = timed_method(registry, 'thesis_session_io_duration_seconds',
+                                          {'operation': 'load'}, interface.open_session)
+    interface.save_session = timed_method(registry, 'thesis_session_io_duration_seconds',
+                                          {'operation': 'store'}, interface.save_session)
+
+    if generator is not None:
+        for name in dir(generator):
+            if name.startswith('generate_'):
+                setattr(generator, name, timed_method(registry, 'thesis_generator_duration_seconds',
+                                                      {'method': name}, getattr(generator, name)))
+        cache = getattr(generator, 'cache', None)
+        if cache is not None:
+            def _cache_samples():
+                stats = cache.stats()
+                for event in ('hits', 'misses', 'evictions', 'expirations', 'coalesced'):
+                    yield 'counter', 'thesis_generation_cache_events_total', {'event': event}, stats[event]
+                yield 'gauge', 'thesis_generation_cache_entries', None, stats['size']
+            registry.add_collector(_cache_samples)
+
+    return registry
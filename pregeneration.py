@@ -0,0 +1,110 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_cache import DEFAULT_ARGS, input_fingerprint, method_spec
+
+logger = logging.getLogger(__name__)
+
+
+def step_methods(step, data):
+    """Generator methods whose inputs are final once ``step`` is posted, as build_results will call them
+
+    Step 2 alone completes none: every output depends on the topic, which
+    step 3 may still delimit.
+    """
+    if step == 'step3':
+        return ('generate_operationalization_matrix',)
+    if step == 'step4':
+        methods = ['generate_operationalization_matrix']
+        if data.get('generar_matriz') == 'si':
+            methods.append('generate_consistency_matrix')
+        if data.get('generar_titulos') == 'si':
+            methods.append('generate_thesis_titles')
+        return methods
+    if step == 'matriz_input':
+        methods = ['generate_operationalization_matrix_from_existing']
+        if data.get('generar_titulos') == 'si':
+            methods.append('generate_thesis_titles_from_existing')
+        return methods
+    return ()
+
+
+class Pregenerator:
+    """Runs generator calls on a small thread pool as soon as the wizard has their inputs
+
+    Results land in the generator's cache under keys derived from the inputs,
+    so the result pages pick them up (waiting for a call that is still
+    running) and an edited step can never be served a piece generated from
+    its old values. Jobs still queued for inputs a session has replaced are
+    cancelled.
+    """
+
+    def __init__(self, generator, workers=2, max_pending=256):
+        self.generator = generator
+        self.max_pending = max_pending
+        # Threads start on the first submit, so preloaded apps only get them in the forked workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pregen')
+        self._queued = {}
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.skipped = 0
+        self.cancelled = 0
+
+    def schedule(self, data, method_names):
+        """Queue ``method_names`` for session-shaped ``data`` and return their job tokens
+
+        Calls already cached or queued are not queued again; when
+        ``max_pending`` jobs are waiting the call is left to the request.
+        """
+        tokens = []
+        for method_name in method_names:
+            source = data.get('matriz_existente') if method_name.endswith('_from_existing') else data
+            spec = method_spec(method_name, source)
+            # Called, and so keyed, exactly as the result pages will call it
+            args = DEFAULT_ARGS.get(method_name, ())
+            token = input_fingerprint(method_name, spec)[:16]
+            tokens.append(token)
+            if self.generator.cache_key(method_name, spec, *args) in self.generator.cache:
+                continue
+            with self._lock:
+                if token in self._queued:
+                    continue
+                if len(self._queued) >= self.max_pending:
+                    self.skipped += 1
+                    continue
+                future = self._executor.submit(self._run, method_name, spec, args)
+                self._queued[token] = future
+                self.scheduled += 1
+            future.add_done_callback(lambda done, token=token: self._forget(token, done))
+        return tokens
+
+    def discard(self, tokens):
+        """Cancel the jobs of ``tokens`` that have not started yet"""
+        for token in tokens:
+            with self._lock:
+                future = self._queued.get(token)
+            if future is not None and future.cancel():
+                with self._lock:
+                    self.cancelled += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': len(self._queued),
+                'scheduled': self.scheduled,
+                'skipped': self.skipped,
+                'cancelled': self.cancelled
+            }
+
+    def _run(self, method_name, spec, args):
+        try:
+            getattr(self.generator, method_name)(spec, *args)
+        except Exception:
+            # The request that needs it will generate it again and report the error
+            logger.exception('Pre-generation of %s failed', method_name)
+
+    def _forget(self, token, future):
+        with self._lock:
+            if self._queued.get(token) is future:
+                del self._queued[token]
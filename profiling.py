@@ -0,0 +1,417 @@
+"""Opt-in request profiling: signed requests or a sampling toggle, stored as pstats and flamegraph stacks.
+
+Nothing here is installed unless PROFILE_SECRET is set. A request is
+profiled when it carries a valid ``X-Profile`` header (``python profiling.py
+sign /results`` prints one) or when the admin page has switched sampling on
+for its path. The whole WSGI call runs under cProfile while a sampler thread
+records its stacks; the pstats file, the collapsed stacks and a summary that
+splits the time into session I/O, generator methods and template rendering
+land in a bounded ring of files under PROFILE_DIR, listed at /admin/perfiles.
+"""
+import argparse
+import cProfile
+import functools
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import (Blueprint, Response, abort, before_render_template, current_app, redirect, render_template, request,
+                   send_file, template_rendered, url_for)
+from werkzeug.local import LocalProxy
+
+PROFILE_HEADER = 'X-Profile'
+PHASES = ('session', 'generator', 'templates')
+
+_ENVIRON_HEADER = 'HTTP_' + PROFILE_HEADER.upper().replace('-', '_')
+_PROFILE_ID = re.compile(r'\d{13}-\d+-\d+')
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('profiling', __name__, url_prefix='/admin/perfiles')
+
+store = LocalProxy(lambda: current_app.extensions['profiler'].store)
+profiler = LocalProxy(lambda: current_app.extensions['profiler'])
+
+# Phase timings of the request being profiled on this thread; unset for every other request
+_local = threading.local()
+
+
+def sign(secret, path, expires):
+    """Value of the X-Profile header that asks to profile ``path`` until ``expires`` (epoch seconds)"""
+    digest = hmac.new(secret.encode('utf-8'), f'{int(expires)}\n{path}'.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f'{int(expires)}.{digest}'
+
+
+def verify(secret, path, value, now=None):
+    expires, _, digest = value.partition('.')
+    if not expires.isdigit() or int(expires) < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(sign(secret, path, int(expires)), f'{expires}.{digest}')
+
+
+class ProfileStore:
+    """Ring of the last ``max_entries`` profiles on disk, shared by every worker
+
+    Each profile is ``<id>.pstats``, ``<id>.folded`` and ``<id>.json`` (the
+    summary, written last so listings never see a half-written profile). Ids
+    sort by creation time.
+    """
+
+    def __init__(self, directory, max_entries=50):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def path(self, profile_id, suffix):
+        return os.path.join(self.directory, f'{profile_id}.{suffix}')
+
+    def save(self, summary, stats, folded):
+        with self._lock:
+            self._sequence += 1
+            profile_id = f'{int(time.time() * 1000):013d}-{os.getpid()}-{self._sequence}'
+        os.makedirs(self.directory, exist_ok=True)
+        summary = dict(summary, id=profile_id)
+        stats.dump_stats(self.path(profile_id, 'pstats'))
+        with open(self.path(profile_id, 'folded'), 'w', encoding='utf-8') as handle:
+            handle.writelines(f'{stack} {weight}\n' for stack, weight in folded.most_common())
+        tmp_path = self.path(profile_id, f'json.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(summary, handle)
+        os.replace(tmp_path, self.path(profile_id, 'json'))
+        self.prune()
+        return profile_id
+
+    def ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-5] for name in names if name.endswith('.json') and _PROFILE_ID.fullmatch(name[:-5])),
+                      reverse=True)
+
+    def prune(self):
+        for profile_id in self.ids()[self.max_entries:]:
+            self.delete(profile_id)
+
+    def delete(self, profile_id):
+        for suffix in ('json', 'pstats', 'folded'):
+            try:
+                os.remove(self.path(profile_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def get(self, profile_id):
+        """Summary of ``profile_id``, or None"""
+        if not _PROFILE_ID.fullmatch(profile_id):
+            return None
+        try:
+            with open(self.path(profile_id, 'json'), encoding='utf-8') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def list(self):
+        return [summary for summary in map(self.get, self.ids()) if summary is not None]
+
+
+class _Phases:
+    """Wall time per phase and per method/template/operation within it"""
+
+    def __init__(self):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.detail = {phase: Counter() for phase in PHASES}
+        self.depth = 0
+        self.templates = []
+
+    def add(self, phase, name, seconds):
+        self.totals[phase] += seconds
+        self.detail[phase][name] += seconds
+
+
+def _timed_phase(phase, name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        phases = getattr(_local, 'phases', None)
+        # Nested generator calls (a cached method calling the plain one) count once
+        if phases is None or phases.depth:
+            return method(*args, **kwargs)
+        phases.depth += 1
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            phases.depth -= 1
+            phases.add(phase, name, time.perf_counter() - started)
+    return wrapper
+
+
+class _Sampler(threading.Thread):
+    """Samples one thread's Python stack every ``interval`` seconds into collapsed-stack weights (microseconds)"""
+
+    def __init__(self, thread_id, root_code, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and frame.f_code is not self.root_code:
+                code = frame.f_code
+                names.append(f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            # Weighted by the time since the previous sample: the GIL delays wake-ups past the interval
+            self.stacks[';'.join(reversed(names))] += max(1, round((now - last) * 1e6))
+            self.samples += 1
+            last = now
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class Profiler:
+    """WSGI middleware profiling the requests that ask for it; the rest pass straight through
+
+    At most one request per process is profiled at a time; others that ask
+    while one runs are served without profiling.
+    """
+
+    def __init__(self, wsgi_app, secret, store, paths=(), sample_interval=0.001, check_interval=1.0):
+        self.wsgi_app = wsgi_app
+        self.secret = secret
+        self.store = store
+        self.paths = tuple(paths)
+        self.sample_interval = sample_interval
+        self.check_interval = check_interval
+        self._busy = threading.Lock()
+        self._sampling = {'until': 0, 'rate': 0.0}
+        self._sampling_checked = 0.0
+        self._sampling_mtime = None
+
+    @property
+    def _sampling_path(self):
+        return os.path.join(self.store.directory, 'sampling.json')
+
+    def sampling(self):
+        """The sampling toggle ({'until': epoch, 'rate': fraction}), re-read at most once per check_interval"""
+        now = time.monotonic()
+        if now - self._sampling_checked >= self.check_interval:
+            self._sampling_checked = now
+            try:
+                mtime = os.stat(self._sampling_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+                self._sampling = {'until': 0, 'rate': 0.0}
+            if mtime is not None and mtime != self._sampling_mtime:
+                try:
+                    with open(self._sampling_path, encoding='utf-8') as handle:
+                        self._sampling = json.load(handle)
+                except (OSError, ValueError):
+                    pass
+            self._sampling_mtime = mtime
+        return self._sampling
+
+    def set_sampling(self, minutes, rate):
+        """Profile ``rate`` of the requests to PROFILE_PATHS for ``minutes``, in every worker (0 minutes stops)"""
+        os.makedirs(self.store.directory, exist_ok=True)
+        tmp_path = f'{self._sampling_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump({'until': time.time() + minutes * 60, 'rate': rate}, handle)
+        os.replace(tmp_path, self._sampling_path)
+        self._sampling_checked = 0.0
+
+    def _reason(self, environ):
+        path = environ.get('PATH_INFO', '')
+        header = environ.get(_ENVIRON_HEADER)
+        if header is not None:
+            return 'header' if verify(self.secret, path, header) else None
+        if path in self.paths:
+            sampling = self.sampling()
+            if sampling['until'] > time.time() and random.random() < sampling['rate']:
+                return 'sampling'
+        return None
+
+    def __call__(self, environ, start_response):
+        reason = self._reason(environ)
+        if reason is None or not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self._profiled(environ, start_response, reason)
+        finally:
+            self._busy.release()
+
+    def _profiled(self, environ, start_response, reason):
+        status = []
+
+        def capture(status_line, headers, exc_info=None):
+            status.append(status_line)
+            return start_response(status_line, headers, exc_info)
+
+        phases = _local.phases = _Phases()
+        sampler = _Sampler(threading.get_ident(), self._profiled.__code__, self.sample_interval)
+        profile = cProfile.Profile()
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        sampler.start()
+        profile.enable()
+        try:
+            # Rendered responses are complete here; a streamed body is produced outside the profile
+            return self.wsgi_app(environ, capture)
+        finally:
+            profile.disable()
+            wall, cpu = time.perf_counter() - started, time.thread_time() - cpu_started
+            sampler.stop()
+            _local.phases = None
+            self._save(environ, status, reason, wall, cpu, phases, profile, sampler)
+
+    def _save(self, environ, status, reason, wall, cpu, phases, profile, sampler):
+        summary = {
+            'created': time.time(),
+            'pid': os.getpid(),
+            'method': environ.get('REQUEST_METHOD'),
+            'path': environ.get('PATH_INFO'),
+            'status': int(status[0].split()[0]) if status else 500,
+            'reason': reason,
+            'wall_ms': wall * 1e3,
+            'cpu_ms': cpu * 1e3,
+            'phases': {phase: {'ms': phases.totals[phase] * 1e3,
+                               'detail': {name: seconds * 1e3 for name, seconds in phases.detail[phase].most_common()}}
+                       for phase in PHASES},
+            'other_ms': max(0.0, wall - sum(phases.totals.values())) * 1e3,
+            'samples': sampler.samples,
+        }
+        try:
+            self.store.save(summary, pstats.Stats(profile), sampler.stacks)
+        except OSError:
+            logger.exception('Could not store the profile of %s', summary['path'])
+
+
+def _fecha(timestamp):
+    return time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(timestamp))
+
+
+def _authorized():
+    """HTTP Basic (any user) or Bearer with PROFILE_SECRET as the password/token"""
+    secret = current_app.config['PROFILE_SECRET']
+    auth = request.authorization
+    supplied = None
+    if auth is not None:
+        supplied = auth.token if auth.type == 'bearer' else auth.password
+    return supplied is not None and hmac.compare_digest(supplied.encode('utf-8'), secret.encode('utf-8'))
+
+
+@bp.before_request
+def _require_secret():
+    if not _authorized():
+        return Response('Unauthorized\n', status=401, mimetype='text/plain',
+                        headers={'WWW-Authenticate': 'Basic realm="perfiles"'})
+
+
+@bp.route('/', methods=['GET', 'POST'])
+def index():
+    """Stored profiles, newest first, and the sampling toggle"""
+    if request.method == 'POST':
+        minutes = request.form.get('minutos', 0, type=float) if 'iniciar' in request.form else 0
+        rate = min(1.0, max(0.0, request.form.get('muestreo', 10, type=float) / 100))
+        profiler.set_sampling(max(0.0, minutes), rate)
+        return redirect(url_for('.index'))
+    sampling = profiler.sampling()
+    active = sampling['until'] > time.time()
+    return render_template('profiles.html', profiles=store.list(), sampling=sampling, active=active,
+                           paths=profiler.paths, max_entries=store.max_entries, phases=PHASES, fecha=_fecha)
+
+
+@bp.route('/<profile_id>')
+def detail(profile_id):
+    """Phase breakdown and the slowest functions of one profile"""
+    summary = store.get(profile_id)
+    if summary is None:
+        abort(404)
+    output = io.StringIO()
+    try:
+        stats = pstats.Stats(store.path(profile_id, 'pstats'), stream=output)
+        stats.sort_stats(request.args.get('orden', 'cumulative')).print_stats(40)
+    except (OSError, KeyError):
+        output.write('Perfil no disponible\n')
+    return render_template('profile_detail.html', profile=summary, stats=output.getvalue(), phases=PHASES,
+                           fecha=_fecha)
+
+
+@bp.route('/<profile_id>.<any(pstats, folded):suffix>')
+def download(profile_id, suffix):
+    """The raw pstats file (``python -m pstats``) or the collapsed stacks (flamegraph.pl, speedscope)"""
+    if store.get(profile_id) is None:
+        abort(404)
+    mimetype = 'application/octet-stream' if suffix == 'pstats' else 'text/plain'
+    return send_file(store.path(profile_id, suffix), mimetype=mimetype, as_attachment=True,
+                     download_name=f'{profile_id}.{suffix}')
+
+
+def init_profiling(app, generator=None):
+    """Install the profiling middleware, phase timers and admin pages when PROFILE_SECRET is set"""
+    secret = app.config.get('PROFILE_SECRET')
+    if not secret:
+        return None
+    instance = Profiler(app.wsgi_app, secret, ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_ENTRIES']),
+                        paths=app.config['PROFILE_PATHS'], sample_interval=app.config['PROFILE_SAMPLE_INTERVAL'])
+    app.wsgi_app = instance
+    app.extensions['profiler'] = instance
+
+    interface = app.session_interface
+    interface.open_session = _timed_phase('session', 'load', interface.open_session)
+    interface.save_session = _timed_phase('session', 'store', interface.save_session)
+    if generator is not None:
+        for name in dir(generator):
+            if name.startswith('generate_'):
+                setattr(generator, name, _timed_phase('generator', name, getattr(generator, name)))
+
+    def _template_started(sender, template, context, **extra):
+        phases = getattr(_local, 'phases', None)
+        if phases is not None:
+            phases.templates.append(time.perf_counter())
+
+    def _template_finished(sender, template, context, **extra):
+        phases = getattr(_local, 'phases', None)
+        if phases is not None and phases.templates:
+            phases.add('templates', template.name or 'string', time.perf_counter() - phases.templates.pop())
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)
+    app.register_blueprint(bp)
+    return instance
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print an X-Profile header that profiles one path')
+    parser.add_argument('command', choices=('sign',))
+    parser.add_argument('path', help='Request path, e.g. /results')
+    parser.add_argument('--ttl', type=int, default=900, help='Seconds the header stays valid')
+    args = parser.parse_args()
+    secret = os.environ.get('PROFILE_SECRET')
+    if not secret:
+        raise SystemExit('PROFILE_SECRET is not set')
+    print(f'{PROFILE_HEADER}: {sign(secret, args.path, time.time() + args.ttl)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+import json
+import logging
+import re
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import JSON, BigInteger, DateTime, Index, Integer, String, event, func, insert, select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import DeclarativeBase, Mapped, load_only, mapped_column
+
+from batch import SPEC_FIELDS
+from results_builder import json_default
+
+logger = logging.getLogger(__name__)
+
+# Wizard inputs stored with each project (everything the generator and result pages read)
+INPUT_FIELDS = ('tiene_matriz',) + SPEC_FIELDS
+
+# Long-lived cookie tying a browser to the projects it created (students have no accounts)
+OWNER_COOKIE = 'tm_owner'
+OWNER_MAX_AGE = 365 * 24 * 3600
+
+_KEY = re.compile(r'[0-9a-f]{32}')
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+db = SQLAlchemy(model_class=Base)
+
+# BIGINT/JSONB on PostgreSQL; SQLite only autoincrements INTEGER primary keys
+_ID = BigInteger().with_variant(Integer, 'sqlite')
+_DOCUMENT = JSON().with_variant(JSONB, 'postgresql')
+
+
+def new_key():
+    """Random 128-bit hex key; unguessable, so it doubles as a share link"""
+    return secrets.token_hex(16)
+
+
+def is_key(value):
+    return bool(value) and _KEY.fullmatch(value) is not None
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class Project(db.Model):
+    """A completed wizard: its inputs and everything generated from them"""
+
+    __tablename__ = 'projects'
+    # Listings are keyset-paginated on id within an owner or a cohort
+    __table_args__ = (
+        Index('ix_projects_owner_id', 'owner', 'id'),
+        Index('ix_projects_cohort_id', 'cohort', 'id'),
+    )
+
+    id: Mapped[int] = mapped_column(_ID, primary_key=True)
+    key: Mapped[str] = mapped_column(String(32), unique=True, default=new_key)
+    owner: Mapped[str | None] = mapped_column(String(32))
+    cohort: Mapped[str | None] = mapped_column(String(64))
+    tema: Mapped[str] = mapped_column(String(500), default='')
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_now)
+    inputs: Mapped[dict] = mapped_column(_DOCUMENT)
+    matriz: Mapped[dict | None] = mapped_column(_DOCUMENT)
+    titulos: Mapped[list | None] = mapped_column(_DOCUMENT)
+    matriz_operacionalizacion: Mapped[dict | None] = mapped_column(_DOCUMENT)
+
+    def to_dict(self):
+        return {
+            'key': self.key,
+            'cohort': self.cohort,
+            'tema': self.tema,
+            'created_at': self.created_at.isoformat(),
+            'inputs': self.inputs,
+            'matriz': self.matriz,
+            'titulos': self.titulos,
+            'matriz_operacionalizacion': self.matriz_operacionalizacion
+        }
+
+
+# Columns a listing needs; the JSON documents are only loaded for a single project
+_SUMMARY_COLUMNS = (Project.id, Project.key, Project.cohort, Project.tema, Project.created_at)
+
+
+def _plain(value):
+    """Copy of a (possibly frozen) generator result made of plain dicts and lists"""
+    if value is None:
+        return None
+    return json.loads(json.dumps(value, ensure_ascii=False, default=json_default))
+
+
+def project_topic(data):
+    """Short description of a project for listings"""
+    existing = data.get('matriz_existente') or {}
+    tema = (data.get('tema_delimitado') or data.get('tema_general') or existing.get('objetivo_general')
+            or existing.get('problema_general') or '')
+    return tema.strip()[:500]
+
+
+def project_row(data, results, owner=None, cohort=None):
+    """Column values for a project generated from session-shaped ``data``"""
+    return {
+        'key': new_key(),
+        'owner': owner,
+        'cohort': cohort,
+        'tema': project_topic(data),
+        'created_at': _now(),
+        'inputs': _plain({field: data[field] for field in INPUT_FIELDS if data.get(field) is not None}),
+        'matriz': _plain(results['matriz']),
+        'titulos': _plain(results['titulos']),
+        'matriz_operacionalizacion': _plain(results['matriz_operacionalizacion'])
+    }
+
+
+def save_project(data, results, owner=None, cohort=None):
+    """Persist one project and return its key"""
+    row = project_row(data, results, owner=owner, cohort=cohort)
+    db.session.add(Project(**row))
+    db.session.commit()
+    return row['key']
+
+
+def bulk_insert(rows):
+    """Insert project rows in one executemany (batched multi-row INSERTs on PostgreSQL)"""
+    if rows:
+        db.session.execute(insert(Project), rows)
+        db.session.commit()
+
+
+def get_project(key):
+    """Return the project with ``key``, or None"""
+    if not is_key(key):
+        return None
+    return db.session.execute(select(Project).where(Project.key == key)).scalar_one_or_none()
+
+
+def list_projects(owner=None, cohort=None, before=None, limit=20):
+    """Return a page of projects, newest first, and the cursor for the next page (or None)
+
+    Keyset pagination: ``before`` is the cursor returned with the previous
+    page, so every page is one index range scan however deep the listing goes.
+    """
+    query = select(Project).options(load_only(*_SUMMARY_COLUMNS))
+    if owner is not None:
+        query = query.where(Project.owner == owner)
+    if cohort is not None:
+        query = query.where(Project.cohort == cohort)
+    if before is not None:
+        query = query.where(Project.id < before)
+    page = list(db.session.execute(query.order_by(Project.id.desc()).limit(limit + 1)).scalars())
+    cursor = page[limit - 1].id if len(page) > limit else None
+    return page[:limit], cursor
+
+
+def count_cohort(cohort):
+    return db.session.execute(select(func.count()).where(Project.cohort == cohort)).scalar_one()
+
+
+def iter_cohort(cohort, batch_size=100):
+    """Yield every project of ``cohort``, oldest first, loading ``batch_size`` at a time
+
+    Each batch is dropped from the session before the next one is read, so
+    memory stays flat however large the cohort is.
+    """
+    after = 0
+    while True:
+        query = (select(Project).where(Project.cohort == cohort, Project.id > after)
+                 .order_by(Project.id).limit(batch_size))
+        page = list(db.session.execute(query).scalars())
+        yield from page
+        if len(page) < batch_size:
+            return
+        after = page[-1].id
+        db.session.expunge_all()
+
+
+def save_batch(records, cohort, chunk_size=500):
+    """Pass batch records through, storing each result as a project of ``cohort``
+
+    Results are inserted ``chunk_size`` at a time and only yielded once their
+    chunk is committed, each carrying the key of its saved project.
+    """
+    held = []
+    rows = []
+
+    def flush():
+        bulk_insert(rows)
+        yield from held
+        held.clear()
+        rows.clear()
+
+    saved = 0
+    for record in records:
+        if record['type'] == 'report':
+            yield from flush()
+            record['proyectos_guardados'] = saved
+            yield record
+            continue
+        spec = record.pop('spec', None)
+        if record['type'] == 'result':
+            row = project_row(spec, record, cohort=cohort)
+            record['proyecto'] = row['key']
+            rows.append(row)
+            saved += 1
+        held.append(record)
+        if len(rows) >= chunk_size:
+            yield from flush()
+    yield from flush()
+
+
+def _project_texts(titulos, matriz):
+    texts = [('titulo', titulo.get('titulo')) for titulo in titulos or ()]
+    if matriz:
+        texts.append(('problema', matriz.get('problema_general')))
+    return [(kind, text) for kind, text in texts if text]
+
+
+def project_texts(after_id, limit, settle=10):
+    """Similarity index rows for up to ``limit`` projects after ``after_id``, oldest first
+
+    Rows are ``(id, key, [(kind, text), ...])``. Projects younger than
+    ``settle`` seconds are left for the next call: ids are assigned before
+    commit, so a lower id may still become visible after a higher one.
+    """
+    settled = _now() - timedelta(seconds=settle)
+    query = (select(Project.id, Project.key, Project.titulos, Project.matriz)
+             .where(Project.id > after_id, Project.created_at <= settled).order_by(Project.id).limit(limit))
+    return [(row.id, row.key, _project_texts(row.titulos, row.matriz)) for row in db.session.execute(query)]
+
+
+def similarity_source(app):
+    """project_texts() bound to ``app``, for the similarity index's background refresh"""
+    def source(after_id, limit):
+        with app.app_context():
+            return project_texts(after_id, limit)
+    return source
+
+
+def _engine_options(app):
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    options = {'pool_pre_ping': True}
+    if not uri.startswith('sqlite'):
+        # One pool per worker process: size it to the worker's threads
+        options.update(pool_size=app.config['DB_POOL_SIZE'], max_overflow=app.config['DB_MAX_OVERFLOW'],
+                       pool_timeout=app.config['DB_POOL_TIMEOUT'], pool_recycle=app.config['DB_POOL_RECYCLE'])
+    return options
+
+
+def _sqlite_pragmas(connection, _):
+    # WAL lets worker processes read while another one writes
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.close()
+
+
+def init_projects(app):
+    """Bind the project store to ``app`` and create its tables"""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('postgres://'):
+        # Hosted providers still hand out the scheme SQLAlchemy dropped
+        app.config['SQLALCHEMY_DATABASE_URI'] = uri = 'postgresql://' + uri[len('postgres://'):]
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', _engine_options(app))
+    db.init_app(app)
+
+    with app.app_context():
+        if uri.startswith('sqlite'):
+            event.listen(db.engine, 'connect', _sqlite_pragmas)
+        db.create_all()
+        # gunicorn forks workers after preloading the app; they must not inherit pooled connections
+        db.engine.dispose()
+        logger.info('Project store ready (%s)', db.engine.url.render_as_string(hide_password=True))
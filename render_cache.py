@@ -0,0 +1,83 @@
+import hashlib
+import json
+
+from flask import make_response, request
+
+from results_builder import json_default
+
+# Every session key that can change what results.html or
+# matriz_operacionalizacion.html render (directly or through the generator)
+PAGE_FIELDS = (
+    'step', 'tiene_matriz', 'tipo_tesis', 'tema_general', 'enfoque', 'diseno', 'tema_delimitado',
+    'lugar', 'publico', 'periodo', 'problema_mod', 'generar_matriz', 'generar_titulos', 'matriz_existente',
+    'project_key'
+)
+
+
+def templates_version(app, *extra):
+    """Hash of every template source (plus ``extra``), so a deploy with new templates changes all ETags"""
+    digest = hashlib.sha256()
+    for value in extra:
+        digest.update(value.encode('utf-8'))
+    for name in sorted(app.jinja_loader.list_templates()):
+        source, _, _ = app.jinja_loader.get_source(app.jinja_env, name)
+        digest.update(name.encode('utf-8'))
+        digest.update(source.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def preload_templates(app):
+    """Load every template into the Jinja cache, so a preloading server forks workers that never compile one"""
+    for name in app.jinja_loader.list_templates():
+        app.jinja_env.get_template(name)
+
+
+class PageCache:
+    """Caches rendered result pages by input fingerprint and answers conditional requests
+
+    The fingerprint doubles as a strong ETag. Pages are marked
+    ``Cache-Control: private, no-cache`` so browsers keep them but revalidate,
+    getting a 304 without the generator or template running again.
+    """
+
+    def __init__(self, cache, version='', content_version=None, page_versions=None):
+        self.cache = cache
+        self.version = version
+        # Callable returning the version of the generated content (knowledge base)
+        self.content_version = content_version
+        # Template name -> callable returning the version of other data that page shows (similar projects)
+        self.page_versions = page_versions or {}
+
+    def fingerprint(self, template_name, session_data):
+        """Return the page fingerprint, or None when the page must not be cached"""
+        if session_data.get('_flashes'):
+            # Flash messages are shown once; pages that carry them are one-off
+            return None
+        fields = [[field, session_data[field]] for field in PAGE_FIELDS if field in session_data]
+        content_version = self.content_version() if self.content_version else ''
+        page_version = self.page_versions[template_name]() if template_name in self.page_versions else ''
+        raw = json.dumps([self.version, content_version, page_version, template_name, fields], ensure_ascii=False,
+                         sort_keys=True, separators=(',', ':'), default=json_default)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def cached(self, template_name, session_data):
+        """Whether respond() can answer without rendering: a 304 or a page already in the cache"""
+        etag = self.fingerprint(template_name, session_data)
+        return etag is not None and (request.if_none_match.contains(etag) or etag in self.cache)
+
+    def respond(self, template_name, session_data, render):
+        """Build the response for ``template_name``; ``render`` produces the HTML on a miss"""
+        etag = self.fingerprint(template_name, session_data)
+        if etag is None:
+            response = make_response(render())
+        elif request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(self.cache.get_or_create(etag, render))
+
+        if etag is not None:
+            response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
@@ -0,0 +1,63 @@
+from collections.abc import Mapping
+
+from thesis_spec import ThesisSpec
+
+
+def format_existing_matrix(existing):
+    """Format a pasted consistency matrix to match the generated structure"""
+    return {
+        'problema_general': existing.get('problema_general'),
+        'objetivo_general': existing.get('objetivo_general'),
+        'hipotesis_general': existing.get('hipotesis_general'),
+        'variables': existing.get('variables', '').split('\n') if existing.get('variables') else [],
+        'metodologia': {
+            'enfoque': existing.get('metodologia_enfoque'),
+            'tipo': existing.get('metodologia_tipo'),
+            'poblacion': existing.get('metodologia_poblacion'),
+            'muestra': existing.get('metodologia_muestra'),
+            'tecnicas': existing.get('metodologia_tecnicas'),
+            'instrumentos': existing.get('metodologia_instrumentos')
+        }
+    }
+
+
+def build_results(generator, data):
+    """Generate everything the results pages show for one set of wizard inputs
+
+    ``data`` holds the same keys the wizard stores in the session; it is
+    normalized into ThesisSpecs once and those are passed to every method.
+    """
+    existing = data.get('matriz_existente')
+    spec = ThesisSpec.from_session(data)
+    matrix_spec = ThesisSpec.from_matrix(existing) if existing else None
+
+    matriz = None
+    if data.get('generar_matriz') == 'si':
+        matriz = generator.generate_consistency_matrix(spec)
+    elif existing:
+        matriz = format_existing_matrix(existing)
+
+    titulos = None
+    if data.get('generar_titulos') == 'si':
+        if matrix_spec:
+            titulos = generator.generate_thesis_titles_from_existing(matrix_spec)
+        else:
+            titulos = generator.generate_thesis_titles(spec)
+
+    if matrix_spec:
+        matriz_operacionalizacion = generator.generate_operationalization_matrix_from_existing(matrix_spec)
+    else:
+        matriz_operacionalizacion = generator.generate_operationalization_matrix(spec)
+
+    return {
+        'matriz': matriz,
+        'titulos': titulos,
+        'matriz_operacionalizacion': matriz_operacionalizacion
+    }
+
+
+def json_default(value):
+    """json.dumps hook for the read-only mappings and matrix rows returned by the generator"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
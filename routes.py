@@ -1,38 +1,147 @@
-from flask import render_template, request, session, redirect, url_for, flash, jsonify
-from app import app
-from thesis_generator import ThesisGenerator
+from flask import Blueprint, current_app, render_template, request, session, redirect, url_for, flash, jsonify, Response, stream_with_context, send_file, make_response
+from werkzeug.local import LocalProxy
+from admission import Overloaded
+from batch import SpecError, iter_lines, parse_spec, run_batch, to_ndjson
+from matrix_import import iter_csv_rows, iter_xlsx_rows, parse_row, upload_format
+from metrics import render_prometheus
+from projects import (INPUT_FIELDS, OWNER_COOKIE, OWNER_MAX_AGE, count_cohort, db, get_project, is_key,
+                      list_projects, new_key, save_batch, save_project)
+from results_builder import build_results, format_existing_matrix
+from sqlalchemy.exc import SQLAlchemyError
+from thesis_spec import ThesisSpec
+from werkzeug.utils import secure_filename
+import hmac
 import logging
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, nullcontext
 
-@app.route('/')
+bp = Blueprint('main', __name__)
+
+# Session key of the browser's admission id, handed out by /start
+CLIENT_FIELD = 'client_id'
+
+# Per-application services created by create_app()
+generator = LocalProxy(lambda: current_app.extensions['generator'])
+page_cache = LocalProxy(lambda: current_app.extensions['page_cache'])
+metrics = LocalProxy(lambda: current_app.extensions['metrics'])
+admission = LocalProxy(lambda: current_app.extensions['admission'])
+jobs = LocalProxy(lambda: current_app.extensions['jobs'])
+
+def _pregenerate(step):
+    """Queue the generation this step's inputs complete, cancelling jobs for inputs it replaced"""
+    pregenerator = current_app.extensions.get('pregenerator')
+    if pregenerator is None:
+        return
+    from pregeneration import step_methods
+    tokens = pregenerator.schedule(session, step_methods(step, session))
+    pregenerator.discard(set(session.get('pregen', ())) - set(tokens))
+    session['pregen'] = tokens
+
+def _forget_answers():
+    """Drop the answers and saved project of an earlier pass through the wizard"""
+    pregenerator = current_app.extensions.get('pregenerator')
+    stale = session.pop('pregen', ())
+    if pregenerator is not None:
+        pregenerator.discard(stale)
+    for field in INPUT_FIELDS + ('project_key',):
+        session.pop(field, None)
+
+def _similar_projects(matriz, titulos):
+    """Earlier projects whose titles or problem statement resemble these results"""
+    queries = [('titulo', titulo['titulo']) for titulo in titulos or ()]
+    if matriz and matriz.get('problema_general'):
+        queries.append(('problema', matriz['problema_general']))
+    index = current_app.extensions.get('similarity')
+    if index is None or not queries:
+        return []
+    return index.search_many(
+        queries, k=current_app.config['SIMILARITY_RESULTS'], exclude=session.get('project_key'),
+        min_score=current_app.config['SIMILARITY_MIN_SCORE'])
+
+def _export_cache():
+    """The application's export cache, created by its first download"""
+    cache = current_app.extensions.get('export_cache')
+    if cache is None:
+        from exporters import ExportCache
+        cache = current_app.extensions.setdefault('export_cache', ExportCache(
+            current_app.config['EXPORT_CACHE_DIR'], max_files=current_app.config['EXPORT_CACHE_MAX_FILES']))
+    return cache
+
+def _client():
+    """Admission bucket of this request's browser"""
+    # One bucket per browser (many students share a campus address), keyed on the id /start stores in the
+    # session, which the client cannot choose; without one, per address (the client's, behind ProxyFix)
+    return session.get(CLIENT_FIELD) or request.remote_addr
+
+def _admitted(cached):
+    """Admission slot for a request that generates; ``cached`` ones are answered without generating and skip it"""
+    if cached:
+        return nullcontext()
+    return admission.admit(_client())
+
+def _clear_session():
+    """Drop the wizard state, keeping the browser's admission id"""
+    client = session.get(CLIENT_FIELD)
+    session.clear()
+    if client:
+        session[CLIENT_FIELD] = client
+
+def _owner():
+    """Owner id of this browser's saved projects, or None"""
+    owner = request.cookies.get(OWNER_COOKIE)
+    return owner if is_key(owner) else None
+
+def _set_owner(response, owner):
+    response.set_cookie(OWNER_COOKIE, owner, max_age=OWNER_MAX_AGE, httponly=True, samesite='Lax',
+                        secure=request.is_secure)
+    return response
+
+def _cohort_denied():
+    """Error response unless the request carries COHORT_EXPORT_TOKEN; without a token configured, cohorts stay closed"""
+    token = current_app.config.get('COHORT_EXPORT_TOKEN')
+    if not token:
+        return jsonify({'error': 'Las exportaciones por cohorte no están habilitadas'}), 404
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        return jsonify({'error': 'No autorizado'}), 401
+    return None
+
+@bp.route('/')
 def index():
     """Main landing page"""
     # Clear any existing session data
-    session.clear()
+    _clear_session()
     return render_template('index.html')
 
-@app.route('/start', methods=['GET', 'POST'])
+@bp.route('/start', methods=['GET', 'POST'])
 def start():
     """Step 1: Check if user has existing matrix"""
     if request.method == 'POST':
+        # Starting over replaces every earlier answer, so nothing generated from them can be reused
+        _forget_answers()
+        # Issued by the server, so a client cannot get a fresh admission bucket by sending a made-up cookie
+        session.setdefault(CLIENT_FIELD, new_key())
         tiene_matriz = request.form.get('tiene_matriz')
         session['tiene_matriz'] = tiene_matriz
         
         if tiene_matriz == 'ya_tengo':
             session['step'] = 'matriz_input'
             flash('Perfecto, ahora ingresa tu matriz de consistencia existente.', 'success')
-            return redirect(url_for('matriz_input'))
+            return redirect(url_for('.matriz_input'))
         else:
             session['step'] = 2
-            return redirect(url_for('step2'))
+            return redirect(url_for('.step2'))
     
     session['step'] = 1
     return render_template('step1.html')
 
-@app.route('/step2', methods=['GET', 'POST'])
+@bp.route('/step2', methods=['GET', 'POST'])
 def step2():
     """Step 2: Basic thesis information"""
     if session.get('step') != 2:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     if request.method == 'POST':
         session['tema_general'] = request.form.get('tema_general')
@@ -40,28 +149,29 @@ def step2():
         session['enfoque'] = request.form.get('enfoque')
         session['diseno'] = request.form.get('diseno')
         session['step'] = 3
-        return redirect(url_for('step3'))
+        return redirect(url_for('.step3'))
     
     return render_template('step2.html')
 
-@app.route('/step3', methods=['GET', 'POST'])
+@bp.route('/step3', methods=['GET', 'POST'])
 def step3():
     """Step 3: Delimit the topic"""
     if session.get('step') != 3:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     if request.method == 'POST':
         session['tema_delimitado'] = request.form.get('tema_delimitado')
         session['step'] = 4
-        return redirect(url_for('step4'))
+        _pregenerate('step3')
+        return redirect(url_for('.step4'))
     
     return render_template('step3.html')
 
-@app.route('/step4', methods=['GET', 'POST'])
+@bp.route('/step4', methods=['GET', 'POST'])
 def step4():
     """Step 4: Problem details"""
     if session.get('step') != 4:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     if request.method == 'POST':
         session['lugar'] = request.form.get('lugar')
@@ -71,15 +181,16 @@ def step4():
         session['generar_matriz'] = request.form.get('generar_matriz')
         session['generar_titulos'] = request.form.get('generar_titulos')
         session['step'] = 'complete'
-        return redirect(url_for('results'))
+        _pregenerate('step4')
+        return redirect(url_for('.results'))
     
     return render_template('step4.html')
 
-@app.route('/matriz_input', methods=['GET', 'POST'])
+@bp.route('/matriz_input', methods=['GET', 'POST'])
 def matriz_input():
     """Step for users who already have their consistency matrix"""
     if session.get('step') != 'matriz_input':
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     if request.method == 'POST':
         # Save the matrix components
@@ -101,88 +212,312 @@ def matriz_input():
         session['generar_titulos'] = request.form.get('generar_titulos', 'no')
         
         session['step'] = 'complete'
-        return redirect(url_for('results'))
+        _pregenerate('matriz_input')
+        return redirect(url_for('.results'))
     
     return render_template('matriz_input.html')
 
-@app.route('/results')
+@bp.route('/results')
 def results():
     """Display final results and generated content"""
     if session.get('step') != 'complete':
-        return redirect(url_for('index'))
-    
-    generator = ThesisGenerator()
-    
-    # Generate matrix if requested, or use existing matrix
-    matriz_consistencia = None
-    if session.get('generar_matriz') == 'si':
-        matriz_consistencia = generator.generate_consistency_matrix(session)
-    elif session.get('matriz_existente'):
-        # Format existing matrix to match the expected structure
-        existing = session.get('matriz_existente')
-        matriz_consistencia = {
-            'problema_general': existing.get('problema_general'),
-            'objetivo_general': existing.get('objetivo_general'),
-            'hipotesis_general': existing.get('hipotesis_general'),
-            'variables': existing.get('variables', '').split('\n') if existing.get('variables') else [],
-            'metodologia': {
-                'enfoque': existing.get('metodologia_enfoque'),
-                'tipo': existing.get('metodologia_tipo'),
-                'poblacion': existing.get('metodologia_poblacion'),
-                'muestra': existing.get('metodologia_muestra'),
-                'tecnicas': existing.get('metodologia_tecnicas'),
-                'instrumentos': existing.get('metodologia_instrumentos')
-            }
-        }
+        return redirect(url_for('.index'))
     
-    # Generate titles if requested
-    titulos_propuestos = None
-    if session.get('generar_titulos') == 'si':
-        if session.get('matriz_existente'):
-            # Generate titles based on existing matrix
-            titulos_propuestos = generator.generate_titles_from_existing_matrix(session.get('matriz_existente'))
-        else:
-            # Generate titles from collected session data
-            titulos_propuestos = generator.generate_thesis_titles(session)
+    def render():
+        # Wizard inputs normalized once for every generator call
+        spec = ThesisSpec.from_session(session)
+        
+        # Generate matrix if requested, or use existing matrix
+        matriz_consistencia = None
+        if session.get('generar_matriz') == 'si':
+            matriz_consistencia = generator.generate_consistency_matrix(spec)
+        elif session.get('matriz_existente'):
+            # Format existing matrix to match the expected structure
+            matriz_consistencia = format_existing_matrix(session['matriz_existente'])
     
-    return render_template('results.html', 
-                         matriz=matriz_consistencia,
-                         titulos=titulos_propuestos,
-                         session_data=session)
+        # Generate titles if requested
+        titulos_propuestos = None
+        if session.get('generar_titulos') == 'si':
+            if session.get('matriz_existente'):
+                # Generate titles based on existing matrix
+                titulos_propuestos = generator.generate_thesis_titles_from_existing(
+                    ThesisSpec.from_matrix(session['matriz_existente']))
+            else:
+                # Generate titles from collected session data
+                titulos_propuestos = generator.generate_thesis_titles(spec)
+    
+        return render_template('results.html', 
+                             matriz=matriz_consistencia,
+                             titulos=titulos_propuestos,
+                             similares=_similar_projects(matriz_consistencia, titulos_propuestos),
+                             session_data=session)
+    
+    # Past the page cache, wait for an admission slot or get the busy page
+    with _admitted(bool(session.get('project_key')) and page_cache.cached('results.html', session)):
+        # Save the project once, so it survives the session being cleared
+        owner = _owner()
+        new_owner = None
+        if not session.get('project_key'):
+            if owner is None:
+                owner = new_owner = new_key()
+            try:
+                session['project_key'] = save_project(session, build_results(generator, session), owner=owner)
+            except SQLAlchemyError:
+                db.session.rollback()
+                logging.exception("Could not save project")
+        
+        # Served from the page cache, or as a 304 when the browser already has it
+        response = page_cache.respond('results.html', session, render)
+    if new_owner:
+        _set_owner(response, new_owner)
+    return response
 
-@app.route('/download_results')
+@bp.route('/download_results')
 def download_results():
     """Download results as a formatted document"""
     if session.get('step') != 'complete':
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
-    # This would generate a downloadable document
-    # For now, we'll redirect back to results
-    flash('Funcionalidad de descarga en desarrollo', 'info')
-    return redirect(url_for('results'))
+    from exporters import EXPORT_FORMATS, build_document
+    formato = request.args.get('formato', 'docx')
+    if formato not in EXPORT_FORMATS:
+        flash('Formato de descarga no disponible', 'error')
+        return redirect(url_for('.results'))
+    
+    # Rendered files are cached by content hash, so unchanged results are only read from disk
+    document = build_document(session, build_results(generator, session))
+    handle, digest = _export_cache().open(formato, document)
+    stat = os.fstat(handle.fileno())
+    response = send_file(handle, mimetype=EXPORT_FORMATS[formato], as_attachment=True,
+                         download_name=f'plan_de_tesis.{formato}', etag=digest,
+                         last_modified=stat.st_mtime)
+    response.content_length = stat.st_size
+    return response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
 
-@app.route('/matriz_operacionalizacion')
+@bp.route('/matriz_operacionalizacion')
 def matriz_operacionalizacion():
     """Generate and display the operationalization matrix"""
     if session.get('step') != 'complete':
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
-    generator = ThesisGenerator()
+    def render():
+        # Generate operationalization matrix based on available data
+        spec = ThesisSpec.from_data(session)
+        if spec.existing:
+            # Use existing matrix data
+            matriz_operacionalizacion = generator.generate_operationalization_matrix_from_existing(spec)
+        else:
+            # Use session data from step-by-step process
+            matriz_operacionalizacion = generator.generate_operationalization_matrix(spec)
+        
+        return render_template('matriz_operacionalizacion.html', 
+                             matriz_operacionalizacion=matriz_operacionalizacion,
+                             session_data=session)
     
-    # Generate operationalization matrix based on available data
-    if session.get('matriz_existente'):
-        # Use existing matrix data
-        matriz_operacionalizacion = generator.generate_operationalization_matrix_from_existing(session.get('matriz_existente'))
-    else:
-        # Use session data from step-by-step process
-        matriz_operacionalizacion = generator.generate_operationalization_matrix(session)
+    with _admitted(page_cache.cached('matriz_operacionalizacion.html', session)):
+        return page_cache.respond('matriz_operacionalizacion.html', session, render)
+
+@bp.route('/proyectos')
+def projects():
+    """List the projects saved from this browser, newest first"""
+    owner = _owner()
+    page, cursor = [], None
+    if owner:
+        page, cursor = list_projects(owner=owner, before=request.args.get('antes', type=int),
+                                     limit=current_app.config['PROJECT_PAGE_SIZE'])
+    return render_template('projects.html', projects=page, cursor=cursor)
+
+@bp.route('/proyectos/<key>')
+def open_project(key):
+    """Reopen a saved project by restoring its inputs into the session"""
+    project = get_project(key)
+    if project is None:
+        flash('No encontramos ese proyecto. Verifica el enlace.', 'error')
+        return redirect(url_for('.projects'))
+    
+    session.clear()
+    session.update(project.inputs)
+    session['step'] = 'complete'
+    session['project_key'] = project.key
+    return redirect(url_for('.results'))
+
+@bp.route('/batch', methods=['POST'])
+def batch():
+    """Generate results for an upload of thesis specs, streamed back as NDJSON
+
+    The upload is JSONL, or a CSV/XLSX spreadsheet with one existing
+    consistency matrix per row (a header row names the columns). With
+    ``?cohorte=<name>`` and the cohort token, every result is also saved as a
+    project of that cohort.
+    """
+    workers = request.args.get('workers', current_app.config['BATCH_WORKERS'], type=int)
+    workers = max(1, min(workers, current_app.config['BATCH_MAX_WORKERS']))
+    cohort = request.args.get('cohorte', '').strip()[:64] or None
+    if cohort is not None:
+        denied = _cohort_denied()
+        if denied:
+            return denied
+    
+    held = ExitStack()
+    held.enter_context(admission.admit_batch(_client()))
+    try:
+        upload = request.files.get('specs')
+        if upload:
+            upload_type = upload_format(upload.filename, upload.mimetype)
+        else:
+            upload_type = upload_format(None, request.mimetype)
+        # Multipart uploads are closed when the request context ends, and a workbook
+        # is a zip archive read from its end, so both are copied to disk in chunks
+        spooled = bool(upload) or upload_type == 'xlsx'
+        if spooled:
+            stream = held.enter_context(tempfile.TemporaryFile())
+            shutil.copyfileobj(upload.stream if upload else request.stream, stream)
+            stream.seek(0)
+        else:
+            stream = request.stream
+        
+        if upload_type == 'xlsx':
+            items, parse = iter_xlsx_rows(stream), parse_row
+        elif upload_type == 'csv':
+            items, parse = iter_csv_rows(stream, current_app.config['BATCH_MAX_LINE_BYTES']), parse_row
+        else:
+            items, parse = iter_lines(stream, current_app.config['BATCH_MAX_LINE_BYTES']), parse_spec
+    except SpecError as exc:
+        held.close()
+        return jsonify({'error': str(exc)}), 400
+    except BaseException:
+        held.close()
+        raise
+    
+    def generate():
+        # Worker threads have no app context, so hand them the generator itself
+        records = run_batch(items, generator._get_current_object(), workers=workers, with_spec=cohort is not None,
+                            parse=parse)
+        if cohort is not None:
+            records = save_batch(records, cohort, chunk_size=current_app.config['PROJECT_BULK_SIZE'])
+        yield from to_ndjson(records)
     
-    return render_template('matriz_operacionalizacion.html', 
-                         matriz_operacionalizacion=matriz_operacionalizacion,
-                         session_data=session)
+    # The slot and the spooled upload are released when the response is closed, streamed or not
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.call_on_close(held.close)
+    return response
 
-@app.route('/reset')
+def _export_status(job):
+    """Public view of a cohort export job"""
+    finished = job['status'] in ('done', 'failed')
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'cohort': job['params']['cohort'],
+        'formats': job['params']['formats'],
+        'total': job['total'],
+        'done': job['done'],
+        'progress': round(job['done'] / job['total'], 3) if job['total'] else float(finished),
+        'error': job['error'],
+        'size': job['size'],
+        'url': url_for('.export_status', job_id=job['id']),
+        'download': url_for('.export_download', job_id=job['id']) if job['status'] == 'done' else None
+    }
+
+@bp.route('/exportaciones', methods=['POST'])
+def create_export():
+    """Queue a ZIP with the plans of every project in ``?cohorte=``, built in the background
+
+    ``?formatos=docx,pdf`` picks the document formats (docx by default).
+    Answers 202 with the job, whose URL reports its progress until the
+    archive can be downloaded.
+    """
+    denied = _cohort_denied()
+    if denied:
+        return denied
+    from exporters import EXPORT_FORMATS
+    cohort = request.values.get('cohorte', '').strip()[:64]
+    formats = list(dict.fromkeys(fmt.strip() for fmt in request.values.get('formatos', 'docx').split(',')
+                                 if fmt.strip()))
+    if not cohort:
+        return jsonify({'error': 'Indica la cohorte a exportar'}), 400
+    unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+    if unknown or not formats:
+        return jsonify({'error': f'Formato de descarga no disponible: {", ".join(unknown)}'}), 400
+    if not count_cohort(cohort):
+        return jsonify({'error': 'La cohorte no tiene proyectos'}), 404
+    
+    job = jobs.submit('cohort_export', {'cohort': cohort, 'formats': formats})
+    response = jsonify(_export_status(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('.export_status', job_id=job['id'])
+    return response
+
+@bp.route('/exportaciones/<job_id>')
+def export_status(job_id):
+    """Progress of a cohort export job, polled until its archive is ready"""
+    denied = _cohort_denied()
+    if denied:
+        return denied
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'No encontramos esa exportación'}), 404
+    response = jsonify(_export_status(job))
+    response.cache_control.no_store = True
+    return response
+
+@bp.route('/exportaciones/<job_id>/archivo')
+def export_download(job_id):
+    """The finished archive, with Range support so interrupted downloads resume"""
+    denied = _cohort_denied()
+    if denied:
+        return denied
+    job = jobs.get(job_id)
+    if job is None or job['status'] == 'failed':
+        return jsonify({'error': 'No encontramos esa exportación'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'La exportación todavía no termina'}), 409
+    return send_file(jobs.result_path(job_id), mimetype='application/zip', as_attachment=True,
+                     download_name=secure_filename(f'cohorte_{job["params"]["cohort"]}.zip'), conditional=True)
+
+@bp.errorhandler(Overloaded)
+def overloaded(exc):
+    """Busy page, reloaded by the browser once the request may be retried"""
+    response = make_response(render_template('generating.html', retry_after=exc.retry_after,
+                                             limitado=exc.reason == 'rate'), exc.status)
+    response.headers['Retry-After'] = str(exc.retry_after)
+    response.headers['Refresh'] = str(exc.retry_after)
+    response.cache_control.no_store = True
+    return response
+
+def _metrics_denied():
+    """401 response unless the request carries METRICS_TOKEN (when one is set)"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return None
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return None
+
+@bp.route('/cache_stats')
+def cache_stats():
+    """Expose generation cache hit/miss/eviction counters"""
+    denied = _metrics_denied()
+    if denied:
+        return denied
+    stats = generator.cache.stats()
+    pregenerator = current_app.extensions.get('pregenerator')
+    if pregenerator is not None:
+        stats['pregeneration'] = pregenerator.stats()
+    stats['admission'] = admission.stats()
+    return jsonify(stats)
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics aggregated across all workers"""
+    denied = _metrics_denied()
+    if denied:
+        return denied
+    return Response(render_prometheus(metrics.collect()), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/reset')
 def reset():
     """Reset the session and start over"""
-    session.clear()
-    return redirect(url_for('index'))
+    _clear_session()
+    return redirect(url_for('.index'))
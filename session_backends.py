@@ -0,0 +1,301 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+import msgspec
+from flask_session import Session
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+
+from client_state import ClientStateCodec, ClientStateSessionInterface, state_field
+
+SESSION_BACKENDS = ('filesystem', 'sqlite', 'redis')
+
+
+class CompactSerializer:
+    """MessagePack encoding of the wizard state, zlib-compressed when it pays off
+
+    The first byte tags the payload so small wizard states (a few hundred
+    bytes) skip compression while pasted matrices get it.
+    """
+
+    RAW = b'\x00'
+    ZLIB = b'\x01'
+
+    def __init__(self, compress_threshold=512, level=6):
+        self.compress_threshold = compress_threshold
+        self.level = level
+        self._encoder = msgspec.msgpack.Encoder()
+        self._decoder = msgspec.msgpack.Decoder()
+
+    def encode(self, session):
+        packed = self._encoder.encode(dict(session))
+        if len(packed) >= self.compress_threshold:
+            compressed = zlib.compress(packed, self.level)
+            if len(compressed) < len(packed):
+                return self.ZLIB + compressed
+        return self.RAW + packed
+
+    def decode(self, data):
+        tag, payload = data[:1], data[1:]
+        if tag == self.ZLIB:
+            payload = zlib.decompress(payload)
+        return self._decoder.decode(payload)
+
+
+class _CompactSessionInterface(ServerSideSessionInterface):
+    """Shared setup for the backends below: compact serializer and idle expiry"""
+
+    # Expiry is handled by each backend, so skip Flask-Session's cleanup hooks
+    ttl = True
+
+    def __init__(self, app, idle_timeout=None, **kwargs):
+        super().__init__(app, **kwargs)
+        self.serializer = CompactSerializer()
+        self.idle_timeout = idle_timeout
+
+    def _lifetime_seconds(self, session_lifetime):
+        seconds = int(session_lifetime.total_seconds())
+        if self.idle_timeout:
+            # Abandoned wizards expire after idle_timeout without a step
+            seconds = min(seconds, self.idle_timeout)
+        return max(seconds, 1)
+
+
+class SQLiteSessionInterface(_CompactSessionInterface):
+    """Session store in a single SQLite file in WAL mode, for single-node deployments
+
+    Expired rows are deleted in batches of ``cleanup_batch`` after every
+    ``cleanup_every`` writes, so one request never pays for a full sweep.
+    """
+
+    session_class = ServerSideSession
+
+    def __init__(self, app, path, cleanup_every=256, cleanup_batch=500, **kwargs):
+        self.path = path
+        self.cleanup_every = cleanup_every
+        self.cleanup_batch = cleanup_batch
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                         'id TEXT PRIMARY KEY, data BLOB NOT NULL, expiry INTEGER NOT NULL'
+                         ') WITHOUT ROWID')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expiry)')
+        finally:
+            conn.close()
+        super().__init__(app, **kwargs)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _retrieve_session_data(self, store_id):
+        row = self._conn.execute('SELECT data, expiry FROM sessions WHERE id = ?', (store_id,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return self.serializer.decode(row[0])
+
+    def _delete_session(self, store_id):
+        self._conn.execute('DELETE FROM sessions WHERE id = ?', (store_id,))
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        expiry = int(time.time()) + self._lifetime_seconds(session_lifetime)
+        self._conn.execute('INSERT INTO sessions (id, data, expiry) VALUES (?, ?, ?) '
+                           'ON CONFLICT(id) DO UPDATE SET data = excluded.data, expiry = excluded.expiry',
+                           (store_id, self.serializer.encode(session), expiry))
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % self.cleanup_every == 0
+        if due:
+            self._delete_expired_sessions()
+
+    def _delete_expired_sessions(self):
+        """Delete one batch of expired sessions and return how many were removed"""
+        cursor = self._conn.execute('DELETE FROM sessions WHERE id IN '
+                                    '(SELECT id FROM sessions WHERE expiry <= ? LIMIT ?)',
+                                    (int(time.time()), self.cleanup_batch))
+        return cursor.rowcount
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RespClient:
+    """Minimal Redis-protocol (RESP2) client with one connection per thread
+
+    Only the handful of commands the session store needs are used, so any
+    Redis-compatible server (Redis, Valkey, KeyDB or a local stand-in) works
+    without an extra dependency.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, timeout=5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url):
+        """Build a client from redis://[:password@]host[:port][/db]"""
+        from urllib.parse import urlparse
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip('/') or 0)
+        return cls(parsed.hostname or '127.0.0.1', parsed.port or 6379, db, parsed.password)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+            if self.password:
+                self._roundtrip(conn, [('AUTH', self.password)])
+            if self.db:
+                self._roundtrip(conn, [('SELECT', self.db)])
+        return conn
+
+    @staticmethod
+    def _encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b'+':
+            return rest.decode()
+        if prefix == b'-':
+            raise RespError(rest.decode())
+        if prefix == b':':
+            return int(rest)
+        if prefix == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if prefix == b'*':
+            count = int(rest)
+            return None if count < 0 else [self._read_reply(reader) for _ in range(count)]
+        raise RespError(f'Unexpected reply: {line!r}')
+
+    def _roundtrip(self, conn, commands):
+        sock, reader = conn
+        sock.sendall(b''.join(self._encode(command) for command in commands))
+        return [self._read_reply(reader) for _ in commands]
+
+    def pipeline(self, *commands):
+        """Send several commands in one round trip and return their replies"""
+        try:
+            return self._roundtrip(self._connection(), commands)
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+    def execute(self, *args):
+        return self.pipeline(args)[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn[1].close()
+            conn[0].close()
+
+
+class RespSessionInterface(_CompactSessionInterface):
+    """Session store on a Redis-protocol server; expiry is delegated to key TTLs"""
+
+    session_class = ServerSideSession
+
+    def __init__(self, app, client, **kwargs):
+        self.client = client
+        super().__init__(app, **kwargs)
+
+    def _retrieve_session_data(self, store_id):
+        data = self.client.execute('GET', store_id)
+        return self.serializer.decode(data) if data is not None else None
+
+    def _delete_session(self, store_id):
+        self.client.execute('DEL', store_id)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        self.client.execute('SET', store_id, self.serializer.encode(session),
+                            'EX', self._lifetime_seconds(session_lifetime))
+
+
+def init_session(app):
+    """Install the session backend selected by SESSION_BACKEND
+
+    With SESSION_CLIENT_STATE enabled the backend is wrapped so the wizard
+    state travels in a signed client token and the backend is only used for
+    states too large for it.
+    """
+    backend = app.config.get('SESSION_BACKEND', 'filesystem')
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f'Unknown SESSION_BACKEND: {backend}')
+
+    if backend == 'filesystem':
+        Session(app)
+        interface = app.session_interface
+    else:
+        common = {
+            'key_prefix': app.config.get('SESSION_KEY_PREFIX', 'session:'),
+            'permanent': app.config.get('SESSION_PERMANENT', True),
+            'idle_timeout': app.config.get('SESSION_IDLE_TIMEOUT'),
+        }
+        if backend == 'sqlite':
+            interface = SQLiteSessionInterface(app, app.config['SESSION_SQLITE_PATH'], **common)
+        else:
+            interface = RespSessionInterface(app, RespClient.from_url(app.config['SESSION_REDIS_URL']), **common)
+
+    if app.config.get('SESSION_CLIENT_STATE'):
+        codec = ClientStateCodec(app.secret_key, max_bytes=app.config.get('SESSION_CLIENT_STATE_MAX_BYTES', 3800),
+                                 max_age=app.config.get('SESSION_IDLE_TIMEOUT'))
+        interface = ClientStateSessionInterface(interface, codec)
+
+    exempt = tuple(app.config.get('SESSION_EXEMPT_PREFIXES', ()))
+    if exempt:
+        exempt_paths(interface, exempt)
+
+    app.session_interface = interface
+    app.jinja_env.globals['wizard_state_field'] = state_field
+    return interface
+
+
+def exempt_paths(interface, prefixes):
+    """Give requests under ``prefixes`` a null session, so the backend is never read or written"""
+    open_session = interface.open_session
+
+    def open_unless_exempt(app, request):
+        if request.path.startswith(prefixes):
+            return interface.make_null_session(app)
+        return open_session(app, request)
+
+    interface.open_session = open_unless_exempt
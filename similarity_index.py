@@ -0,0 +1,571 @@
+"""Near-duplicate search over the titles and problem statements of saved projects.
+
+Texts are reduced to accent-folded Spanish content words (stopwords dropped,
+plural and gender endings trimmed) plus adjacent word pairs, sketched with
+one-permutation MinHash (NUM_PERM bins, empty bins densified by rotation) and
+bucketed with LSH: BANDS bands of ROWS bins each, so a query only scores the
+entries that share a bucket with it. Candidates are ranked by the Jaccard
+similarity estimated from a one-byte-per-bin sketch, and the best few are
+rescored exactly from their stored text.
+
+A snapshot file holds the sorted bucket arrays, the sketches and the texts.
+Every worker mmaps the same file, like the knowledge index. Projects saved
+after the snapshot are read from the project store into a small in-memory
+delta, and once it holds ``compact_after`` entries one worker merges it into
+a new snapshot under a lock file; the others reopen it.
+
+    python similarity_index.py          # rebuild the snapshot from the project store
+"""
+import argparse
+import bisect
+import heapq
+import logging
+import mmap
+import operator
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+
+from topic_catalog import normalize_text
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms compact without a lock
+    fcntl = None
+
+MAGIC = b'TSI1'
+FORMAT_VERSION = 1
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Entries scanned per bucket at most; a bucket that full only holds copies of one text
+MAX_BUCKET = 256
+KINDS = ('titulo', 'problema')
+# Candidates per requested result rescored exactly; the sketch estimate is only within about 0.1
+RERANK = 8
+
+# magic, format version, high-water project id, entry count, reserved
+_HEADER = struct.Struct('<4sIqII')
+_KEY_SIZE = 16
+_ROW = struct.Struct(f'<{ROWS}Q')
+# Fibonacci hashing spreads the 32-bit shingle hashes over the bins
+_MIX = 0x9E3779B97F4A7C15
+_BIN_SHIFT = 64 - (NUM_PERM - 1).bit_length()
+# Offset per bin of distance added to borrowed values, above any 32-bit hash
+_ROTATION = 1 << 32
+# Chance that two unrelated one-byte sketch values agree
+_COLLISION = 1 / 256
+# How far below min_score an estimate may fall and still be rescored
+_ESTIMATE_SLACK = 0.2
+
+_WORD = re.compile(r'[a-z0-9]+')
+_STOPWORDS = frozenset((
+    'a', 'al', 'ante', 'bajo', 'como', 'con', 'contra', 'cual', 'cuales', 'cuando', 'de', 'del', 'desde', 'donde',
+    'durante', 'e', 'el', 'ella', 'ellos', 'en', 'entre', 'es', 'esta', 'estas', 'este', 'esto', 'estos', 'hacia',
+    'hasta', 'la', 'las', 'le', 'les', 'lo', 'los', 'mas', 'mediante', 'muy', 'ni', 'no', 'o', 'para', 'pero',
+    'por', 'que', 'se', 'segun', 'ser', 'si', 'sin', 'sobre', 'son', 'su', 'sus', 'tras', 'u', 'un', 'una', 'unas',
+    'uno', 'unos', 'y', 'ya',
+))
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarityError(ValueError):
+    """Raised when a snapshot file is invalid"""
+
+
+def tokens(text):
+    """Accent-folded content words of ``text`` with plural and gender endings trimmed"""
+    words = []
+    for word in _WORD.findall(normalize_text(text)):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 4:
+            if word[-1] == 's':
+                word = word[:-1]
+            if len(word) > 4 and word[-1] in 'aeo':
+                word = word[:-1]
+        words.append(word)
+    return words
+
+
+def shingles(text):
+    """Hashes of the content words of ``text`` and of each adjacent pair"""
+    words = tokens(text)
+    grams = words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+    return {zlib.crc32(gram.encode('utf-8')) for gram in grams}
+
+
+def jaccard(first, second):
+    """Exact Jaccard similarity of two shingle sets"""
+    return len(first & second) / len(first | second) if first or second else 0.0
+
+
+def signature(text):
+    """One-permutation MinHash signature of ``text`` (NUM_PERM values), or None when it has no content words"""
+    return minhash(shingles(text))
+
+
+def minhash(hashes):
+    """One-permutation MinHash signature of a shingle set, or None when it is empty
+
+    Each shingle hash falls in one bin and every bin keeps its smallest
+    hash. An empty bin borrows the value of the next non-empty bin to its
+    right, offset by the distance, so both sides of a comparison borrow alike.
+    """
+    if not hashes:
+        return None
+    bins = [None] * NUM_PERM
+    for value in hashes:
+        slot = ((value * _MIX) & 0xFFFFFFFFFFFFFFFF) >> _BIN_SHIFT
+        current = bins[slot]
+        if current is None or value < current:
+            bins[slot] = value
+    if None in bins:
+        borrowed = list(bins)
+        nearest = distance = 0
+        # Two passes right to left, so the bins at the end can borrow from the start
+        for position in range(2 * NUM_PERM - 1, -1, -1):
+            value = bins[position % NUM_PERM]
+            if value is not None:
+                nearest, distance = value, 0
+            else:
+                distance += 1
+                if position < NUM_PERM:
+                    borrowed[position] = nearest + distance * _ROTATION
+        bins = borrowed
+    return bins
+
+
+def band_hashes(sig):
+    """LSH bucket of ``sig`` in each band"""
+    return [zlib.crc32(_ROW.pack(*sig[start:start + ROWS])) for start in range(0, NUM_PERM, ROWS)]
+
+
+def sketch(sig):
+    """Low byte of every MinHash value"""
+    return bytes(value & 0xFF for value in sig)
+
+
+def estimate(first, second):
+    """Jaccard similarity estimated from two sketches"""
+    agree = sum(map(operator.eq, first, second)) / NUM_PERM
+    return max(0.0, (agree - _COLLISION) / (1 - _COLLISION))
+
+
+def _le(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _on_disk_high_water(path):
+    try:
+        with open(path, 'rb') as handle:
+            header = handle.read(_HEADER.size)
+    except OSError:
+        return None
+    return _HEADER.unpack(header)[2] if len(header) == _HEADER.size else None
+
+
+class SimilaritySnapshot:
+    """Read-only view over a snapshot file (or an empty index when ``path`` is None)"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.stamp = None
+        if path is None:
+            self.high_water, self.count = 0, 0
+            self._spans = array('Q', [0])
+            self._hashes = self._ids = [array('I')] * BANDS
+            self._sketches = self._keys = self._kinds = self._blob = b''
+            return
+
+        with open(path, 'rb') as handle:
+            stat = os.fstat(handle.fileno())
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if len(self._map) < _HEADER.size:
+            raise SimilarityError(f'{path}: truncated similarity index')
+        magic, version, self.high_water, self.count, _ = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SimilarityError(f'{path}: not a version {FORMAT_VERSION} similarity index')
+
+        view = memoryview(self._map)
+        count = self.count
+        offset = _HEADER.size
+
+        def section(length, typecode=None):
+            nonlocal offset
+            end = offset + length
+            if end > len(view):
+                raise SimilarityError(f'{path}: truncated similarity index')
+            part = view[offset:end]
+            offset = end
+            if typecode is None:
+                return part
+            part = part.cast(typecode)
+            if sys.byteorder != 'little':
+                swapped = array(typecode, part)
+                swapped.byteswap()
+                part = memoryview(swapped)
+            return part
+
+        self._spans = section((count + 1) * 8, 'Q')
+        self._hashes, self._ids = [], []
+        for _ in range(BANDS):
+            self._hashes.append(section(count * 4, 'I'))
+            self._ids.append(section(count * 4, 'I'))
+        self._sketches = section(count * NUM_PERM)
+        self._keys = section(count * _KEY_SIZE)
+        self._kinds = section(count)
+        self._blob = section(self._spans[count])
+
+    def __len__(self):
+        return self.count
+
+    def bucket(self, band, value):
+        hashes = self._hashes[band]
+        start = bisect.bisect_left(hashes, value)
+        end = bisect.bisect_right(hashes, value, start, min(len(hashes), start + MAX_BUCKET))
+        return self._ids[band][start:end]
+
+    def key(self, entry):
+        return bytes(self._keys[entry * _KEY_SIZE:(entry + 1) * _KEY_SIZE])
+
+    def kind(self, entry):
+        return self._kinds[entry]
+
+    def sketch(self, entry):
+        return self._sketches[entry * NUM_PERM:(entry + 1) * NUM_PERM]
+
+    def text(self, entry):
+        return str(self._blob[self._spans[entry]:self._spans[entry + 1]], 'utf-8')
+
+    def packed(self, band):
+        """(bucket << 32 | entry) for every entry of ``band``, in bucket order"""
+        return ((value << 32) | entry for value, entry in zip(self._hashes[band], self._ids[band]))
+
+
+class SnapshotBuilder:
+    """Entries added after a snapshot, written out merged with it"""
+
+    def __init__(self, base=0, high_water=0):
+        # Entry numbers continue those of the snapshot this builder extends
+        self.base = base
+        self.high_water = high_water
+        self._keys = bytearray()
+        self._kinds = bytearray()
+        self._sketches = bytearray()
+        self._blob = bytearray()
+        self._spans = array('Q', [0])
+        self._bands = [array('Q') for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def add(self, project_id, key, kind, text, sig=None):
+        """Add ``text`` of project ``key``; returns its entry number, or None when it has no content words
+
+        Projects must be added in increasing ``project_id`` order.
+        """
+        sig = sig if sig is not None else signature(text)
+        if sig is None:
+            return None
+        entry = self.base + len(self)
+        encoded = text.encode('utf-8')
+        self._blob += encoded
+        self._spans.append(self._spans[-1] + len(encoded))
+        self._sketches += sketch(sig)
+        self._keys += bytes.fromhex(key)
+        self._kinds.append(KINDS.index(kind))
+        # Bucketed last: searches running meanwhile only find complete entries
+        self._bucket(entry, band_hashes(sig))
+        self.high_water = max(self.high_water, project_id)
+        return entry
+
+    def _bucket(self, entry, buckets):
+        for band, value in enumerate(buckets):
+            self._bands[band].append((value << 32) | entry)
+
+    def write(self, path, snapshot=None):
+        """Write ``snapshot`` plus these entries to ``path`` atomically"""
+        snapshot = snapshot if snapshot is not None else SimilaritySnapshot()
+        count = len(snapshot) + len(self)
+        if count >= 1 << 32:
+            raise SimilarityError('similarity index is limited to 2**32 entries')
+        blob_start = snapshot._spans[len(snapshot)]
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(_HEADER.pack(MAGIC, FORMAT_VERSION, max(self.high_water, snapshot.high_water), count, 0))
+                handle.write(_le(array('Q', snapshot._spans)))
+                handle.write(_le(array('Q', (blob_start + offset for offset in self._spans[1:]))))
+                for band in range(BANDS):
+                    hashes, ids = array('I'), array('I')
+                    for packed in heapq.merge(snapshot.packed(band), sorted(self._bands[band])):
+                        hashes.append(packed >> 32)
+                        ids.append(packed & 0xFFFFFFFF)
+                    handle.write(_le(hashes))
+                    handle.write(_le(ids))
+                for old, new in ((snapshot._sketches, self._sketches), (snapshot._keys, self._keys),
+                                 (snapshot._kinds, self._kinds), (snapshot._blob, self._blob)):
+                    handle.write(old)
+                    handle.write(new)
+            # Readers holding the old file keep their mapping; new opens see the new one
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class _Delta(SnapshotBuilder):
+    """SnapshotBuilder that can also be searched, with its buckets in dicts"""
+
+    def __init__(self, base=0, high_water=0):
+        super().__init__(base, high_water)
+        self._buckets = [{} for _ in range(BANDS)]
+
+    def _bucket(self, entry, buckets):
+        super()._bucket(entry, buckets)
+        for band, value in enumerate(buckets):
+            self._buckets[band].setdefault(value, []).append(entry)
+
+    def bucket(self, band, value):
+        return self._buckets[band].get(value, ())[:MAX_BUCKET]
+
+    def key(self, entry):
+        entry -= self.base
+        return bytes(self._keys[entry * _KEY_SIZE:(entry + 1) * _KEY_SIZE])
+
+    def kind(self, entry):
+        return self._kinds[entry - self.base]
+
+    def sketch(self, entry):
+        entry -= self.base
+        return self._sketches[entry * NUM_PERM:(entry + 1) * NUM_PERM]
+
+    def text(self, entry):
+        entry -= self.base
+        return self._blob[self._spans[entry]:self._spans[entry + 1]].decode('utf-8')
+
+
+class SimilarityIndex:
+    """Always-current similarity index: the snapshot plus the projects saved after it
+
+    ``source(after_id, limit)`` returns up to ``limit`` projects with an id
+    above ``after_id``, oldest first, as ``(id, key, [(kind, text), ...])``.
+    Every ``refresh_interval`` seconds the next search starts a background
+    catch-up from it (searches keep using the current entries meanwhile).
+    """
+
+    def __init__(self, path, source=None, refresh_interval=30.0, compact_after=5000, batch_size=1000,
+                 clock=time.monotonic):
+        self.path = path
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.compact_after = compact_after
+        self.batch_size = batch_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next_refresh = 0.0
+        snapshot = SimilaritySnapshot()
+        if _stamp(path) is not None:
+            try:
+                snapshot = SimilaritySnapshot(path)
+            except (OSError, SimilarityError) as exc:
+                logger.error('Ignoring the similarity snapshot: %s', exc)
+        self._state = (snapshot, _Delta(len(snapshot), snapshot.high_water))
+
+    def __len__(self):
+        snapshot, delta = self._state
+        return len(snapshot) + len(delta)
+
+    @property
+    def high_water(self):
+        return self._state[1].high_water
+
+    def version(self):
+        """Highest project id indexed, which changes whenever search results can
+
+        Like a search, it starts the catch-up with the source when one is due,
+        so pages cached under this version still notice new projects.
+        """
+        return self._current()[1].high_water
+
+    def _current(self):
+        if (self.source is not None and self._clock() >= self._next_refresh
+                and self._lock.acquire(blocking=False)):
+            self._next_refresh = self._clock() + self.refresh_interval
+            threading.Thread(target=self._background_refresh, name='similarity-refresh', daemon=True).start()
+        return self._state
+
+    def refresh(self):
+        """Reopen a replaced snapshot and catch up with the source now, on the calling thread"""
+        with self._lock:
+            self._refresh_locked()
+
+    def _background_refresh(self):
+        try:
+            self._refresh_locked()
+        except Exception:
+            # The next interval tries again; searches keep the entries they have
+            logger.exception('Similarity index refresh failed')
+        finally:
+            self._lock.release()
+
+    def _refresh_locked(self):
+        self._next_refresh = self._clock() + self.refresh_interval
+        snapshot, delta = self._state
+        if _stamp(self.path) not in (None, snapshot.stamp):
+            self._reopen()
+        if self.source is None:
+            return
+        while True:
+            snapshot, delta = self._state
+            rows = self.source(delta.high_water, self.batch_size)
+            for project_id, key, texts in rows:
+                self.add(project_id, key, texts)
+            if len(delta) >= self.compact_after:
+                self._compact_locked()
+            if len(rows) < self.batch_size:
+                return
+
+    def add(self, project_id, key, texts):
+        """Index the ``(kind, text)`` pairs of a project; ids must only increase"""
+        delta = self._state[1]
+        for kind, text in texts:
+            if text:
+                delta.add(project_id, key, kind, text)
+        delta.high_water = max(delta.high_water, project_id)
+
+    def _reopen(self):
+        snapshot = SimilaritySnapshot(self.path)
+        delta = _Delta(len(snapshot), snapshot.high_water)
+        self._state = (snapshot, delta)
+        logger.info('Loaded similarity index %s (%d entries up to project %d)', self.path, len(snapshot),
+                    snapshot.high_water)
+
+    def compact(self):
+        """Merge the delta into a new snapshot now"""
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        snapshot, delta = self._state
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another worker may have written a newer snapshot while we waited for the lock
+            on_disk = _on_disk_high_water(self.path)
+            if on_disk is None or on_disk < delta.high_water or _stamp(self.path) == snapshot.stamp:
+                started = time.perf_counter()
+                delta.write(self.path, snapshot)
+                logger.info('Wrote %d similarity entries to %s in %.1fs', len(snapshot) + len(delta), self.path,
+                            time.perf_counter() - started)
+        # Rows past the snapshot are read from the source again by the caller
+        self._reopen()
+
+    def search(self, text, k=5, kind=None, exclude=None, min_score=0.0):
+        """The ``k`` projects with the text most similar to ``text`` (see search_many)"""
+        return self.search_many([(kind, text)], k=k, exclude=exclude, min_score=min_score)
+
+    def search_many(self, queries, k=5, exclude=None, min_score=0.0):
+        """The ``k`` most similar projects to any of the ``(kind, text)`` queries, best first
+
+        Each query is only compared with entries of its kind (any kind when
+        None). A project is listed once, with its best matching text; the
+        project ``exclude`` (a key) is skipped.
+        """
+        snapshot, delta = self._current()
+        excluded = bytes.fromhex(exclude) if exclude else None
+        best = {}
+        for kind, text in queries:
+            hashes = shingles(text) if text else None
+            sig = minhash(hashes)
+            if sig is None:
+                continue
+            wanted = KINDS.index(kind) if kind is not None else None
+            query = sketch(sig)
+            seen = set()
+            candidates = []
+            for band, value in enumerate(band_hashes(sig)):
+                for part in (snapshot, delta):
+                    for entry in part.bucket(band, value):
+                        if entry in seen:
+                            continue
+                        seen.add(entry)
+                        if wanted is not None and part.kind(entry) != wanted:
+                            continue
+                        key = part.key(entry)
+                        if key == excluded:
+                            continue
+                        score = estimate(query, part.sketch(entry))
+                        if score >= min_score - _ESTIMATE_SLACK:
+                            candidates.append((score, entry))
+            for _, entry in heapq.nlargest(RERANK * k, candidates):
+                part = snapshot if entry < len(snapshot) else delta
+                key = part.key(entry)
+                score = jaccard(hashes, shingles(part.text(entry)))
+                if score >= min_score and score > best.get(key, (-1.0,))[0]:
+                    best[key] = (score, entry)
+        matches = []
+        for key, (score, entry) in heapq.nlargest(k, best.items(), key=lambda item: item[1][0]):
+            part = snapshot if entry < len(snapshot) else delta
+            matches.append({
+                'proyecto': key.hex(),
+                'tipo': KINDS[part.kind(entry)],
+                'texto': part.text(entry),
+                'similitud': round(score, 2)
+            })
+        return matches
+
+
+def rebuild(path, source, batch_size=1000):
+    """Write a snapshot of every project in ``source``; returns the entry count"""
+    builder = SnapshotBuilder()
+    while True:
+        rows = source(builder.high_water, batch_size)
+        for project_id, key, texts in rows:
+            for kind, text in texts:
+                if text:
+                    builder.add(project_id, key, kind, text)
+            builder.high_water = max(builder.high_water, project_id)
+        if len(rows) < batch_size:
+            break
+    builder.write(path)
+    return len(builder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the similarity index from the project store')
+    parser.parse_args()
+    from app import create_app
+    from projects import similarity_source
+
+    app = create_app()
+    path = app.config['SIMILARITY_INDEX_PATH']
+    count = rebuild(path, similarity_source(app))
+    print(f'{count} entries -> {path} ({os.path.getsize(path)} bytes)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import functools
+import operator
+from dataclasses import dataclass, field, fields
+from enum import StrEnum
+
+from topic_catalog import normalize_text
+
+# Design keywords in the order the generator checks them ('cuasi-experimental' is experimental)
+DESIGN_KEYS = ('descriptivo', 'experimental', 'comparativo', 'correlacional', 'explicativo')
+
+# Designs the wizard offers (templates/step2.html), lowercased
+WIZARD_DESIGNS = frozenset(('descriptivo', 'descriptivo-propositivo', 'comparativo', 'correlacional', 'experimental',
+                            'cuasi-experimental', 'explicativo'))
+
+# Verbs stripped from the general objective to recover the topic of a pasted matrix
+_OBJECTIVE_VERBS = ('analizar', 'estudiar', 'evaluar', 'determinar', 'describir')
+_NO_TOPIC = 'la investigación planteada'
+
+# Approaches and designs come from a handful of select options, so their folding is memoized
+_fold_choice = functools.lru_cache(maxsize=256)(normalize_text)
+
+
+class Approach(StrEnum):
+    """Research approach (enfoque); OTRO when the text is none of the three"""
+
+    CUANTITATIVO = 'cuantitativo'
+    CUALITATIVO = 'cualitativo'
+    MIXTO = 'mixto'
+    OTRO = ''
+
+    @classmethod
+    def classify(cls, enfoque):
+        try:
+            return cls(_fold_choice(enfoque).strip())
+        except ValueError:
+            return cls.OTRO
+
+
+@functools.lru_cache(maxsize=256)
+def _design_key(diseno_folded):
+    return next((key for key in DESIGN_KEYS if key in diseno_folded), '')
+
+
+def _text(value):
+    return value if isinstance(value, str) else '' if value is None else str(value)
+
+
+def _named_variables(lines):
+    """(independent, dependent) names from lines like 'Variable independiente: Clima laboral'"""
+    named = {}
+    for line in lines:
+        label, _, nombre = line.partition(':')
+        label = label.lower()
+        for role in ('independiente', 'dependiente'):
+            if role in label and nombre.strip() and role not in named:
+                named[role] = nombre.strip()
+                break
+    return named.get('independiente', ''), named.get('dependiente', '')
+
+
+@dataclass(frozen=True, slots=True)
+class ThesisSpec:
+    """Normalized generator input, built once per request from the wizard or a pasted matrix
+
+    Raw fields keep the student's text for display; the lowercased,
+    accent-folded and classified fields are derived once here instead of in
+    every generator method. Instances are hashable, so a spec (or a subset
+    of its fields) works as a cache key.
+    """
+
+    # Wizard fields as typed ('tema' is the delimited topic, else the general one)
+    tema: str = ''
+    enfoque: str = ''
+    diseno: str = ''
+    problema: str = ''
+    lugar: str = ''
+    periodo: str = ''
+    publico: str = ''
+    # Pasted consistency matrix ('existing' is True when the spec was built from one)
+    existing: bool = False
+    problema_general: str = ''
+    objetivo_general: str = ''
+    hipotesis: str = ''
+    variables: tuple[str, ...] = ()
+    poblacion: str = ''
+    muestra: str = ''
+    tecnicas: str = ''
+    instrumentos: str = ''
+    # Derived
+    tema_lower: str = field(init=False, default='')
+    tema_folded: str = field(init=False, default='')
+    enfoque_lower: str = field(init=False, default='')
+    approach: Approach = field(init=False, default=Approach.OTRO)
+    diseno_lower: str = field(init=False, default='')
+    diseno_folded: str = field(init=False, default='')
+    design: str = field(init=False, default='')
+    vi: str = field(init=False, default='')
+    vd: str = field(init=False, default='')
+    _hash: int | None = field(init=False, default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        setattr = object.__setattr__
+        diseno_folded = _fold_choice(self.diseno)
+        setattr(self, 'tema_lower', self.tema.lower())
+        setattr(self, 'tema_folded', normalize_text(self.tema))
+        setattr(self, 'enfoque_lower', self.enfoque.lower())
+        setattr(self, 'approach', Approach.classify(self.enfoque))
+        setattr(self, 'diseno_lower', self.diseno.lower())
+        setattr(self, 'diseno_folded', diseno_folded)
+        setattr(self, 'design', _design_key(diseno_folded))
+        if self.variables:
+            vi, vd = _named_variables(self.variables)
+            setattr(self, 'vi', vi)
+            setattr(self, 'vd', vd)
+
+    def __hash__(self):
+        # Computed on first use: most specs are only read, never used as a key
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(_input_values(self)))
+        return self._hash
+
+    @classmethod
+    def from_session(cls, data):
+        """Spec for the wizard fields of session-shaped ``data``"""
+        tema = data.get('tema_delimitado') or data.get('tema_general')
+        return cls(tema=_text(tema), enfoque=_text(data.get('enfoque')), diseno=_text(data.get('diseno')),
+                   problema=_text(data.get('problema_mod')), lugar=_text(data.get('lugar')),
+                   periodo=_text(data.get('periodo')), publico=_text(data.get('publico')))
+
+    @classmethod
+    def from_matrix(cls, matriz):
+        """Spec for a pasted consistency matrix (the ``matriz_existente`` fields)"""
+        objetivo = _text(matriz.get('objetivo_general'))
+        objetivo_lower = objetivo.lower()
+        # The topic is the objective without its leading verb
+        verb = next((verb for verb in _OBJECTIVE_VERBS if verb in objetivo_lower), None)
+        tema = objetivo_lower.replace(verb, '').strip() if verb else _NO_TOPIC
+        # Indentation is kept: matrix_parser reads dimensions and indicators from it
+        variables = tuple(line.rstrip() for line in _text(matriz.get('variables')).split('\n') if line.strip())
+        return cls(tema=tema, enfoque=_text(matriz.get('metodologia_enfoque')),
+                   diseno=_text(matriz.get('metodologia_tipo')), existing=True,
+                   problema_general=_text(matriz.get('problema_general')), objetivo_general=objetivo,
+                   hipotesis=_text(matriz.get('hipotesis_general') or matriz.get('hipotesis')), variables=variables,
+                   poblacion=_text(matriz.get('metodologia_poblacion')),
+                   muestra=_text(matriz.get('metodologia_muestra')),
+                   tecnicas=_text(matriz.get('metodologia_tecnicas')),
+                   instrumentos=_text(matriz.get('metodologia_instrumentos')))
+
+    @classmethod
+    def from_data(cls, data):
+        """Spec for session-shaped ``data``: the pasted matrix when there is one, else the wizard fields"""
+        existing = data.get('matriz_existente')
+        return cls.from_matrix(existing) if existing else cls.from_session(data)
+
+
+# Fields given by the caller; the derived ones follow from them
+_input_values = operator.attrgetter(*(item.name for item in fields(ThesisSpec) if item.init))
+
+
+def as_spec(data, from_matrix=False):
+    """Return ``data`` if it already is a ThesisSpec, else build one from the dict"""
+    if isinstance(data, ThesisSpec):
+        return data
+    return ThesisSpec.from_matrix(data) if from_matrix else ThesisSpec.from_session(data)
@@ -0,0 +1,224 @@
+import functools
+import heapq
+import itertools
+import re
+import string
+
+from topic_catalog import normalize_text
+
+# Words ignored when deciding whether two titles say the same thing
+_STOPWORDS = frozenset((
+    'a', 'al', 'con', 'contexto', 'de', 'del', 'durante', 'el', 'en', 'entre', 'la', 'las', 'lo', 'los',
+    'periodo', 'por', 'sobre', 'torno', 'un', 'una', 'y'
+))
+_WORD = re.compile(r'\w+')
+# Context fields a template may leave out; those in _REQUIRED_FIELDS rule the template out when missing
+_OPTIONAL_FIELDS = ('lugar', 'periodo', 'publico', 'vi', 'vd')
+_REQUIRED_FIELDS = frozenset(('publico', 'vi', 'vd'))
+# Capitalized first letter of the text or of a '/' alternative ('Rendimiento/Productividad')
+_LEADING_CAPITAL = re.compile(r'(^|/)([^\W\d_])(?=[^\W\d_]*[a-záéíóúñü])')
+
+
+def lower_first(text):
+    """Lowercase the leading capital for use mid-sentence, leaving acronyms (e.g. 'TIC') alone"""
+    return _LEADING_CAPITAL.sub(lambda match: match.group(1) + match.group(2).lower(), text)
+
+
+@functools.lru_cache(maxsize=4096)
+def title_signature(title):
+    """Content words of ``title``; titles sharing a signature are near-identical"""
+    return frozenset(word for word in _WORD.findall(normalize_text(title)) if word not in _STOPWORDS)
+
+
+class _Template:
+    __slots__ = ('render', 'fields', 'words', 'weight', 'designs')
+
+    def __init__(self, spec):
+        parsed = list(string.Formatter().parse(spec['patron']))
+        self.render = spec['patron'].format
+        self.fields = frozenset(name for _, name, _, _ in parsed if name)
+        # Signature of the literal text, so a title's signature is the union of its parts'
+        self.words = title_signature(' '.join(literal for literal, _, _, _ in parsed))
+        self.weight = spec['peso']
+        self.designs = frozenset(spec.get('disenos') or ())
+
+
+class TitleEngine:
+    """Ranks titles over the cross product of templates, actions, connectors and phrasings
+
+    The candidate space can run to tens of thousands of titles, but only the
+    best ``k`` are ever kept: candidates are visited in decreasing order of
+    an upper bound on their score and the search stops once nothing left can
+    beat the current k-th title.
+    """
+
+    def __init__(self, general):
+        titles = general['titulos']
+        self.templates = tuple(_Template(spec) for spec in titles['plantillas'])
+        self.connectors = tuple((item['texto'], item['peso']) for item in titles['conectores'])
+        self.place_phrases = tuple((item['texto'], item['peso']) for item in titles['lugar'])
+        self.period_phrases = tuple((item['texto'], item['peso']) for item in titles['periodo'])
+        self.approach_phrases = {key: tuple((item['texto'], item['peso']) for item in items)
+                                 for key, items in titles['enfoque'].items()}
+        self.design_weight = titles['peso_diseno']
+        self.order_weight = titles['peso_orden_accion']
+        self.ideal_words = titles['palabras_ideales']
+        self.word_penalty = titles['penalizacion_palabra']
+        self.max_length = titles['longitud_maxima']
+        self.default_design = general['accion_por_defecto']
+        # (verb, design key, position within its design) for every distinct verb
+        self.actions = []
+        seen = set()
+        for key, verbs in general['accion_palabras'].items():
+            for position, verb in enumerate(verbs):
+                if verb not in seen:
+                    seen.add(verb)
+                    self.actions.append((verb, key, position))
+        self.design_keys = tuple(general['accion_palabras'])
+        self._plans = {}
+
+    def design_key(self, diseno):
+        return next((key for key in self.design_keys if key in diseno.lower()), self.default_design)
+
+    def _shape(self, context):
+        """What the candidate order depends on: design, which optional fields are set, and the approach"""
+        enfoque = (context.get('enfoque') or '').lower()
+        return (self.design_key(context.get('diseno') or ''),
+                frozenset(field for field in _OPTIONAL_FIELDS if context.get(field)),
+                enfoque if enfoque in self.approach_phrases else '')
+
+    def _plan(self, shape):
+        """Return [(base score, bound, template, action, connector)] by decreasing bound, memoized per shape"""
+        plan = self._plans.get(shape)
+        if plan is not None:
+            return plan
+        design, present, enfoque = shape
+        plan = []
+        for template in self.templates:
+            if not template.fields & _REQUIRED_FIELDS <= present:
+                continue
+            if template.designs and design not in template.designs:
+                continue
+            slots = self._slots(template, present, enfoque)
+            best_fill = sum(max(weight for _, weight in phrases) for _, phrases in slots)
+            connectors = self.connectors if 'conector' in template.fields else (('', 0.0),)
+            for verb, key, position in self.actions:
+                if template.designs and key not in template.designs:
+                    # Variable templates only read well with their own design's verbs
+                    continue
+                action_score = (self.design_weight if key == design else 0.0) - self.order_weight * position
+                for connector, connector_weight in connectors:
+                    base = template.weight + action_score + connector_weight
+                    plan.append((base, base + best_fill, template, verb, connector))
+        plan.sort(key=lambda head: -head[1])
+        self._plans[shape] = plan
+        return plan
+
+    def _slots(self, template, present, enfoque):
+        """(field, phrasings) for each optional phrase slot ``template`` fills"""
+        slots = []
+        for field, phrases in (('lugar', self.place_phrases), ('periodo', self.period_phrases)):
+            if field in template.fields and field in present:
+                slots.append((field, phrases))
+        if 'enfoque' in template.fields and enfoque:
+            slots.append(('enfoque', self.approach_phrases[enfoque]))
+        return slots
+
+    def _fills(self, template, context, shape):
+        """Return (weight, lugar, periodo, enfoque) phrase combinations, best first"""
+        options = {'lugar': (('', 0.0),), 'periodo': (('', 0.0),), 'enfoque': (('', 0.0),)}
+        for field, phrases in self._slots(template, shape[1], shape[2]):
+            options[field] = tuple((text.format(**{field: context[field]}) if field != 'enfoque' else text, weight)
+                                   for text, weight in phrases)
+        combos = [(lugar[1] + periodo[1] + enfoque[1], lugar[0], periodo[0], enfoque[0])
+                  for lugar, periodo, enfoque in itertools.product(options['lugar'], options['periodo'],
+                                                                   options['enfoque'])]
+        combos.sort(key=lambda combo: -combo[0])
+        return combos
+
+    def space(self, context):
+        """Total number of candidate titles for ``context`` (without generating them)"""
+        shape = self._shape(context)
+        return sum(len(self._fills(head[2], context, shape)) for head in self._plan(shape))
+
+    def top(self, k, context, stats=None):
+        """Return the ``k`` best distinct titles as [(score, title)], best first
+
+        ``context`` holds tema, diseno, enfoque and optionally lugar, periodo,
+        publico, vi and vd. Pass a dict as ``stats`` to get the number of
+        candidates actually rendered.
+        """
+        if k <= 0:
+            return []
+        fields = {
+            'tema': lower_first(context.get('tema') or ''),
+            'vi': lower_first(context.get('vi') or ''),
+            'vd': lower_first(context.get('vd') or ''),
+            'publico': lower_first(context.get('publico') or ''),
+        }
+        field_words = {name: title_signature(value) for name, value in fields.items()}
+        shape = self._shape(context)
+        fills_by_template = {}
+        # Min-heap of (score, -sequence, title, signature); a kept title that is beaten by a
+        # near-identical one stays in the heap as a stale entry and is skipped when it surfaces
+        heap = []
+        kept = {}  # signature -> live heap entry
+        # signature -> (length, -score, title) of the shortest title over max_length, used when
+        # a long topic leaves fewer than k titles within it
+        too_long = {}
+        rendered = 0
+        sequence = itertools.count()
+
+        def floor():
+            """Score of the current k-th best title"""
+            while kept.get(heap[0][3]) is not heap[0]:
+                heapq.heappop(heap)
+            return heap[0][0]
+
+        for base, bound, template, verb, connector in self._plan(shape):
+            if len(kept) >= k and bound <= floor():
+                break
+            fills = fills_by_template.get(template)
+            if fills is None:
+                fills = fills_by_template[template] = self._fills(template, context, shape)
+            template_words = template.words.union(*(field_words[name] for name in template.fields
+                                                    if name in field_words))
+            verb_words = template_words | title_signature(verb) | title_signature(connector)
+            for fill_weight, lugar, periodo, enfoque in fills:
+                if len(kept) >= k and base + fill_weight <= floor():
+                    break
+                title = template.render(accion=verb, conector=connector, lugar=lugar, periodo=periodo,
+                                        enfoque=enfoque, **fields)
+                rendered += 1
+                if len(title) > self.max_length and len(kept) >= k:
+                    continue
+                words = title.count(' ') + 1
+                score = base + fill_weight - max(0, words - self.ideal_words) * self.word_penalty
+                signature = verb_words.union(title_signature(lugar), title_signature(periodo),
+                                             title_signature(enfoque))
+                if len(title) > self.max_length:
+                    candidate = (len(title), -score, title)
+                    if signature not in too_long or candidate < too_long[signature]:
+                        too_long[signature] = candidate
+                    continue
+                current = kept.get(signature)
+                if current is not None:
+                    # Near-identical title already kept: keep whichever scores higher
+                    if score <= current[0]:
+                        continue
+                elif len(kept) >= k:
+                    if score <= floor():
+                        continue
+                    del kept[heapq.heappop(heap)[3]]
+                entry = (score, -next(sequence), title, signature)
+                kept[signature] = entry
+                heapq.heappush(heap, entry)
+
+        if stats is not None:
+            stats['rendered'] = rendered
+        titles = [(score, title) for score, _, title, _ in sorted(kept.values(), reverse=True)]
+        if len(titles) < k:
+            # Shortest over-length titles, so a long topic still gets k titles
+            spare = (entry for signature, entry in too_long.items() if signature not in kept)
+            titles.extend((-score, title) for _, score, title in heapq.nsmallest(k - len(titles), spare))
+        return titles
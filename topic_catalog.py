@@ -0,0 +1,104 @@
+import unicodedata
+from collections import deque
+from types import MappingProxyType
+
+
+# Spanish accented letters, folded without a full Unicode decomposition
+_SPANISH_ACCENTS = (('á', 'a'), ('é', 'e'), ('í', 'i'), ('ó', 'o'), ('ú', 'u'), ('ü', 'u'), ('ñ', 'n'))
+
+
+def normalize_text(text):
+    """Lowercase text and strip accents so 'Educación' matches 'educacion'"""
+    if not text:
+        return ''
+    folded = text.casefold()
+    for accented, plain in _SPANISH_ACCENTS:
+        if accented in folded:
+            folded = folded.replace(accented, plain)
+    if folded.isascii():
+        return folded
+    decomposed = unicodedata.normalize('NFKD', folded)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples
+
+    Tuples whose items are already frozen come back as they are, so tuples
+    shared between results stay shared.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        items = tuple(freeze(item) for item in value)
+        if isinstance(value, tuple) and all(new is old for new, old in zip(items, value)):
+            return value
+        return items
+    return value
+
+
+class TopicMatcher:
+    """Aho-Corasick automaton that scores every catalog domain in one pass over the topic"""
+
+    def __init__(self, domains):
+        # domains: iterable of (domain_key, keywords)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        self._order = {}
+
+        for position, (domain, keywords) in enumerate(domains):
+            self._order.setdefault(domain, position)
+            for keyword in keywords:
+                self._add(normalize_text(keyword), domain)
+
+        self._build_failure_links()
+
+    def _add(self, keyword, domain):
+        if not keyword:
+            return
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = self._output[state] + ((domain, len(keyword)),)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # Inherit matches that end at the failure state
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def scores(self, text):
+        """Return {domain: score}, where each keyword hit adds its length"""
+        goto, fail, output = self._goto, self._fail, self._output
+        totals = {}
+        state = 0
+        for ch in normalize_text(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for domain, weight in output[state]:
+                totals[domain] = totals.get(domain, 0) + weight
+        return totals
+
+    def best(self, text):
+        """Return the highest scoring domain, breaking ties by catalog order"""
+        totals = self.scores(text)
+        if not totals:
+            return None
+        return max(totals, key=lambda domain: (totals[domain], -self._order[domain]))